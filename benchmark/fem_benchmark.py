@@ -0,0 +1,325 @@
+#有限要素法プログラムの規模に対する計算時間・メモリ使用量を計測する(ベンチマーク)
+#4つのプログラムを、節点数を等比的に増やしながら、節点配置(lattice,random)と全体行列の形式ごとに実行する
+#処理段階ごとの時間とメモリから規模に対する指数p(時間∝節点数^p)を求め、保存した基準値と比べて悪化した所を表示する
+#各プログラムを新しいPythonプロセスで読み込む時間と、その時点で読み込まれた重いモジュール(SciPy,Matplotlib)も記録する
+#2次元Poisson方程式のランダム配置では、節点の並べ替え(rcm,hilbert)による帯幅・フィルイン・時間の違いも比べる
+#グラフは表示しないので、画面が無い環境でも実行できる
+import os  #ファイルパスの処理
+import sys  #モジュールの検索パス、終了コード
+import json  #計測結果の読み書き
+import time  #時刻を扱うライブラリ
+import importlib  #各プログラムの読み込み
+import subprocess  #読み込み時間を測る新しいPythonプロセス
+import numpy as np  #数値計算用
+os.environ['MPLBACKEND'] = 'Agg'  #グラフを画面に表示しないバックエンド(Matplotlibを読み込む前に設定する)
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+solver_names = ['fem1d_poisson', 'fem1d_helmholtz', 'fem2d_poisson', 'fem2d_helmholtz']
+for solver_name in solver_names:
+    sys.path.insert(0, os.path.join(repo_dir, solver_name))
+
+#計測する処理段階(各プログラムで共通)
+stage_names = ['generate_nodes', 'make_mesh_data', 'assemble_element_matrix', 'assemble_global_matrix',
+               'make_boundary_info', 'set_boundary_condition', 'solve_simultaneous_equations']
+
+#計測条件(importして使う場合も、run_benchmarkの前に書き換えれば変えられる)
+#プログラムと全体行列の形式ごとの、節点数の範囲(最小、最大)。basicは密行列なので小さめにする
+benchmark_ladders = {
+    'fem1d_poisson':{'basic':(100, 1600), 'banded':(1000, 256000)},
+    'fem1d_helmholtz':{'basic':(50, 800), 'banded':(500, 32000)},
+    'fem2d_poisson':{'basic':(64, 1024), 'sparse':(256, 16384)},
+    'fem2d_helmholtz':{'basic':(64, 1024), 'sparse':(256, 16384)},
+}
+node_arranges = ['lattice', 'random']  #節点の生成方法
+step_num = 5  #節点数の等比数列の段数
+repeat_num = 3  #各条件の実行回数(時間は最小値を使う)
+import_repeat_num = 5  #読み込み時間の計測回数(時間は最小値を使う)
+heavy_modules = ('scipy', 'matplotlib', 'mpl_toolkits')  #計算だけの場合は読み込まないモジュール
+reorder_types = [None, 'rcm', 'hilbert']  #比べる節点の並べ替えの方法(Noneは並べ替えなし)
+reorder_node_type = ['random', 16384]  #並べ替えの効果を比べるメッシュ
+
+time_min = 2.0e-3  #これより短い時間[sec]は、比較と指数の計算から除く
+memory_min = 2**16  #これより少ないメモリ[byte]は、比較と指数の計算から除く
+regression_ratio = 2.0  #基準値のこの倍率を超えたら悪化とみなす(共用の計算機では1.5倍程度の揺らぎがある)
+exponent_margin = 0.5  #指数が基準値からこれ以上増えたら悪化とみなす
+
+
+#1次元Poisson方程式を1回解く
+def run_fem1d_poisson(fem, node_type, matrix_type):
+    problem = fem.Poisson1D(-1.0, 1.0, func_f=1.0, BC_left=['Dirichlet', 0.0], BC_right=['Neumann', 1.0],
+                            matrix_type=matrix_type)
+    problem.solve(node_type)
+
+
+#1次元Helmholtz方程式の固有値を、小さい方から10個求める
+def run_fem1d_helmholtz(fem, node_type, matrix_type):
+    problem = fem.Helmholtz1D(-1.0, 1.0, cons_q=1.0, BC_left=['Dirichlet', 0.0], BC_right=['Dirichlet', 0.0],
+                              matrix_type=matrix_type, eigen_type=['index', 0, 9])
+    problem.solve(node_type)
+
+
+#2次元Poisson方程式を1回解く(直接法)。reorder_typeを指定した場合は節点を並べ替えてから解く
+def run_fem2d_poisson(fem, node_type, matrix_type, reorder_type=None):
+    problem = fem.Poisson2D(-1.0, 1.0, -1.0, 1.0, func_f=1.0,
+                            BC_left=['Dirichlet', 0.0], BC_right=['Neumann', 1.0], BC_bottom=['Neumann', 0.0], BC_top=['Neumann', 0.0],
+                            matrix_type=matrix_type, solver_type=['direct'], reorder_type=reorder_type)
+    fem.factor_cache.clear()  #前回の計測のLU分解を使い回さない
+    problem.solve(node_type)
+    return problem
+
+
+#2次元Helmholtz方程式の固有値を、小さい方から10個求める
+def run_fem2d_helmholtz(fem, node_type, matrix_type):
+    problem = fem.Helmholtz2D(-1.0, 1.0, -1.0, 1.0, cons_p=1.0, cons_q=1.0, omega=1.0,
+                              BC_left=['Dirichlet', 0.0], BC_right=['Dirichlet', 0.0], BC_bottom=['Dirichlet', 0.0], BC_top=['Dirichlet', 0.0],
+                              matrix_type=matrix_type, eigen_type=['lowest', 10])
+    problem.solve(node_type)
+
+
+run_functions = {'fem1d_poisson':run_fem1d_poisson, 'fem1d_helmholtz':run_fem1d_helmholtz,
+                 'fem2d_poisson':run_fem2d_poisson, 'fem2d_helmholtz':run_fem2d_helmholtz}
+
+
+#節点数の等比数列を、node_typeの数字に変換する。2次元の格子点配置はx・y方向の節点数を指定する
+def make_node_types(solver_name, node_arrange, nod_range, step_num):
+    nod_ladder = np.unique(np.round(np.geomspace(nod_range[0], nod_range[1], step_num)).astype(np.int64))
+    if(solver_name.startswith('fem2d') and node_arrange=='lattice'):
+        return [[node_arrange, int(round(np.sqrt(nod_num)))] for nod_num in nod_ladder]
+    return [[node_arrange, int(nod_num)] for nod_num in nod_ladder]
+
+
+#1つの条件を計測する。repeat_num回実行し、処理段階ごとに最も短い時間と、メモリのピークを残す
+def measure_case(fem, solver_name, node_type, matrix_type, repeat_num):
+    case_result = None
+    for repeat in range(repeat_num):
+        np.random.seed(0)  #ランダム配置でも毎回同じメッシュにする
+        fem.reset_telemetry()
+        run_functions[solver_name](fem, node_type, matrix_type)
+
+        stages = fem.telemetry['stages']
+        if(case_result is None):
+            case_result = {'nod_total':fem.telemetry['statistics']['nod_total'],
+                           'statistics':dict(fem.telemetry['statistics']),
+                           'stages':{stage_name:dict(stages[stage_name]) for stage_name in stage_names}}
+        else:
+            for stage_name in stage_names:
+                stage = case_result['stages'][stage_name]
+                stage['wall_time'] = min(stage['wall_time'], stages[stage_name]['wall_time'])
+                stage['cpu_time'] = min(stage['cpu_time'], stages[stage_name]['cpu_time'])
+                stage['peak_memory'] = max(stage['peak_memory'], stages[stage_name]['peak_memory'])
+
+    case_result['stages']['total'] = {key:sum(case_result['stages'][stage_name][key] for stage_name in stage_names)
+                                      for key in ('wall_time', 'cpu_time')}
+    case_result['stages']['total']['peak_memory'] = max(case_result['stages'][stage_name]['peak_memory']
+                                                        for stage_name in stage_names)
+    return case_result
+
+
+#プログラムの読み込み時間を、新しいPythonプロセスで測る(このプロセスで読み込み済みのモジュールの影響を受けない)
+#読み込み直後にsys.modulesにある重いモジュールも記録する。計算だけの場合は読み込まれていないはず
+def measure_import_time(solver_name, repeat_num):
+    code = ('import sys, time\n'
+            'start_time = time.perf_counter()\n'
+            'import {}\n'
+            'import_time = time.perf_counter() -start_time\n'
+            'print(import_time, *sorted(name for name in {} if name in sys.modules))').format(solver_name, heavy_modules)
+    import_time = np.inf
+    for repeat in range(repeat_num):
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.join(repo_dir, solver_name),
+                                capture_output=True, text=True, check=True).stdout.split()
+        import_time = min(import_time, float(output[0]))
+    return {'import_time':import_time, 'heavy_modules':output[1:]}
+
+
+#節点の並べ替えの効果を比べる。2次元Poisson方程式(sparse、直接法)を並べ替えの方法ごとに解き、
+#全体行列の帯幅・プロファイル、LU分解のフィルイン、組み立てと求解の時間(repeat_num回の最小値)を記録する
+def measure_reordering(node_type, repeat_num):
+    fem = importlib.import_module('fem2d_poisson')
+    fem.log_level = fem.LOG_SILENT
+    fem.telemetry_enabled = True
+    reorder_results = {}
+    for reorder_type in reorder_types:
+        reorder_result = {'assemble_time':np.inf, 'solve_time':np.inf}
+        for repeat in range(repeat_num):
+            np.random.seed(0)  #並べ替えの方法が違っても同じメッシュにする
+            fem.reset_telemetry()
+            problem = run_fem2d_poisson(fem, node_type, 'sparse', reorder_type)
+            stages = fem.telemetry['stages']
+            reorder_result['assemble_time'] = min(reorder_result['assemble_time'], stages['assemble_element_matrix']['wall_time']
+                                                  +stages['assemble_global_matrix']['wall_time'])
+            reorder_result['solve_time'] = min(reorder_result['solve_time'], stages['solve_simultaneous_equations']['wall_time'])
+        reorder_result['bandwidth'], reorder_result['profile'] = fem.measure_bandwidth(problem.mesh.nod_num_tri, len(problem.mesh.nod_pos_glo))
+        reorder_result['fill_in'] = fem.telemetry['statistics']['fill_in']
+        reorder_results[str(reorder_type)] = reorder_result
+        print('{:<36} reorder = {:<8} bandwidth = {:>7}  profile = {:>10}  fill-in = {:0.2f}  assemble = {:0.5f}[sec]  solve = {:0.5f}[sec]'.format(
+              'fem2d_poisson/sparse/'+node_type[0], str(reorder_type), reorder_result['bandwidth'], reorder_result['profile'],
+              reorder_result['fill_in'], reorder_result['assemble_time'], reorder_result['solve_time']))
+    return reorder_results
+
+
+#規模に対する指数を、両対数グラフでの最小二乗法の傾きとして求める
+#値が小さすぎる点(時間の分解能以下、メモリの確保なし)は除き、2点以上残らなければNoneにする
+def fit_exponent(nod_totals, values, value_min):
+    nod_totals, values = np.asarray(nod_totals, np.float64), np.asarray(values, np.float64)
+    valid = (value_min < values)
+    if(np.count_nonzero(valid) < 2):
+        return None
+    return float(np.polyfit(np.log(nod_totals[valid]), np.log(values[valid]), 1)[0])
+
+
+#計測した全ての条件について、処理段階ごとの指数を求める
+def fit_scaling(results):
+    scaling = {}
+    for case_key, case_results in results.items():
+        nod_totals = [case_result['nod_total'] for case_result in case_results]
+        scaling[case_key] = {}
+        for stage_name in stage_names +['total']:
+            wall_times = [case_result['stages'][stage_name]['wall_time'] for case_result in case_results]
+            peak_memories = [case_result['stages'][stage_name]['peak_memory'] for case_result in case_results]
+            scaling[case_key][stage_name] = {'time_exponent':fit_exponent(nod_totals, wall_times, time_min),
+                                             'memory_exponent':fit_exponent(nod_totals, peak_memories, memory_min)}
+    return scaling
+
+
+#計算機の速さの目安として、決まった計算(Pythonのループと行列積)の時間を測る
+#基準値と比較する時は、この時間の比で補正して、計算機の負荷やクロックの違いを打ち消す
+def measure_calibration(repeat_num=5):
+    mat = np.random.default_rng(0).random((200,200))
+    calibration_time = np.inf
+    for repeat in range(repeat_num):
+        start_time = time.perf_counter()
+        value = 0.0
+        for i in range(100000):
+            value += i*0.5
+        for i in range(10):
+            mat.dot(mat)
+        calibration_time = min(calibration_time, time.perf_counter() -start_time)
+    return calibration_time
+
+
+#基準値と比べて、時間・メモリ・指数が悪化した所を集める
+#時間とメモリは、同じ節点数の点どうしの比の中央値で判定する(1点だけの揺らぎでは悪化とみなさない)
+def compare_baseline(benchmark, baseline):
+    speed_ratio = benchmark['calibration_time'] / baseline['calibration_time']  #今回の計算機が基準値の何倍遅いか
+    print('Calibration: {:0.5f} -> {:0.5f}[sec]'.format(baseline['calibration_time'], benchmark['calibration_time']))
+
+    regressions = []
+    for solver_name, import_result in benchmark['import_results'].items():
+        baseline_import = baseline.get('import_results', {}).get(solver_name)
+        if(baseline_import is None):
+            continue
+        import_ratio = import_result['import_time'] / (speed_ratio*baseline_import['import_time'])
+        if(regression_ratio < import_ratio):
+            regressions.append('{} import: time x{:0.2f}'.format(solver_name, import_ratio))
+        heavy_added = sorted(set(import_result['heavy_modules']) -set(baseline_import['heavy_modules']))
+        if(0<len(heavy_added)):
+            regressions.append('{} import: loads {}'.format(solver_name, ', '.join(heavy_added)))
+
+    for case_key, case_results in benchmark['results'].items():
+        if(case_key not in baseline['results']):
+            continue
+        baseline_cases = {case_result['nod_total']:case_result for case_result in baseline['results'][case_key]}
+        for stage_name in stage_names +['total']:
+            #同じ節点数の点どうしで、時間とメモリの比を調べる
+            time_ratios, memory_ratios = [], []
+            for case_result in case_results:
+                baseline_case = baseline_cases.get(case_result['nod_total'])
+                if(baseline_case is None):
+                    continue
+                stage, baseline_stage = case_result['stages'][stage_name], baseline_case['stages'][stage_name]
+                if(time_min < stage['wall_time'] and time_min < baseline_stage['wall_time']):
+                    time_ratios.append(stage['wall_time'] / (speed_ratio*baseline_stage['wall_time']))
+                if(memory_min < stage['peak_memory'] and memory_min < baseline_stage['peak_memory']):
+                    memory_ratios.append(stage['peak_memory'] / baseline_stage['peak_memory'])
+            if(0<len(time_ratios) and regression_ratio < np.median(time_ratios)):
+                regressions.append('{} {}: wall time x{:0.2f} (median of {} sizes)'.format(
+                                   case_key, stage_name, np.median(time_ratios), len(time_ratios)))
+            if(0<len(memory_ratios) and regression_ratio < np.median(memory_ratios)):
+                regressions.append('{} {}: peak memory x{:0.2f} (median of {} sizes)'.format(
+                                   case_key, stage_name, np.median(memory_ratios), len(memory_ratios)))
+
+            #規模に対する指数の増加を調べる
+            for exponent_name in ('time_exponent', 'memory_exponent'):
+                exponent = benchmark['scaling'][case_key][stage_name][exponent_name]
+                baseline_exponent = baseline['scaling'].get(case_key, {}).get(stage_name, {}).get(exponent_name)
+                if(exponent is not None and baseline_exponent is not None and baseline_exponent +exponent_margin < exponent):
+                    regressions.append('{} {}: {} {:0.2f} -> {:0.2f}'.format(
+                                       case_key, stage_name, exponent_name, baseline_exponent, exponent))
+    return regressions
+
+
+#全ての条件を計測する
+def run_benchmark():
+    calibration_time = measure_calibration()
+    import_results = {}
+    for solver_name in solver_names:
+        import_results[solver_name] = measure_import_time(solver_name, import_repeat_num)
+        print('{:<36} import time = {:0.5f}[sec]  heavy modules = {}'.format(solver_name, import_results[solver_name]['import_time'],
+              ', '.join(import_results[solver_name]['heavy_modules']) or '-'))
+
+    results = {}
+    for solver_name in solver_names:
+        fem = importlib.import_module(solver_name)
+        fem.log_level = fem.LOG_SILENT  #診断出力は表示しない
+        fem.telemetry_enabled = True  #処理段階ごとの計測を有効にする
+
+        for matrix_type, nod_range in benchmark_ladders[solver_name].items():
+            for node_arrange in node_arranges:
+                case_key = '{}/{}/{}'.format(solver_name, matrix_type, node_arrange)
+                results[case_key] = []
+                for node_type in make_node_types(solver_name, node_arrange, nod_range, step_num):
+                    case_result = measure_case(fem, solver_name, node_type, matrix_type, repeat_num)
+                    case_result['node_type'] = node_type
+                    results[case_key].append(case_result)
+                    print('{:<36} N = {:>8}  time = {:0.5f}[sec]  peak memory = {:0.3f}[MB]'.format(
+                          case_key, case_result['nod_total'], case_result['stages']['total']['wall_time'],
+                          case_result['stages']['total']['peak_memory']/2**20))
+
+    reorder_results = measure_reordering(reorder_node_type, repeat_num)
+
+    calibration_time = min(calibration_time, measure_calibration())  #計測の前後で測り、速い方を使う
+    return {'time':time.ctime(), 'numpy':np.__version__, 'calibration_time':calibration_time,
+            'import_results':import_results, 'results':results, 'scaling':fit_scaling(results), 'reorder_results':reorder_results}
+
+
+#規模に対する指数の一覧を表示
+def print_scaling(scaling):
+    print('{:<36} {:<30} {:>8} {:>8}'.format('case', 'stage', 'time^p', 'memory^p'))
+    for case_key, case_scaling in scaling.items():
+        for stage_name, exponents in case_scaling.items():
+            print('{:<36} {:<30} {:>8} {:>8}'.format(case_key, stage_name,
+                  *['-' if exponents[exponent_name] is None else '{:0.2f}'.format(exponents[exponent_name])
+                    for exponent_name in ('time_exponent', 'memory_exponent')]))
+
+
+######
+if __name__ == '__main__':
+    ##### 出力先 #####
+    benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+    result_file = os.path.join(benchmark_dir, 'benchmark_result.json')  #今回の計測結果
+    baseline_file = os.path.join(benchmark_dir, 'benchmark_baseline.json')  #比較する基準値
+    update_baseline = False  #Trueなら、今回の計測結果を基準値として保存する
+
+
+    ##### 計測 #####
+    print ("Benchmark start: ", time.ctime())
+    benchmark = run_benchmark()
+    print_scaling(benchmark['scaling'])
+
+    with open(result_file, 'w', encoding='utf-8') as f:
+        json.dump(benchmark, f, indent=2)
+
+    #基準値が無ければ今回の結果を基準値にし、あれば比較して悪化した所を表示する
+    if(update_baseline or not os.path.exists(baseline_file)):
+        with open(baseline_file, 'w', encoding='utf-8') as f:
+            json.dump(benchmark, f, indent=2)
+        print('Baseline saved: ', baseline_file)
+    else:
+        with open(baseline_file, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_baseline(benchmark, baseline)
+        print('Regressions: ', len(regressions))
+        for regression in regressions:
+            print('  ' +regression)
+        if(0<len(regressions)):
+            sys.exit(1)
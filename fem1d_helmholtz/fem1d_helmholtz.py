@@ -2,241 +2,433 @@
 #常微分方程式： d/dx[p(x)du(x)/dx] +q(x)u(x) = 0  (x_min<x<x_max)
 #境界条件： u(x_min)=alpha,  du(x_max)/dx=beta
 import time  #時刻を扱うライブラリ
+import functools  #計測用のデコレータ
+import json  #計測結果の書き出し
+import tracemalloc  #メモリ使用量の計測
 import numpy as np  #数値計算用
-import scipy.linalg  #SciPyの線形計算ソルバー
-import matplotlib.pyplot as plt  #グラフ作成
+#SciPyのサブモジュールとMatplotlibは、使う関数の中で読み込む(計算だけなら描画用のモジュールは読み込まない)
+
+
+#診断出力のレベル。silent:何も表示しない、summary:処理の流れと要約のみ、debug:配列や行列の中身も表示
+LOG_SILENT, LOG_SUMMARY, LOG_DEBUG = 0, 1, 2
+log_level = LOG_SUMMARY
+log_edgeitems = 3  #debugで配列を表示する場合の、先頭と末尾の要素数
+
+
+#診断出力。levelがlog_level以下の場合のみ表示する
+#引数に関数を渡した場合は、表示する時にだけ呼び出す(表示しない文字列は作らない)
+def log_print(level, *args):
+    if(level <= log_level):
+        print(*[arg() if callable(arg) else arg for arg in args])
+
+
+#配列の診断出力。大きな配列は先頭と末尾のlog_edgeitems個だけに切り詰める
+def log_array(level, title, array):
+    if(level <= log_level):
+        print(title)
+        print(np.array2string(np.asarray(array), threshold=2*log_edgeitems, edgeitems=log_edgeitems))
+
+
+#全体行列の診断出力。左上の10行10列(と右辺ベクトル)だけを取り出して表示する。matrix_typeは全体行列の形式(basic,banded)
+def log_matrix(level, title, mat, vec=None, matrix_type='basic'):
+    if(level <= log_level):
+        print(title)
+        if(matrix_type=='banded'):
+            mat_head = mat[:,:10].T  #帯行列形式は10列目まで(上側、対角、下側)
+        else:
+            mat_head = mat[:10,:10]
+        for i in range(len(mat_head)):
+            line = "".join("{:7.2f}".format(value) for value in mat_head[i])
+            if(vec is not None):
+                line += ";" +"".join("{:7.2f}".format(value) for value in np.atleast_1d(vec[i]))
+            print(line)
+
+
+#処理段階ごとの計測結果(壁時計時間、CPU時間、メモリ使用量のピーク)と、問題の統計量。JSONで書き出す
+telemetry_enabled = False
+telemetry = {'stages':{}, 'statistics':{}}
+
+
+#計測結果を空にする
+def reset_telemetry():
+    telemetry['stages'].clear()
+    telemetry['statistics'].clear()
+
+
+#問題の統計量(節点数、要素数、非ゼロ成分数、フィルイン、反復回数など)を記録
+def record_statistics(**statistics):
+    if(telemetry_enabled):
+        telemetry['statistics'].update(statistics)
+
+
+#処理段階の関数を計測するデコレータ。同じ段階を複数回呼んだ場合は、時間を合計してピークは最大値を残す
+#メモリはtracemallocで追跡した確保量(NumPy配列を含む)のうち、段階の開始時から増えた分のピーク
+def measure_stage(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if(not telemetry_enabled):
+            return func(*args, **kwargs)
+        if(not tracemalloc.is_tracing()):
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+        wall_time, cpu_time = time.perf_counter(), time.process_time()
+
+        result = func(*args, **kwargs)
+
+        wall_time, cpu_time = time.perf_counter() -wall_time, time.process_time() -cpu_time
+        peak_memory = tracemalloc.get_traced_memory()[1] -memory_start
+        stage = telemetry['stages'].setdefault(func.__name__, {'calls':0, 'wall_time':0.0, 'cpu_time':0.0, 'peak_memory':0})
+        stage['calls'] += 1
+        stage['wall_time'] += wall_time
+        stage['cpu_time'] += cpu_time
+        stage['peak_memory'] = max(stage['peak_memory'], peak_memory)
+        log_print(LOG_SUMMARY, lambda: 'Stage {}: wall = {:0.5f}[sec], cpu = {:0.5f}[sec], peak memory = {:0.3f}[MB]'.format(
+                  func.__name__, wall_time, cpu_time, peak_memory/2**20))
+        return result
+    return wrapper
+
+
+#計測結果をJSONで書き出す。run_infoには計算条件(節点の生成方法など)を渡す
+def write_telemetry(file_path, **run_info):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(run_info, **telemetry), f, indent=2, ensure_ascii=False)
+
+
+#帯行列形式[3,N]を、疎行列(csc形式)に変換
+def banded_to_sparse(mat_band):
+    import scipy.sparse  #圧縮行列の処理
+    nod_total = mat_band.shape[1]
+    return scipy.sparse.dia_matrix((mat_band, [1,0,-1]), shape=(nod_total,nod_total)).tocsc()
+
+
+#shiftより小さい固有値の個数を数える
+#A-shift*Bを並べ替えなしでLDL^T分解すると、Dの負の成分の個数が固有値の個数に等しい(シルベスターの慣性法則)
+def count_eigenvalues_below(mat_A_glo, mat_B_glo, shift):
+    import scipy.sparse.linalg  #圧縮行列用ソルバー
+    lu = scipy.sparse.linalg.splu(banded_to_sparse(mat_A_glo -shift*mat_B_glo), permc_spec='NATURAL',
+                                  diag_pivot_thresh=0.0, options=dict(SymmetricMode=True))
+    record_statistics(factor_nnz=int(lu.L.nnz +lu.U.nnz), fill_in=(lu.L.nnz +lu.U.nnz)/np.count_nonzero(mat_A_glo -shift*mat_B_glo))
+    return np.count_nonzero(lu.U.diagonal() < 0.0)
+
+
+#帯行列形式の一般化固有値問題を、必要な範囲だけshift-invertのLanczos法で解く。メモリは節点数×求める個数に比例
+def solve_banded_eigen(mat_A_glo, mat_B_glo, eigen_type):
+    import scipy.sparse.linalg  #圧縮行列用ソルバー
+    mat_A_sparse = banded_to_sparse(mat_A_glo)
+    mat_B_sparse = banded_to_sparse(mat_B_glo)
+
+    if(eigen_type[0]=='index'):  #小さい方から数えてeigen_type[1]〜eigen_type[2]番目
+        #固有値は0以上なので、負のシフトσ=-1に近い順＝小さい順に求まる
+        eigenvalues, unknown_vec_u = scipy.sparse.linalg.eigsh(mat_A_sparse, k=eigen_type[2]+1, M=mat_B_sparse,
+                                                               sigma=-1.0, which='LM')
+        eigen_order = np.argsort(eigenvalues)[eigen_type[1]:eigen_type[2]+1]
+
+    elif(eigen_type[0]=='value'):  #eigen_type[1]〜eigen_type[2]の範囲
+        #範囲内の固有値の個数を数え、範囲の中心に近い順にその個数だけ求める
+        eigen_num = count_eigenvalues_below(mat_A_glo, mat_B_glo, eigen_type[2]) \
+                   -count_eigenvalues_below(mat_A_glo, mat_B_glo, eigen_type[1])
+        log_print(LOG_SUMMARY, 'Number of eigenvalues in [{}, {}) = {}'.format(eigen_type[1], eigen_type[2], eigen_num))
+        if(eigen_num==0):
+            return np.empty(0, np.float64), np.empty((mat_A_glo.shape[1],0), np.float64)
+        eigenvalues, unknown_vec_u = scipy.sparse.linalg.eigsh(mat_A_sparse, k=eigen_num, M=mat_B_sparse,
+                                                               sigma=(eigen_type[1]+eigen_type[2])/2.0, which='LM')
+        eigen_order = np.argsort(eigenvalues)
+
+    else:  #allは全ての固有ベクトルを密に持つことになるので、帯行列形式では扱わない
+        raise ValueError("eigen_type {} is not supported for matrix_type='banded' (use 'index' or 'value', or matrix_type='basic')".format(eigen_type[0]))
+
+    return eigenvalues[eigen_order], unknown_vec_u[:,eigen_order]
+
+
+#固有ベクトルの列をcolumn_orderの順に取り出し(Noneなら全ての列をそのままの順で)、output_typeの型と出力先に書き出す
+#fileの場合は.npyファイルをメモリマップで開き、block_size列ずつ型を変換しながら流し込む(全体の複製は作らない)
+def write_eigenvectors(unknown_vec_u, column_order, output_type, block_size=64):
+    vec_dtype = np.dtype(output_type[1])
+    if(output_type[0]=='memory'):
+        if(column_order is None):
+            return unknown_vec_u.astype(vec_dtype, copy=False)
+        return unknown_vec_u[:,column_order].astype(vec_dtype, copy=False)
+    elif(output_type[0]=='file'):
+        if(column_order is None):
+            column_order = np.arange(unknown_vec_u.shape[1])
+        vec_file = np.lib.format.open_memmap(output_type[2], mode='w+', dtype=vec_dtype, shape=(len(unknown_vec_u), len(column_order)))
+        for i in range(0, len(column_order), block_size):
+            vec_file[:,i:i+block_size] = unknown_vec_u[:,column_order[i:i+block_size]]
+        vec_file.flush()
+        log_print(LOG_SUMMARY, 'Eigenvectors written: {} ({:0.3f}[MB])'.format(output_type[2], vec_file.nbytes/2**20))
+        return vec_file
+
+
+#1次元Helmholtz方程式の固有値問題。計算条件とメッシュを属性に保持し、1つのプロセスの中で何度でも解ける
+#計算条件は解く前に書き換えてもよい。メッシュを省略して解くと、前回のメッシュを使い回す
+class Helmholtz1D:
+    def __init__(self, x_min=-1.0, x_max=1.0, cons_q=1.0, BC_left=('Dirichlet', 0.0), BC_right=('Dirichlet', 0.0),
+                 matrix_type='banded', eigen_type=('index', 0, 12), output_modes=None, output_type=('memory', 'float64')):
+        self.x_min, self.x_max = x_min, x_max  #計算領域のXの最小値、最大値
+        self.cons_q = cons_q  #定数項q
+        self.BC_left, self.BC_right = BC_left, BC_right  #左部(x=x_min)、右部(x=x_max)の、境界の種類(Dirichlet,Neumann)と値
+        self.matrix_type = matrix_type  #全体行列の形式。basic,banded
+        self.eigen_type = eigen_type  #求める固有値。['all'],['index', 最初, 最後],['value', 下限, 上限]
+        self.output_modes = output_modes  #残す固有モードの番号(求めた固有値を小さい順に並べた番号)。Noneなら全て
+        self.output_type = output_type  #固有ベクトルの出力。['memory', 型],['file', 型, .npyファイル名]
+
+    #メッシュを作成する。Global節点座標、線分要素の節点番号、Local節点座標を属性に保持する
+    def set_mesh(self, node_type):
+        self.generate_nodes(node_type)
+        self.make_mesh_data()
+
+    #要素方程式の構築から固有値問題の求解までを行い、固有ベクトルと固有値を返す
+    #node_typeを省略した場合は、前回作成したメッシュを使い回す
+    def solve(self, node_type=None):
+        if(node_type is not None):
+            self.set_mesh(node_type)
+
+        mat_A_ele, mat_B_ele = self.assemble_element_matrix(self.nod_num_seg, self.nod_pos_seg)
+        mat_A_glo, mat_B_glo = self.assemble_global_matrix(mat_A_ele, mat_B_ele)
+        BC_type, BC_value = self.make_boundary_info(self.nod_pos_seg)
+        mat_A_glo, mat_B_glo = self.set_boundary_condition(mat_A_glo, mat_B_glo, BC_type, BC_value)
+        return self.solve_simultaneous_equations(mat_A_glo, mat_B_glo)
+
+    #節点データを生成
+    @measure_stage
+    def generate_nodes(self, node_type):
+        node_total = node_type[1]  #節点数(>=2)
+        ele_total = node_total-1  #要素数
+
+        #格子点配置
+        if (node_type[0]=='lattice'):
+            #Global節点のx座標を定義(x_min〜x_max)
+            lattice_num = node_type[1]  #格子点分割における節点数
+            nod_pos_glo = np.linspace(self.x_min,self.x_max, lattice_num) #計算領域を等分割
+
+        #ランダム配置
+        elif (node_type[0]=='random'):
+            random_num = node_type[1]  #ランダム分割における節点数
+            nod_pos_glo = np.random.rand(random_num)  #[0~1]の点をrandom_num個生成
+            nod_pos_glo = np.sort(nod_pos_glo)  #昇順(小さい順)にソート
+            nod_pos_glo = self.x_min +(self.x_max-self.x_min)*nod_pos_glo
+
+            #隅に点を移動
+            if (2<=random_num):
+                nod_pos_glo[0] = self.x_min
+                nod_pos_glo[node_total-1] = self.x_max
+
+        log_array(LOG_DEBUG, 'Global節点のx,y座標', nod_pos_glo)
+
+        #各線分要素のGlobal節点番号
+        nod_num_seg = np.empty((ele_total,2), np.int64)
+        nod_num_seg[:,0] = np.arange(ele_total)
+        nod_num_seg[:,1] = np.arange(1, ele_total+1)
+        log_array(LOG_DEBUG, '線分要素を構成するGlobal節点番号', nod_num_seg)
+
+        record_statistics(nod_total=int(len(nod_pos_glo)), seg_ele_total=int(len(nod_num_seg)))
+        self.nod_pos_glo, self.nod_num_seg = nod_pos_glo, nod_num_seg
+        return nod_pos_glo, nod_num_seg
+
+    #入力データの用意
+    @measure_stage
+    def make_mesh_data(self):
+        #print("node_total = ",node_total, ",  ele_total = ",ele_total)
+
+        #各線分要素のLocal節点のx座標
+        nod_pos_seg = self.nod_pos_glo[self.nod_num_seg]  #[ele_total,2]
+        log_array(LOG_DEBUG, '線分要素を構成するLocal節点座標', nod_pos_seg)
+
+        self.nod_pos_seg = nod_pos_seg
+        return nod_pos_seg
+
+    #要素方程式を構築
+    @measure_stage
+    def assemble_element_matrix(self, nod_num_seg, nod_pos_seg):
+        #各線分要素の長さ
+        length = np.absolute( nod_pos_seg[:,1] -nod_pos_seg[:,0] )
+        log_array(LOG_DEBUG, "Element length", length)
+
+        #全要素の要素行列を一括で計算
+        log_print(LOG_SUMMARY, "Local matrix")
+        mat_A_ele = np.array([[1.0,-1.0],[-1.0,1.0]]) / length[:,np.newaxis,np.newaxis]  #要素係数行列[ele_total,2,2]
+        mat_B_ele = (self.cons_q*length/6.0)[:,np.newaxis,np.newaxis] \
+                   * np.array([[2.0,1.0],[1.0,2.0]])  #要素係数行列[ele_total,2,2]、対角成分はqL/3、非対角成分はqL/6
+
+        return mat_A_ele, mat_B_ele
+
+    #全体方程式を構築
+    @measure_stage
+    def assemble_global_matrix(self, mat_A_ele, mat_B_ele):
+        #全要素の(i,j)成分に対応するGlobal節点番号
+        nod_total = len(self.nod_pos_glo)
+        row_glo = np.repeat(self.nod_num_seg, 2, axis=1).ravel()  #成分(e,i,j)の行番号nod_num_seg[e,i]
+        col_glo = np.tile(self.nod_num_seg, (1,2)).ravel()  #成分(e,i,j)の列番号nod_num_seg[e,j]
+
+        #要素行列から全体行列を組み立てる（同じ位置の成分は足し合わされる）
+        log_print(LOG_SUMMARY, "Global matrix (constructed)")
+        if(self.matrix_type=='basic'):
+            index_glo = row_glo*nod_total +col_glo
+            mat_shape = (nod_total,nod_total)
+        elif(self.matrix_type=='banded'):
+            #帯行列形式[3,nod_total]。成分(i,j)は[1+i-j,j]に格納する(0行目が上側、1行目が対角、2行目が下側の対角線)
+            index_glo = (1 +row_glo -col_glo)*nod_total +col_glo
+            mat_shape = (3,nod_total)
+        mat_A_glo = np.bincount(index_glo, weights=mat_A_ele.ravel(), minlength=mat_shape[0]*mat_shape[1]).reshape(mat_shape)  #全体係数行列
+        mat_B_glo = np.bincount(index_glo, weights=mat_B_ele.ravel(), minlength=mat_shape[0]*mat_shape[1]).reshape(mat_shape)  #全体係数行列
+
+        log_matrix(LOG_DEBUG, 'Pre global matrix A', mat_A_glo, matrix_type=self.matrix_type)  #全体行列を10行10列まで確認
+        log_matrix(LOG_DEBUG, 'Pre global matrix B', mat_B_glo, matrix_type=self.matrix_type)
+        record_statistics(nnz=int(np.count_nonzero(mat_A_glo)))  #帯行列形式でも、格納された非ゼロ成分の個数
+
+        return mat_A_glo, mat_B_glo
 
+    #境界要素の情報を設定
+    @measure_stage
+    def make_boundary_info(self, nod_pos_seg):
+        BC_type = [""]*2
+        BC_value = [""]*2
 
-#節点データを生成
-def generate_nodes(node_type):
-    node_total = node_type[1]  #節点数(>=2)
-    ele_total = node_total-1  #要素数
-
-    #格子点配置
-    if (node_type[0]=='lattice'):
-        #Global節点のx座標を定義(x_min〜x_max)
-        lattice_num = node_type[1]  #格子点分割における節点数
-        nod_pos_glo = np.linspace(x_min,x_max, lattice_num) #計算領域を等分割
-
-    #ランダム配置
-    elif (node_type[0]=='random'):
-        random_num = node_type[1]  #ランダム分割における節点数
-        nod_pos_glo = np.random.rand(random_num)  #[0~1]の点をrandom_num個生成
-        nod_pos_glo = np.sort(nod_pos_glo)  #昇順(小さい順)にソート
-        nod_pos_glo = x_min +(x_max-x_min)*nod_pos_glo
+        #左側境界
+        BC_type[0] = self.BC_left[0]
+        BC_value[0] = self.BC_left[1]
 
-        #隅に点を移動
-        if (2<=random_num):
-            nod_pos_glo[0] = x_min
-            nod_pos_glo[node_total-1] = x_max
+        #右側境界
+        BC_type[1] = self.BC_right[0]
+        BC_value[1] = self.BC_right[1]
 
-    print('Global節点のx,y座標\n', nod_pos_glo)
+        log_array(LOG_DEBUG, 'BC_type =', BC_type)
 
-    #各線分要素のGlobal節点番号
-    nod_num_seg = np.empty((ele_total,2), np.int)
-    for e in range(ele_total):
-        nod_num_seg[e,0] = e
-        nod_num_seg[e,1] = e+1
-    print('線分要素を構成するGlobal節点番号\n', nod_num_seg)
+        return BC_type, BC_value
 
-    return nod_pos_glo, nod_num_seg
+    #境界条件を実装
+    @measure_stage
+    def set_boundary_condition(self, mat_A_glo, mat_B_glo, BC_type, BC_value):
+        BC_nod = [0,len(self.nod_pos_glo)-1]
+        record_statistics(dirichlet_nod_total=int(BC_type.count('Dirichlet')), neumann_nod_total=int(BC_type.count('Neumann')))
 
+        #各要素の各節点に対応したGlobal節点に対して処理する
+        log_print(LOG_SUMMARY, 'Boundary conditions')
+        for n in range(2):
+            if(BC_type[n]=='Dirichlet' and self.matrix_type=='basic'):
+                mat_A_glo[BC_nod[n], :] = 0.0  #行を全て0にする
+                mat_A_glo[:, BC_nod[n]] = 0.0  #列を全て0にする
+                mat_A_glo[BC_nod[n], BC_nod[n]] = 1.0  #対角成分は1にする
 
-#入力データの用意
-def make_mesh_data():
-    #print("node_total = ",node_total, ",  ele_total = ",ele_total)
+            if(BC_type[n]=='Dirichlet' and self.matrix_type=='banded'):
+                #帯行列形式では、節点BC_nod[n]の列は[0:3,BC_nod[n]]、行の非対角成分は[2,BC_nod[n]-1]と[0,BC_nod[n]+1]
+                nod = BC_nod[n]
+                nod_band = np.arange(max(nod-1,0), min(nod+2,len(self.nod_pos_glo)))  #節点nodと結合する節点
+                mat_A_glo[1+nod-nod_band, nod_band] = 0.0  #行を全て0にする
+                mat_A_glo[1+nod_band-nod, nod] = 0.0  #列を全て0にする
+                mat_A_glo[1, nod] = 1.0  #対角成分は1にする
 
-    #各線分要素のLocal節点のx座標
-    print('線分要素を構成するLocal節点座標')
-    nod_pos_seg = np.empty((len(nod_num_seg),2), np.float64)
-    for e in range(len(nod_num_seg)):
-        for n in range(2):
-            nod_pos_seg[e,n] = nod_pos_glo[ nod_num_seg[e,n] ]
-    print(nod_pos_seg)
-
-    return nod_pos_seg
-
-
-#要素方程式を構築
-def assemble_element_matrix(nod_num_seg, nod_pos_seg):
-    #各線分要素の長さ
-    print("Element length")
-    length = np.empty(len(nod_num_seg), np.float64)
-    for e in range(len(nod_num_seg)):
-        length[e] = np.absolute( nod_pos_seg[e,1] -nod_pos_seg[e,0] )
-    print(length)
-
-    #要素行列の初期化
-    mat_A_ele = np.zeros((len(nod_num_seg),2,2), np.float64)  #要素係数行列(ゼロで初期化)
-    mat_B_ele = np.zeros((len(nod_num_seg),2,2), np.float64)  #要素係数行列(ゼロで初期化)
-
-    #要素行列の各成分を計算
-    print("Local matrix")
-    for e in range(len(nod_num_seg)):
-        for i in range(2):
-            for j in range(2):
-                mat_A_ele[e,i,j] = ( (-1)**(i+1) *(-1)**(j+1) ) / length[e]
-                #mat_B_ele[e,i,j] = -func_f *length[e]/2.0
+        log_matrix(LOG_DEBUG, 'Post global matrix A', mat_A_glo, matrix_type=self.matrix_type)  #全体行列を10行10列まで確認
+        log_matrix(LOG_DEBUG, 'Post global matrix B', mat_B_glo, matrix_type=self.matrix_type)
 
-                if(i==j):
-                    mat_B_ele[e,i,j] = cons_q*length[e]/3.0
-                else:
-                    mat_B_ele[e,i,j] = cons_q*length[e]/6.0
-
-    return mat_A_ele, mat_B_ele
-
-
-#全体方程式を構築
-def assemble_global_matrix(mat_A_ele, mat_B_ele):
-    #全体行列の初期化
-    mat_A_glo = np.zeros((len(nod_pos_glo),len(nod_pos_glo)), np.float64) #全体係数行列(ゼロで初期化)
-    mat_B_glo = np.zeros((len(nod_pos_glo),len(nod_pos_glo)), np.float64) #全体係数行列(ゼロで初期化)
-
-    #要素行列から全体行列を組み立てる
-    print("Global matrix (constructed)")
-    for e in range(len(nod_num_seg)):
-        for i in range(2):
-            for j in range(2):
-                mat_A_glo[ nod_num_seg[e,i], nod_num_seg[e,j] ] += mat_A_ele[e,i,j]
-                mat_B_glo[ nod_num_seg[e,i], nod_num_seg[e,j] ] += mat_B_ele[e,i,j]
-
-    print('Pre global matrix A')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_A_glo[i,j]), end='')
-        print()
-    print('Pre global matrix B')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_B_glo[i,j]), end='')
-        print()
-
-    return mat_A_glo, mat_B_glo
-
-
-#境界要素の情報を設定
-def make_boundary_info(nod_pos_seg):
-    BC_type = [""]*2
-    BC_value = [""]*2
-
-    #左側境界
-    BC_type[0] = BC_left[0]
-    BC_value[0] = BC_left[1]
-
-    #右側境界
-    BC_type[1] = BC_right[0]
-    BC_value[1] = BC_right[1]
-
-    print('BC_type =\n', BC_type)
-
-    return BC_type, BC_value
-
-
-#境界条件を実装
-def set_boundary_condition(mat_A_glo, mat_B_glo, BC_type, BC_value):
-    BC_nod = [0,len(nod_pos_glo)-1]
-
-    #各要素の各節点に対応したGlobal節点に対して処理する
-    print('Boundary conditions')
-    for n in range(2):
-        if(BC_type[n]=='Dirichlet'):
-            mat_A_glo[BC_nod[n], :] = 0.0  #行を全て0にする
-            mat_A_glo[:, BC_nod[n]] = 0.0  #列を全て0にする
-            mat_A_glo[BC_nod[n], BC_nod[n]] = 1.0  #対角成分は1にする
-
-    print('Post global matrix A')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_A_glo[i,j]), end='')
-        print()
-    print('Post global matrix B')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_B_glo[i,j]), end='')
-        print()
-
-    return mat_A_glo, mat_B_glo
-
-
-#連立方程式を解く
-def solve_simultaneous_equations(mat_A_glo, mat_B_glo):
-    print('節点数、境界線分要素数')
-    print(len(nod_pos_glo), len(nod_pos_seg))
-
-    print('Solve linear equations')
-    #Au=λBuから、固有値Eigと固有値ベクトルUを求める
-    eigenvalues, unknown_vec_u = scipy.linalg.eigh(mat_A_glo, mat_B_glo)
-
-    print("Eigenvalues =\n", eigenvalues)  #固有値
-    print("Unkown vector U =\n", unknown_vec_u)  #未知数ベクトル
-
-    print("N_Eig = ", np.count_nonzero(eigenvalues))  #非ゼロの固有値の個数
-    eigenvalues_nonzero = eigenvalues[np.where(0.000001<abs(eigenvalues))]
-    print("eigenvalues_nonzero =\n", eigenvalues_nonzero)  #固有値の非ゼロ成分
-
-    return unknown_vec_u, eigenvalues
-
-
-#メッシュを表示
-def visualize_mesh(nod_pos_glo, show_text, out_type):
-    #plt.rcParams['font.family'] = 'Times New Roman'  #全体のフォントを設定
-    fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
-
-    #plt.title("Finite element analysis of 1D Poisson's equation")  #グラフタイトル
-    plt.xlabel("$x$")  #x軸の名前
-    plt.ylabel("$u(x)$")  #y軸の名前
-    plt.grid()  #点線の目盛りを表示
-
-    #メッシュをプロット
-    zero_list = np.zeros(len(nod_pos_glo))
-    plt.plot(nod_pos_glo,zero_list, label="$\phi(x)$", color='#0000ff')  #線分要素
-    plt.scatter(nod_pos_glo,zero_list, color='#0000ff')  #節点
-
-    if(show_text==True):
-        for n in range(len(nod_pos_glo)):  #節点番号
-            plt.text(nod_pos_glo[n],zero_list[n], 'n%d' %n, ha='center',va='bottom', color='#0000ff')
-        for e in range(len(nod_pos_seg)):  #線分要素番号
-            meanX = (nod_pos_seg[e,0] +nod_pos_seg[e,1])/2.0
-            plt.text(meanX, zero_list[n], 'e%d' %e, ha='center',va='top')
-
-    #グラフを表示
-    if(out_type=='show'):
-        plt.show()
-    elif(out_type=='save'):
-        plt.savefig("fem1d_mesh.png")
-        #plt.savefig('fem1d_mesh.pdf')
-    plt.close()  #作成した図のウィンドウを消す
-
-
-#計算結果を表示
-def visualize_result(nod_pos_glo, unknown_vec_u, show_text=False, out_type='show'):
-    plt.rcParams['font.family'] = 'Times New Roman' #全体のフォントを設定
-    fig = plt.figure(figsize=(16, 12), dpi=100, facecolor='#ffffff')
+        return mat_A_glo, mat_B_glo
 
-    fig.suptitle("FEA of 1D Helmholtz's equation", fontsize=16)  #全体のグラフタイトル
-
-    #表示する固有値・固有ベクトルの番号
-    if (BC_left[0]=='Dirichlet' or BC_right[0]=='Dirichlet'):
-        count = 0
-    else:
-        count = 1
-
-    #数値解をプロット
-    for i in range(plot_num[0]*plot_num[1]):
-        ax = fig.add_subplot(plot_num[0], plot_num[1], i+1)
-        #ax.set_title("Eig={:0.5f}".format(eigenvalues[count]))
-        ax.set_title("k={:0.5f}".format( np.sqrt(eigenvalues[count]) ))
-        ax.plot(nod_pos_glo,unknown_vec_u[:,count], color='#0000ff')  #折線グラフを作成
-        count += 1
-    plt.tight_layout()  #余白を調整
-    plt.subplots_adjust(left=None, bottom=0.05, right=None, top=0.9, wspace=0.1, hspace=0.3)  #余白を調整
-
-    #グラフを表示
-    if(out_type=='show'):
-        plt.show()
-    elif(out_type=='save'):
-        plt.savefig("fem1d_helmholtz.png")
-    plt.close()  #作成した図のウィンドウを消す
+    #連立方程式を解く
+    @measure_stage
+    def solve_simultaneous_equations(self, mat_A_glo, mat_B_glo):
+        log_print(LOG_SUMMARY, '節点数、境界線分要素数')
+        log_print(LOG_SUMMARY, len(self.nod_pos_glo), len(self.nod_pos_seg))
+
+        log_print(LOG_SUMMARY, 'Solve linear equations')
+        #残す固有モードを指定した場合は、番号で指定する範囲をそのモードを含む範囲に狭める(メモリは節点数×範囲の個数に比例)
+        eigen_type, mode_index = self.eigen_type, None
+        if(self.output_modes is not None):
+            mode_index = np.asarray(self.output_modes)
+            if(eigen_type[0]=='all' or eigen_type[0]=='index'):
+                index_first = 0 if(eigen_type[0]=='all') else eigen_type[1]
+                eigen_type = ['index', index_first +mode_index.min(), index_first +mode_index.max()]
+                mode_index = mode_index -mode_index.min()
+
+        #Au=λBuから、固有値Eigと固有値ベクトルUを求める
+        if(self.matrix_type=='basic'):
+            import scipy.linalg  #SciPyの線形計算ソルバー
+            if(eigen_type[0]=='all'):  #全ての固有値を求める
+                eigenvalues, unknown_vec_u = scipy.linalg.eigh(mat_A_glo, mat_B_glo)
+            elif(eigen_type[0]=='index'):  #小さい方から数えてeigen_type[1]〜eigen_type[2]番目の固有値を求める
+                eigenvalues, unknown_vec_u = scipy.linalg.eigh(mat_A_glo, mat_B_glo, subset_by_index=eigen_type[1:3])
+            elif(eigen_type[0]=='value'):  #eigen_type[1]〜eigen_type[2]の範囲の固有値を求める
+                eigenvalues, unknown_vec_u = scipy.linalg.eigh(mat_A_glo, mat_B_glo, subset_by_value=eigen_type[1:3])
+
+        elif(self.matrix_type=='banded'):
+            eigenvalues, unknown_vec_u = solve_banded_eigen(mat_A_glo, mat_B_glo, eigen_type)
+
+        #残す固有モードだけを、指定の型と出力先に書き出す
+        if(mode_index is not None):
+            eigenvalues = eigenvalues[mode_index]
+        unknown_vec_u = write_eigenvectors(unknown_vec_u, mode_index, self.output_type)
+
+        log_array(LOG_SUMMARY, "Eigenvalues =", eigenvalues)  #固有値
+        log_array(LOG_DEBUG, "Unkown vector U =", unknown_vec_u)  #未知数ベクトル
+
+        log_print(LOG_SUMMARY, "N_Eig = ", np.count_nonzero(eigenvalues))  #非ゼロの固有値の個数
+        record_statistics(eigen_num=int(len(eigenvalues)))
+        eigenvalues_nonzero = eigenvalues[np.where(0.000001<abs(eigenvalues))]
+        log_array(LOG_DEBUG, "eigenvalues_nonzero =", eigenvalues_nonzero)  #固有値の非ゼロ成分
+
+        return unknown_vec_u, eigenvalues
+
+    #メッシュを表示
+    def visualize_mesh(self, nod_pos_glo, show_text, out_type):
+        import matplotlib.pyplot as plt  #グラフ作成
+        #plt.rcParams['font.family'] = 'Times New Roman'  #全体のフォントを設定
+        fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
+
+        #plt.title("Finite element analysis of 1D Poisson's equation")  #グラフタイトル
+        plt.xlabel("$x$")  #x軸の名前
+        plt.ylabel("$u(x)$")  #y軸の名前
+        plt.grid()  #点線の目盛りを表示
+
+        #メッシュをプロット
+        zero_list = np.zeros(len(nod_pos_glo))
+        plt.plot(nod_pos_glo,zero_list, label="$\phi(x)$", color='#0000ff')  #線分要素
+        plt.scatter(nod_pos_glo,zero_list, color='#0000ff')  #節点
+
+        if(show_text==True):
+            for n in range(len(nod_pos_glo)):  #節点番号
+                plt.text(nod_pos_glo[n],zero_list[n], 'n%d' %n, ha='center',va='bottom', color='#0000ff')
+            for e in range(len(self.nod_pos_seg)):  #線分要素番号
+                meanX = (self.nod_pos_seg[e,0] +self.nod_pos_seg[e,1])/2.0
+                plt.text(meanX, zero_list[n], 'e%d' %e, ha='center',va='top')
+
+        #グラフを表示
+        if(out_type=='show'):
+            plt.show()
+        elif(out_type=='save'):
+            plt.savefig("fem1d_mesh.png")
+            #plt.savefig('fem1d_mesh.pdf')
+        plt.close()  #作成した図のウィンドウを消す
+
+    #計算結果を表示
+    def visualize_result(self, nod_pos_glo, unknown_vec_u, eigenvalues, show_text=False, out_type='show', plot_num=(3, 4)):
+        import matplotlib.pyplot as plt  #グラフ作成
+        plt.rcParams['font.family'] = 'Times New Roman' #全体のフォントを設定
+        fig = plt.figure(figsize=(16, 12), dpi=100, facecolor='#ffffff')
+
+        fig.suptitle("FEA of 1D Helmholtz's equation", fontsize=16)  #全体のグラフタイトル
+
+        #表示する固有値・固有ベクトルの番号
+        if (self.BC_left[0]=='Dirichlet' or self.BC_right[0]=='Dirichlet'):
+            count = 0
+        else:
+            count = 1
+
+        #数値解をプロット
+        for i in range(plot_num[0]*plot_num[1]):
+            ax = fig.add_subplot(plot_num[0], plot_num[1], i+1)
+            #ax.set_title("Eig={:0.5f}".format(eigenvalues[count]))
+            ax.set_title("k={:0.5f}".format( np.sqrt(eigenvalues[count]) ))
+            ax.plot(nod_pos_glo,unknown_vec_u[:,count], color='#0000ff')  #折線グラフを作成
+            count += 1
+        plt.tight_layout()  #余白を調整
+        plt.subplots_adjust(left=None, bottom=0.05, right=None, top=0.9, wspace=0.1, hspace=0.3)  #余白を調整
+
+        #グラフを表示
+        if(out_type=='show'):
+            plt.show()
+        elif(out_type=='save'):
+            plt.savefig("fem1d_helmholtz.png")
+        plt.close()  #作成した図のウィンドウを消す
 
 
 #メイン実行部
@@ -258,41 +450,63 @@ if __name__ == '__main__':
 
     node_type = ['lattice', 500]  #格子点配置、格子分割におけるx・y方向の節点数
     #node_type = ['random', 500]  #ランダム配置、ランダム分割における節点数
+    matrix_type = 'banded'  #全体行列の形式。basic,banded
+    log_level = LOG_SUMMARY  #診断出力のレベル。LOG_SILENT,LOG_SUMMARY,LOG_DEBUG
+    telemetry_enabled = False  #処理段階ごとの計測(時間、メモリ、統計量)の有無
+    telemetry_file = 'telemetry.json'  #計測結果の出力先(JSON)
+
+    #求める固有値の範囲。all,index,value
+    plot_num = [3, 4]  #グラフの縦横の作成数
+    eigen_type = ['index', 0, plot_num[0]*plot_num[1]]  #小さい方から数えた固有値の番号の範囲(0番目から)
+    #eigen_type = ['value', 0.0, 400.0]  #固有値の値の範囲
+    #eigen_type = ['all']  #全ての固有値を求める(basicのみ)
+
+    #固有ベクトルの出力。残す固有モードの番号(求めた固有値を小さい順に並べた番号、Noneなら全て)と、出力先・型
+    output_modes = None
+    #output_modes = range(plot_num[0]*plot_num[1]+1)  #グラフに使う固有モードだけを残す
+    output_type = ['memory', 'float64']  #メモリ上に保持。型はfloat64,float32
+    #output_type = ['file', 'float32', 'eigenvectors.npy']  #.npyファイルにメモリマップで書き出す
+
+    #問題を作成。計算条件は属性として保持する
+    problem = Helmholtz1D(x_min, x_max, cons_q, BC_left, BC_right, matrix_type, eigen_type, output_modes, output_type)
 
     #節点データ生成。Global節点座標、線分要素の節点番号
-    nod_pos_glo, nod_num_seg = generate_nodes(node_type)
+    nod_pos_glo, nod_num_seg = problem.generate_nodes(node_type)
 
     #Local節点座標を作成。線分要素のLocal節点座標
-    nod_pos_seg = make_mesh_data()
+    nod_pos_seg = problem.make_mesh_data()
 
     #メッシュを表示(ポストプロセス)。番号などの有無(True,False)、グラフの表示方法(show,save)
-    visualize_mesh(nod_pos_glo, show_text=False, out_type='show')
+    problem.visualize_mesh(nod_pos_glo, show_text=False, out_type='show')
 
 
     ##### メインプロセス #####
     #計算の開始時刻を記録
-    print ("Calculation start: ", time.ctime())  #計算開始時刻を表示
+    log_print(LOG_SUMMARY, "Calculation start: ", time.ctime())  #計算開始時刻を表示
     compute_time = time.time()  #計算の開始時刻
 
     #要素方程式の構築
-    mat_A_ele, mat_B_ele = assemble_element_matrix(nod_num_seg, nod_pos_seg)
+    mat_A_ele, mat_B_ele = problem.assemble_element_matrix(nod_num_seg, nod_pos_seg)
 
     #全体方程式の構築
-    mat_A_glo, mat_B_glo = assemble_global_matrix(mat_A_ele, mat_B_ele)
+    mat_A_glo, mat_B_glo = problem.assemble_global_matrix(mat_A_ele, mat_B_ele)
 
     #境界要素の情報を設定
-    BC_type, BC_value = make_boundary_info(nod_pos_seg)
+    BC_type, BC_value = problem.make_boundary_info(nod_pos_seg)
 
     #境界条件を実装
-    mat_A_glo, mat_B_glo = set_boundary_condition(mat_A_glo, mat_B_glo, BC_type, BC_value)
+    mat_A_glo, mat_B_glo = problem.set_boundary_condition(mat_A_glo, mat_B_glo, BC_type, BC_value)
 
     #連立方程式を解く
-    unknown_vec_u, eigenvalues = solve_simultaneous_equations(mat_A_glo, mat_B_glo)
+    unknown_vec_u, eigenvalues = problem.solve_simultaneous_equations(mat_A_glo, mat_B_glo)
 
     #計算時間の表示
     compute_time = time.time() -compute_time
-    print ("Calculation time: {:0.5f}[sec]".format(compute_time))
+    log_print(LOG_SUMMARY, "Calculation time: {:0.5f}[sec]".format(compute_time))
+
+    #処理段階ごとの計測結果をJSONで書き出す
+    if(telemetry_enabled):
+        write_telemetry(telemetry_file, script='fem1d_helmholtz', node_type=node_type, matrix_type=matrix_type, compute_time=compute_time)
 
     #計算結果を表示(ポストプロセス)。番号などの有無(True,False)、グラフの表示方法(show,save)
-    plot_num = [3, 4]  #グラフの縦横の作成数
-    visualize_result(nod_pos_glo, unknown_vec_u, show_text=False, out_type='show')
+    problem.visualize_result(nod_pos_glo, unknown_vec_u, eigenvalues, show_text=False, out_type='show', plot_num=plot_num)
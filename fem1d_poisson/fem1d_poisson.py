@@ -2,231 +2,353 @@
 #常微分方程式： d/dx[p(x)du(x)/dx] = f(x)  (x_min<x<x_max)
 #境界条件： u(x_min)=alpha,  du(x_max)/dx=beta
 import time  #時刻を扱うライブラリ
+import functools  #計測用のデコレータ
+import json  #計測結果の書き出し
+import tracemalloc  #メモリ使用量の計測
 import numpy as np  #NumPyライブラリ
-import scipy.linalg  #SciPyの線形計算ライブラリ
-import matplotlib.pyplot as plt  #データ可視化ライブラリ
+#SciPyのサブモジュールとMatplotlibは、使う関数の中で読み込む(計算だけなら描画用のモジュールは読み込まない)
+
+
+#診断出力のレベル。silent:何も表示しない、summary:処理の流れと要約のみ、debug:配列や行列の中身も表示
+LOG_SILENT, LOG_SUMMARY, LOG_DEBUG = 0, 1, 2
+log_level = LOG_SUMMARY
+log_edgeitems = 3  #debugで配列を表示する場合の、先頭と末尾の要素数
+
+
+#診断出力。levelがlog_level以下の場合のみ表示する
+#引数に関数を渡した場合は、表示する時にだけ呼び出す(表示しない文字列は作らない)
+def log_print(level, *args):
+    if(level <= log_level):
+        print(*[arg() if callable(arg) else arg for arg in args])
+
+
+#配列の診断出力。大きな配列は先頭と末尾のlog_edgeitems個だけに切り詰める
+def log_array(level, title, array):
+    if(level <= log_level):
+        print(title)
+        print(np.array2string(np.asarray(array), threshold=2*log_edgeitems, edgeitems=log_edgeitems))
+
+
+#全体行列の診断出力。左上の10行10列(と右辺ベクトル)だけを取り出して表示する。matrix_typeは全体行列の形式(basic,banded)
+def log_matrix(level, title, mat, vec=None, matrix_type='basic'):
+    if(level <= log_level):
+        print(title)
+        if(matrix_type=='banded'):
+            mat_head = mat[:,:10].T  #帯行列形式は10列目まで(上側、対角、下側)
+        else:
+            mat_head = mat[:10,:10]
+        for i in range(len(mat_head)):
+            line = "".join("{:7.2f}".format(value) for value in mat_head[i])
+            if(vec is not None):
+                line += ";" +"".join("{:7.2f}".format(value) for value in np.atleast_1d(vec[i]))
+            print(line)
+
+
+#処理段階ごとの計測結果(壁時計時間、CPU時間、メモリ使用量のピーク)と、問題の統計量。JSONで書き出す
+telemetry_enabled = False
+telemetry = {'stages':{}, 'statistics':{}}
+
+
+#計測結果を空にする
+def reset_telemetry():
+    telemetry['stages'].clear()
+    telemetry['statistics'].clear()
+
+
+#問題の統計量(節点数、要素数、非ゼロ成分数、フィルイン、反復回数など)を記録
+def record_statistics(**statistics):
+    if(telemetry_enabled):
+        telemetry['statistics'].update(statistics)
+
+
+#処理段階の関数を計測するデコレータ。同じ段階を複数回呼んだ場合は、時間を合計してピークは最大値を残す
+#メモリはtracemallocで追跡した確保量(NumPy配列を含む)のうち、段階の開始時から増えた分のピーク
+def measure_stage(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if(not telemetry_enabled):
+            return func(*args, **kwargs)
+        if(not tracemalloc.is_tracing()):
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+        wall_time, cpu_time = time.perf_counter(), time.process_time()
+
+        result = func(*args, **kwargs)
+
+        wall_time, cpu_time = time.perf_counter() -wall_time, time.process_time() -cpu_time
+        peak_memory = tracemalloc.get_traced_memory()[1] -memory_start
+        stage = telemetry['stages'].setdefault(func.__name__, {'calls':0, 'wall_time':0.0, 'cpu_time':0.0, 'peak_memory':0})
+        stage['calls'] += 1
+        stage['wall_time'] += wall_time
+        stage['cpu_time'] += cpu_time
+        stage['peak_memory'] = max(stage['peak_memory'], peak_memory)
+        log_print(LOG_SUMMARY, lambda: 'Stage {}: wall = {:0.5f}[sec], cpu = {:0.5f}[sec], peak memory = {:0.3f}[MB]'.format(
+                  func.__name__, wall_time, cpu_time, peak_memory/2**20))
+        return result
+    return wrapper
+
+
+#計測結果をJSONで書き出す。run_infoには計算条件(節点の生成方法など)を渡す
+def write_telemetry(file_path, **run_info):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(run_info, **telemetry), f, indent=2, ensure_ascii=False)
+
+
+#1次元Poisson方程式の問題。計算条件とメッシュを属性に保持し、1つのプロセスの中で何度でも解ける
+#計算条件は解く前に書き換えてもよい。メッシュを省略して解くと、前回のメッシュを使い回す
+class Poisson1D:
+    def __init__(self, x_min=-1.0, x_max=1.0, func_f=1.0, BC_left=('Dirichlet', 0.0), BC_right=('Neumann', 1.0),
+                 matrix_type='banded'):
+        self.x_min, self.x_max = x_min, x_max  #計算領域のXの最小値、最大値
+        self.func_f = func_f  #定数関数f
+        self.BC_left, self.BC_right = BC_left, BC_right  #左部(x=x_min)、右部(x=x_max)の、境界の種類(Dirichlet,Neumann)と値
+        self.matrix_type = matrix_type  #全体行列の形式。basic,banded
+
+    #メッシュを作成する。Global節点座標、線分要素の節点番号、Local節点座標を属性に保持する
+    def set_mesh(self, node_type):
+        self.generate_nodes(node_type)
+        self.make_mesh_data()
+
+    #要素方程式の構築から連立方程式の求解までを行い、未知数ベクトルを返す
+    #node_typeを省略した場合は、前回作成したメッシュを使い回す
+    def solve(self, node_type=None):
+        if(node_type is not None):
+            self.set_mesh(node_type)
+
+        mat_A_ele, vec_b_ele = self.assemble_element_matrix(self.nod_num_seg, self.nod_pos_seg)
+        mat_A_glo, vec_b_glo = self.assemble_global_matrix(mat_A_ele, vec_b_ele)
+        BC_type, BC_value = self.make_boundary_info(self.nod_pos_seg)
+        mat_A_glo, vec_b_glo = self.set_boundary_condition(mat_A_glo, vec_b_glo, BC_type, BC_value)
+        return self.solve_simultaneous_equations(mat_A_glo, vec_b_glo)
+
+    #節点データを生成
+    @measure_stage
+    def generate_nodes(self, node_type):
+        node_total = node_type[1]  #節点数(>=2)
+        ele_total = node_total-1  #要素数
+
+        #格子点配置
+        if (node_type[0]=='lattice'):
+            #Global節点のx座標を定義(x_min〜x_max)
+            lattice_num = node_type[1]  #格子点分割における節点数
+            nod_pos_glo = np.linspace(self.x_min,self.x_max, lattice_num) #計算領域を等分割
+
+        #ランダム配置
+        elif (node_type[0]=='random'):
+            random_num = node_type[1]  #ランダム分割における節点数
+            nod_pos_glo = np.random.rand(random_num)  #[0~1]の点をrandom_num個生成
+            nod_pos_glo = np.sort(nod_pos_glo)  #昇順(小さい順)にソート
+            nod_pos_glo = self.x_min +(self.x_max-self.x_min)*nod_pos_glo
+
+            #隅に点を移動
+            if (2<=random_num):
+                nod_pos_glo[0] = self.x_min
+                nod_pos_glo[node_total-1] = self.x_max
+
+        log_array(LOG_DEBUG, 'Global節点のx,y座標', nod_pos_glo)
+
+        #各線分要素のGlobal節点番号
+        nod_num_seg = np.empty((ele_total,2), np.int64)
+        nod_num_seg[:,0] = np.arange(ele_total)
+        nod_num_seg[:,1] = np.arange(1, ele_total+1)
+        log_array(LOG_DEBUG, '線分要素を構成するGlobal節点番号', nod_num_seg)
+
+        record_statistics(nod_total=int(len(nod_pos_glo)), seg_ele_total=int(len(nod_num_seg)))
+        self.nod_pos_glo, self.nod_num_seg = nod_pos_glo, nod_num_seg
+        return nod_pos_glo, nod_num_seg
+
+    #入力データの用意
+    @measure_stage
+    def make_mesh_data(self):
+        #print("node_total = ",node_total, ",  ele_total = ",ele_total)
+
+        #各線分要素のLocal節点のx座標
+        nod_pos_seg = self.nod_pos_glo[self.nod_num_seg]  #[ele_total,2]
+        log_array(LOG_DEBUG, '線分要素を構成するLocal節点座標', nod_pos_seg)
+
+        self.nod_pos_seg = nod_pos_seg
+        return nod_pos_seg
+
+    #要素方程式を構築
+    @measure_stage
+    def assemble_element_matrix(self, nod_num_seg, nod_pos_seg):
+        #各線分要素の長さ
+        length = np.absolute( nod_pos_seg[:,1] -nod_pos_seg[:,0] )
+        log_array(LOG_DEBUG, "Element length", length)
+
+        #全要素の要素行列を一括で計算
+        log_print(LOG_SUMMARY, "Local matrix")
+        mat_A_ele = np.array([[1.0,-1.0],[-1.0,1.0]]) / length[:,np.newaxis,np.newaxis]  #要素係数行列[ele_total,2,2]
+        vec_b_ele = np.repeat((-self.func_f *length/2.0)[:,np.newaxis], 2, axis=1)  #要素係数ベクトル[ele_total,2]
+
+        return mat_A_ele, vec_b_ele
+
+    #全体方程式を構築
+    @measure_stage
+    def assemble_global_matrix(self, mat_A_ele, vec_b_ele):
+        #全要素の(i,j)成分に対応するGlobal節点番号
+        nod_total = len(self.nod_pos_glo)
+        row_glo = np.repeat(self.nod_num_seg, 2, axis=1).ravel()  #成分(e,i,j)の行番号nod_num_seg[e,i]
+        col_glo = np.tile(self.nod_num_seg, (1,2)).ravel()  #成分(e,i,j)の列番号nod_num_seg[e,j]
+
+        #要素行列から全体行列を組み立てる（同じ位置の成分は足し合わされる）
+        log_print(LOG_SUMMARY, "Global matrix (constructed)")
+        if(self.matrix_type=='basic'):
+            mat_A_glo = np.bincount(row_glo*nod_total +col_glo, weights=mat_A_ele.ravel(),
+                                    minlength=nod_total*nod_total).reshape(nod_total,nod_total)  #全体係数行列
+        elif(self.matrix_type=='banded'):
+            #帯行列形式[3,nod_total]。成分(i,j)は[1+i-j,j]に格納する(0行目が上側、1行目が対角、2行目が下側の対角線)
+            mat_A_glo = np.bincount((1 +row_glo -col_glo)*nod_total +col_glo, weights=mat_A_ele.ravel(),
+                                    minlength=3*nod_total).reshape(3,nod_total)  #全体係数行列
+        vec_b_glo = np.bincount(self.nod_num_seg.ravel(), weights=vec_b_ele.ravel(), minlength=nod_total)  #全体係数ベクトル
+        log_matrix(LOG_DEBUG, "Pre global matrix", mat_A_glo, vec_b_glo, matrix_type=self.matrix_type)
+        record_statistics(nnz=int(np.count_nonzero(mat_A_glo)))  #帯行列形式でも、格納された非ゼロ成分の個数
+
+        return mat_A_glo, vec_b_glo
 
+    #境界要素の情報を設定
+    @measure_stage
+    def make_boundary_info(self, nod_pos_seg):
+        BC_type = [""]*2
+        BC_value = [""]*2
 
-#節点データを生成
-def generate_nodes(node_type):
-    node_total = node_type[1]  #節点数(>=2)
-    ele_total = node_total-1  #要素数
-
-    #格子点配置
-    if (node_type[0]=='lattice'):
-        #Global節点のx座標を定義(x_min〜x_max)
-        lattice_num = node_type[1]  #格子点分割における節点数
-        nod_pos_glo = np.linspace(x_min,x_max, lattice_num) #計算領域を等分割
-
-    #ランダム配置
-    elif (node_type[0]=='random'):
-        random_num = node_type[1]  #ランダム分割における節点数
-        nod_pos_glo = np.random.rand(random_num)  #[0~1]の点をrandom_num個生成
-        nod_pos_glo = np.sort(nod_pos_glo)  #昇順(小さい順)にソート
-        nod_pos_glo = x_min +(x_max-x_min)*nod_pos_glo
-
-        #隅に点を移動
-        if (2<=random_num):
-            nod_pos_glo[0] = x_min
-            nod_pos_glo[node_total-1] = x_max
-
-    print('Global節点のx,y座標\n', nod_pos_glo)
+        #左側境界
+        BC_type[0] = self.BC_left[0]
+        BC_value[0] = self.BC_left[1]
 
-    #各線分要素のGlobal節点番号
-    nod_num_seg = np.empty((ele_total,2), np.int)
-    for e in range(ele_total):
-        nod_num_seg[e,0] = e
-        nod_num_seg[e,1] = e+1
-    print('線分要素を構成するGlobal節点番号\n', nod_num_seg)
+        #右側境界
+        BC_type[1] = self.BC_right[0]
+        BC_value[1] = self.BC_right[1]
 
-    return nod_pos_glo, nod_num_seg
+        log_array(LOG_DEBUG, 'BC_type =', BC_type)
 
+        return BC_type, BC_value
 
-#入力データの用意
-def make_mesh_data():
-    #print("node_total = ",node_total, ",  ele_total = ",ele_total)
+    #境界条件を実装
+    @measure_stage
+    def set_boundary_condition(self, mat_A_glo, vec_b_glo, BC_type, BC_value):
+        BC_nod = [0,len(self.nod_pos_glo)-1]
+        record_statistics(dirichlet_nod_total=int(BC_type.count('Dirichlet')), neumann_nod_total=int(BC_type.count('Neumann')))
 
-    #各線分要素のLocal節点のx座標
-    print('線分要素を構成するLocal節点座標')
-    nod_pos_seg = np.empty((len(nod_num_seg),2), np.float64)
-    for e in range(len(nod_num_seg)):
+        #各要素の各節点に対応したGlobal節点に対して処理する
+        log_print(LOG_SUMMARY, 'Boundary conditions')
         for n in range(2):
-            nod_pos_seg[e,n] = nod_pos_glo[ nod_num_seg[e,n] ]
-    print(nod_pos_seg)
-
-    return nod_pos_seg
-
-
-#要素方程式を構築
-def assemble_element_matrix(nod_num_seg, nod_pos_seg):
-    #各線分要素の長さ
-    print("Element length")
-    length = np.empty(len(nod_num_seg), np.float64)
-    for e in range(len(nod_num_seg)):
-        length[e] = np.absolute( nod_pos_seg[e,1] -nod_pos_seg[e,0] )
-    print(length)
+            if(BC_type[n]=='Dirichlet' and self.matrix_type=='basic'):
+                vec_b_glo[:] -= BC_value[n]*mat_A_glo[BC_nod[n], :]  #移項
+                vec_b_glo[BC_nod[n]] = BC_value[n]  #関数を任意の値で固定
+                mat_A_glo[BC_nod[n], :] = 0.0  #行を全て0にする
+                mat_A_glo[:, BC_nod[n]] = 0.0  #列を全て0にする
+                mat_A_glo[BC_nod[n], BC_nod[n]] = 1.0  #対角成分は1にする
+
+            if(BC_type[n]=='Dirichlet' and self.matrix_type=='banded'):
+                #帯行列形式では、節点BC_nod[n]の列は[0:3,BC_nod[n]]、行の非対角成分は[2,BC_nod[n]-1]と[0,BC_nod[n]+1]
+                nod = BC_nod[n]
+                nod_band = np.arange(max(nod-1,0), min(nod+2,len(self.nod_pos_glo)))  #節点nodと結合する節点
+                vec_b_glo[nod_band] -= BC_value[n]*mat_A_glo[1+nod_band-nod, nod]  #移項
+                vec_b_glo[nod] = BC_value[n]  #関数を任意の値で固定
+                mat_A_glo[1+nod-nod_band, nod_band] = 0.0  #行を全て0にする
+                mat_A_glo[1+nod_band-nod, nod] = 0.0  #列を全て0にする
+                mat_A_glo[1, nod] = 1.0  #対角成分は1にする
+
+            if (BC_type[n]=='Neumann'):  #Neumann境界条件の処理
+                vec_b_glo[BC_nod[n]] += BC_value[n]  #関数を任意の傾きで固定
+
+        log_matrix(LOG_DEBUG, "Post global matrix", mat_A_glo, vec_b_glo, matrix_type=self.matrix_type)
+
+        return mat_A_glo, vec_b_glo
 
-    #要素行列の初期化
-    mat_A_ele = np.zeros((len(nod_num_seg),2,2), np.float64)  #要素係数行列(ゼロで初期化)
-    vec_b_ele = np.zeros((len(nod_num_seg),2), np.float64)  #要素係数ベクトル(ゼロで初期化)
-
-    #要素行列の各成分を計算
-    print("Local matrix")
-    for e in range(len(nod_num_seg)):
-        for i in range(2):
-            for j in range(2):
-                mat_A_ele[e,i,j] = ( (-1)**(i+1) *(-1)**(j+1) ) / length[e]
-            vec_b_ele[e,i] = -func_f *length[e]/2.0
-
-    return mat_A_ele, vec_b_ele
-
-
-#全体方程式を構築
-def assemble_global_matrix(mat_A_ele, vec_b_ele):
-    #全体行列の初期化
-    mat_A_glo = np.zeros((len(nod_pos_glo),len(nod_pos_glo)), np.float64) #全体係数行列(ゼロで初期化)
-    vec_b_glo = np.zeros(len(nod_pos_glo), np.float64) #全体係数ベクトル(ゼロで初期化)
-
-    #要素行列から全体行列を組み立てる
-    print("Global matrix (constructed)")
-    for e in range(len(nod_num_seg)):
-        for i in range(2):
-            for j in range(2):
-                mat_A_glo[ nod_num_seg[e,i], nod_num_seg[e,j] ] += mat_A_ele[e,i,j]
-            vec_b_glo[ nod_num_seg[e,i] ] += vec_b_ele[e,i]
-    print(np.concatenate((mat_A_glo, np.reshape(vec_b_glo, (-1,1))), axis=1))
-
-    return mat_A_glo, vec_b_glo
-
-
-#境界要素の情報を設定
-def make_boundary_info(nod_pos_seg):
-    BC_type = [""]*2
-    BC_value = [""]*2
-
-    #左側境界
-    BC_type[0] = BC_left[0]
-    BC_value[0] = BC_left[1]
-
-    #右側境界
-    BC_type[1] = BC_right[0]
-    BC_value[1] = BC_right[1]
-
-    print('BC_type =\n', BC_type)
-
-    return BC_type, BC_value
-
-
-#境界条件を実装
-def set_boundary_condition(mat_A_glo, vec_b_glo, BC_type, BC_value):
-    BC_nod = [0,len(nod_pos_glo)-1]
-
-    #各要素の各節点に対応したGlobal節点に対して処理する
-    print('Boundary conditions')
-    for n in range(2):
-        if(BC_type[n]=='Dirichlet'):
-            vec_b_glo[:] -= BC_value[n]*mat_A_glo[BC_nod[n], :]  #移項
-            vec_b_glo[BC_nod[n]] = BC_value[n]  #関数を任意の値で固定
-            mat_A_glo[BC_nod[n], :] = 0.0  #行を全て0にする
-            mat_A_glo[:, BC_nod[n]] = 0.0  #列を全て0にする
-            mat_A_glo[BC_nod[n], BC_nod[n]] = 1.0  #対角成分は1にする
-
-        if (BC_type[n]=='Neumann'):  #Neumann境界条件の処理
-            vec_b_glo[BC_nod[n]] += BC_value[n]  #関数を任意の傾きで固定
-
-    print("Post global matrix")
-    print(np.concatenate((mat_A_glo, np.reshape(vec_b_glo, (-1,1))), axis=1))
-
-    return mat_A_glo, vec_b_glo
-
-
-#連立方程式を解く
-def solve_simultaneous_equations(mat_A_glo, vec_b_glo):
-    print('節点数、境界線分要素数')
-    print(len(nod_pos_glo), len(nod_pos_seg))
-    #print('detA = ', scipy.linalg.det(mat_A_glo))  #Aの行列式
-    #print('Rank A = ', np.linalg.matrix_rank(mat_A_glo))  #AのRank(階数)
-    #print('Inverse A = ', scipy.linalg.inv(mat_A_glo))  #Aの逆行列
-
-    #未知数ベクトル
-    print('Unkown vector u = ')
-    unknown_vec_u = scipy.linalg.solve(mat_A_glo,vec_b_glo)  #Au=bから、未知数ベクトルuを求める
-    print(unknown_vec_u)
-    print('Max u = ', max(unknown_vec_u), ',  Min u = ',min(unknown_vec_u))  #uの最大値、最小値
-
-    return unknown_vec_u
-
-
-#メッシュを表示
-def visualize_mesh(nod_pos_glo, show_text, out_type):
-    #plt.rcParams['font.family'] = 'Times New Roman'  #全体のフォントを設定
-    fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
-
-    #plt.title("Finite element analysis of 1D Poisson's equation")  #グラフタイトル
-    plt.xlabel("$x$")  #x軸の名前
-    plt.ylabel("$u(x)$")  #y軸の名前
-    plt.grid()  #点線の目盛りを表示
-
-    #メッシュをプロット
-    zero_list = np.zeros(len(nod_pos_glo))
-    plt.plot(nod_pos_glo,zero_list, label="$\phi(x)$", color='#0000ff')  #線分要素
-    plt.scatter(nod_pos_glo,zero_list, color='#0000ff')  #節点
-
-    if(show_text==True):
-        for n in range(len(nod_pos_glo)):  #節点番号
-            plt.text(nod_pos_glo[n],zero_list[n], 'n%d' %n, ha='center',va='bottom', color='#0000ff')
-        for e in range(len(nod_pos_seg)):  #線分要素番号
-            meanX = (nod_pos_seg[e,0] +nod_pos_seg[e,1])/2.0
-            plt.text(meanX, zero_list[n], 'e%d' %e, ha='center',va='top')
-
-    #グラフを表示
-    if(out_type=='show'):
-        plt.show()
-    elif(out_type=='save'):
-        plt.savefig("fem1d_mesh.png")
-        #plt.savefig('fem1d_mesh.pdf')
-    plt.close()  #作成した図のウィンドウを消す
-
-
-#計算結果を表示
-def visualize_result(nod_pos_glo, unknown_vec_u, show_text, out_type):
-    #plt.rcParams['font.family'] = 'Times New Roman'  #全体のフォントを設定
-    fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
-
-    #plt.title("Finite element analysis of 1D Poisson's equation")  #グラフタイトル
-    plt.xlabel("$x$")  #x軸の名前
-    plt.ylabel("$u(x)$")  #y軸の名前
-    plt.grid()  #点線の目盛りを表示
-
-    #解析解をプロット
-    if (BC_left[0]=='Dirichlet' and BC_right[0]=='Neumann'):
-        exact_x = np.arange(x_min,x_max,0.01)
-        exact_y = (func_f/2)*exact_x**2 +(-func_f*x_max +BC_right[1])*exact_x \
-                 -(func_f/2)*x_min**2 -(-func_f*x_max +BC_right[1])*x_min +BC_left[1]
-        plt.plot(exact_x,exact_y, label="$u(x)$", color='#ff0000')  #折線グラフを作成
-
-    #数値解をプロット
-    plt.plot(nod_pos_glo,unknown_vec_u, label="$\hat{u}(x)$", color='#0000ff')  #折線グラフを作成
-    plt.scatter(nod_pos_glo,unknown_vec_u)  #点グラフを作成
-
-    #更に体裁を整える
-    plt.legend(loc='best')  #凡例(グラフラベル)を表示
-
-    if(show_text==True):
-        for n in range(len(nod_pos_glo)):  #節点番号
-            plt.text(nod_pos_glo[n],unknown_vec_u[n], 'n%d' %n, ha='center',va='bottom', color='#0000ff')
-        for e in range(len(nod_pos_seg)):  #線分要素番号
-            meanX = (nod_pos_seg[e,0] +nod_pos_seg[e,1])/2.0
-            meanU = (unknown_vec_u[nod_num_seg[e,0]] +unknown_vec_u[nod_num_seg[e,1]])/2.0
-            plt.text(meanX, meanU, 'e%d' %e, ha='center',va='top')
-
-    #グラフを表示
-    if(out_type=='show'):
-        plt.show()
-    elif(out_type=='save'):
-        plt.savefig("fem1d_poisson.png")
-        #plt.savefig('fem1d_poisson.pdf')
-    plt.close()  #作成した図のウィンドウを消す
+    #連立方程式を解く
+    @measure_stage
+    def solve_simultaneous_equations(self, mat_A_glo, vec_b_glo):
+        import scipy.linalg  #SciPyの線形計算ライブラリ
+        log_print(LOG_SUMMARY, '節点数、境界線分要素数')
+        log_print(LOG_SUMMARY, len(self.nod_pos_glo), len(self.nod_pos_seg))
+        #print('detA = ', scipy.linalg.det(mat_A_glo))  #Aの行列式
+        #print('Rank A = ', np.linalg.matrix_rank(mat_A_glo))  #AのRank(階数)
+        #print('Inverse A = ', scipy.linalg.inv(mat_A_glo))  #Aの逆行列
+
+        #未知数ベクトル
+        if(self.matrix_type=='basic'):
+            unknown_vec_u = scipy.linalg.solve(mat_A_glo,vec_b_glo)  #Au=bから、未知数ベクトルuを求める
+        elif(self.matrix_type=='banded'):
+            unknown_vec_u = scipy.linalg.solve_banded((1,1), mat_A_glo,vec_b_glo)  #三重対角行列として解く
+        log_array(LOG_DEBUG, 'Unkown vector u = ', unknown_vec_u)
+        log_print(LOG_SUMMARY, 'Max u = ', np.max(unknown_vec_u), ',  Min u = ',np.min(unknown_vec_u))  #uの最大値、最小値
+
+        return unknown_vec_u
+
+    #メッシュを表示
+    def visualize_mesh(self, nod_pos_glo, show_text, out_type):
+        import matplotlib.pyplot as plt  #グラフ作成
+        #plt.rcParams['font.family'] = 'Times New Roman'  #全体のフォントを設定
+        fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
+
+        #plt.title("Finite element analysis of 1D Poisson's equation")  #グラフタイトル
+        plt.xlabel("$x$")  #x軸の名前
+        plt.ylabel("$u(x)$")  #y軸の名前
+        plt.grid()  #点線の目盛りを表示
+
+        #メッシュをプロット
+        zero_list = np.zeros(len(nod_pos_glo))
+        plt.plot(nod_pos_glo,zero_list, label="$\phi(x)$", color='#0000ff')  #線分要素
+        plt.scatter(nod_pos_glo,zero_list, color='#0000ff')  #節点
+
+        if(show_text==True):
+            for n in range(len(nod_pos_glo)):  #節点番号
+                plt.text(nod_pos_glo[n],zero_list[n], 'n%d' %n, ha='center',va='bottom', color='#0000ff')
+            for e in range(len(self.nod_pos_seg)):  #線分要素番号
+                meanX = (self.nod_pos_seg[e,0] +self.nod_pos_seg[e,1])/2.0
+                plt.text(meanX, zero_list[n], 'e%d' %e, ha='center',va='top')
+
+        #グラフを表示
+        if(out_type=='show'):
+            plt.show()
+        elif(out_type=='save'):
+            plt.savefig("fem1d_mesh.png")
+            #plt.savefig('fem1d_mesh.pdf')
+        plt.close()  #作成した図のウィンドウを消す
+
+    #計算結果を表示
+    def visualize_result(self, nod_pos_glo, unknown_vec_u, show_text, out_type):
+        import matplotlib.pyplot as plt  #グラフ作成
+        #plt.rcParams['font.family'] = 'Times New Roman'  #全体のフォントを設定
+        fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
+
+        #plt.title("Finite element analysis of 1D Poisson's equation")  #グラフタイトル
+        plt.xlabel("$x$")  #x軸の名前
+        plt.ylabel("$u(x)$")  #y軸の名前
+        plt.grid()  #点線の目盛りを表示
+
+        #解析解をプロット
+        if (self.BC_left[0]=='Dirichlet' and self.BC_right[0]=='Neumann'):
+            exact_x = np.arange(self.x_min,self.x_max,0.01)
+            exact_y = (self.func_f/2)*exact_x**2 +(-self.func_f*self.x_max +self.BC_right[1])*exact_x \
+                     -(self.func_f/2)*self.x_min**2 -(-self.func_f*self.x_max +self.BC_right[1])*self.x_min +self.BC_left[1]
+            plt.plot(exact_x,exact_y, label="$u(x)$", color='#ff0000')  #折線グラフを作成
+
+        #数値解をプロット
+        plt.plot(nod_pos_glo,unknown_vec_u, label="$\hat{u}(x)$", color='#0000ff')  #折線グラフを作成
+        plt.scatter(nod_pos_glo,unknown_vec_u)  #点グラフを作成
+
+        #更に体裁を整える
+        plt.legend(loc='best')  #凡例(グラフラベル)を表示
+
+        if(show_text==True):
+            for n in range(len(nod_pos_glo)):  #節点番号
+                plt.text(nod_pos_glo[n],unknown_vec_u[n], 'n%d' %n, ha='center',va='bottom', color='#0000ff')
+            for e in range(len(self.nod_pos_seg)):  #線分要素番号
+                meanX = (self.nod_pos_seg[e,0] +self.nod_pos_seg[e,1])/2.0
+                meanU = (unknown_vec_u[self.nod_num_seg[e,0]] +unknown_vec_u[self.nod_num_seg[e,1]])/2.0
+                plt.text(meanX, meanU, 'e%d' %e, ha='center',va='top')
+
+        #グラフを表示
+        if(out_type=='show'):
+            plt.show()
+        elif(out_type=='save'):
+            plt.savefig("fem1d_poisson.png")
+            #plt.savefig('fem1d_poisson.pdf')
+        plt.close()  #作成した図のウィンドウを消す
 
 
 #メイン実行部
@@ -243,40 +365,51 @@ if __name__ == '__main__':
 
     node_type = ['lattice', 10]  #格子点配置、格子分割におけるx・y方向の節点数
     #node_type = ['random', 10]  #ランダム配置、ランダム分割における節点数
+    matrix_type = 'banded'  #全体行列の形式。basic,banded
+    log_level = LOG_SUMMARY  #診断出力のレベル。LOG_SILENT,LOG_SUMMARY,LOG_DEBUG
+    telemetry_enabled = False  #処理段階ごとの計測(時間、メモリ、統計量)の有無
+    telemetry_file = 'telemetry.json'  #計測結果の出力先(JSON)
+
+    #問題を作成。計算条件は属性として保持する
+    problem = Poisson1D(x_min, x_max, func_f, BC_left, BC_right, matrix_type)
 
     #節点データ生成。Global節点座標、線分要素の節点番号
-    nod_pos_glo, nod_num_seg = generate_nodes(node_type)
+    nod_pos_glo, nod_num_seg = problem.generate_nodes(node_type)
 
     #Local節点座標を作成。線分要素のLocal節点座標
-    nod_pos_seg = make_mesh_data()
+    nod_pos_seg = problem.make_mesh_data()
 
     #メッシュを表示(ポストプロセス)。番号などの有無(True,False)、グラフの表示方法(show,save)
-    visualize_mesh(nod_pos_glo, show_text=True, out_type='show')
+    problem.visualize_mesh(nod_pos_glo, show_text=True, out_type='show')
 
 
     ##### メインプロセス #####
     #計算の開始時刻を記録
-    print ("Calculation start: ", time.ctime())  #計算開始時刻を表示
+    log_print(LOG_SUMMARY, "Calculation start: ", time.ctime())  #計算開始時刻を表示
     compute_time = time.time()  #計算の開始時刻
 
     #要素方程式の構築
-    mat_A_ele, vec_b_ele = assemble_element_matrix(nod_num_seg, nod_pos_seg)
+    mat_A_ele, vec_b_ele = problem.assemble_element_matrix(nod_num_seg, nod_pos_seg)
 
     #全体方程式の構築
-    mat_A_glo, vec_b_glo = assemble_global_matrix(mat_A_ele, vec_b_ele)
+    mat_A_glo, vec_b_glo = problem.assemble_global_matrix(mat_A_ele, vec_b_ele)
 
     #境界要素の情報を設定
-    BC_type, BC_value = make_boundary_info(nod_pos_seg)
+    BC_type, BC_value = problem.make_boundary_info(nod_pos_seg)
 
     #境界条件を実装
-    mat_A_glo, vec_b_glo = set_boundary_condition(mat_A_glo, vec_b_glo, BC_type, BC_value)
+    mat_A_glo, vec_b_glo = problem.set_boundary_condition(mat_A_glo, vec_b_glo, BC_type, BC_value)
 
     #連立方程式を解く
-    unknown_vec_u = solve_simultaneous_equations(mat_A_glo, vec_b_glo)
+    unknown_vec_u = problem.solve_simultaneous_equations(mat_A_glo, vec_b_glo)
 
     #計算時間の表示
     compute_time = time.time() -compute_time
-    print ("Calculation time: {:0.5f}[sec]".format(compute_time))
+    log_print(LOG_SUMMARY, "Calculation time: {:0.5f}[sec]".format(compute_time))
+
+    #処理段階ごとの計測結果をJSONで書き出す
+    if(telemetry_enabled):
+        write_telemetry(telemetry_file, script='fem1d_poisson', node_type=node_type, matrix_type=matrix_type, compute_time=compute_time)
 
     #計算結果を表示(ポストプロセス)。番号などの有無(True,False)、グラフの表示方法(show,save)
-    visualize_result(nod_pos_glo, unknown_vec_u, show_text=False, out_type='show')
+    problem.visualize_result(nod_pos_glo, unknown_vec_u, show_text=False, out_type='show')
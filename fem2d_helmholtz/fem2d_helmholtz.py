@@ -1,331 +1,1049 @@
 #2次元Helmholtz方程式を、有限要素法で解く
 #偏微分方程式： ∇・[p(x,y)∇u(x,y)] +q(x,y)u(x,y) = f(x,y)  (in Ω)
 #境界条件： u(x,y)=alpha  (on Γ1),  du(x,y)/dx=beta  (on Γ2)
+import os  #保存先のファイル操作
+import sys  #読み込み済みのモジュール
 import time  #時刻を扱うライブラリ
+import functools  #計測用のデコレータ
+import json  #計測結果の書き出し
+import tracemalloc  #メモリ使用量の計測
+import hashlib  #保存したメッシュと計算結果のハッシュ値
 import numpy as np  #数値計算用
-import scipy.spatial  #ドロネー分割
-import scipy.linalg  #SciPyの線形計算ソルバー
-import scipy.sparse  #圧縮行列の処理
-import scipy.sparse.linalg  #圧縮行列用ソルバー
-import matplotlib.pyplot as plt  #グラフ作成
-from mpl_toolkits.mplot3d import Axes3D  #3Dグラフ
-from matplotlib import cm  #カラーマップ
-
-
-#節点データを生成
-def generate_nodes(node_type):
-    #格子点配置
-    if (node_type[0]=='lattice'):
-        lattice_num = node_type[1]  #格子分割におけるx・y方向の節点数
-        x = np.linspace(x_min, x_max, lattice_num)
-        y = np.linspace(y_min, y_max, lattice_num)
-
-        nodes = np.empty((lattice_num*lattice_num,2), np.float64)
-        for j in range(lattice_num):
-            for i in range(lattice_num):
-                nodes[i +lattice_num*j, 0] = x[i]
-                nodes[i +lattice_num*j, 1] = y[j]
-
-    #ランダム配置
-    elif (node_type[0]=='random'):
-        random_num = node_type[1]  #ランダム分割における節点数
-        nodes = np.random.rand(random_num,2)  #[0~1,0~1]の点をrandom_num個生成
-        nodes[:,0] = x_min +(x_max-x_min)*nodes[:,0]
-        nodes[:,1] = y_min +(y_max-y_min)*nodes[:,1]
-
-        #隅に点を移動
-        if (4<=random_num):
-            nodes[0,0],nodes[0,1] = (x_min, (y_max+y_min)/2)
-            nodes[1,0],nodes[1,1] = (x_max, (y_max+y_min)/2)
-            nodes[2,0],nodes[2,1] = ((x_max+x_min)/2, y_min)
-            nodes[3,0],nodes[3,1] = ((x_max+x_min)/2, y_max)
-            '''nodes[4,0],nodes[4,1] = (x_min, y_min)
-            nodes[5,0],nodes[5,1] = (x_min, y_max)
-            nodes[6,0],nodes[6,1] = (x_max, y_min)
-            nodes[7,0],nodes[7,1] = (x_max, y_max)  #'''
-
-    #節点をドロネー分割
-    delaunay_data = scipy.spatial.Delaunay(nodes)
-
-    #print('節点数、三角形要素数、境界線分要素数')
-    #nod_total = delaunay_data.points.shape[0]
-    #tri_ele_total = delaunay_data.simplices.shape[0]
-    #seg_ele_total = delaunay_data.convex_hull.shape[0]
-    #print(nod_total, tri_ele_total, seg_ele_total)
-
-    nod_pos_glo = delaunay_data.points  #[nod_total,2]
-    print('Global節点のx,y座標\n', nod_pos_glo)
-
-    nod_num_tri = delaunay_data.simplices  #[tri_ele_total,3]
-    print('三角形要素を構成する節点番号\n', nod_num_tri)
-
-    nod_num_seg = delaunay_data.convex_hull  #[seg_ele_total,2]
-    print('境界線分要素を構成する節点番号\n', nod_num_seg)
+#SciPyのサブモジュールとMatplotlibは、使う関数の中で読み込む(計算だけなら描画用のモジュールは読み込まない)
+
+
+#診断出力のレベル。silent:何も表示しない、summary:処理の流れと要約のみ、debug:配列や行列の中身も表示
+LOG_SILENT, LOG_SUMMARY, LOG_DEBUG = 0, 1, 2
+log_level = LOG_SUMMARY
+log_edgeitems = 3  #debugで配列を表示する場合の、先頭と末尾の要素数
+
+
+#診断出力。levelがlog_level以下の場合のみ表示する
+#引数に関数を渡した場合は、表示する時にだけ呼び出す(表示しない文字列は作らない)
+def log_print(level, *args):
+    if(level <= log_level):
+        print(*[arg() if callable(arg) else arg for arg in args])
+
+
+#配列の診断出力。大きな配列は先頭と末尾のlog_edgeitems個だけに切り詰める
+def log_array(level, title, array):
+    if(level <= log_level):
+        print(title)
+        print(np.array2string(np.asarray(array), threshold=2*log_edgeitems, edgeitems=log_edgeitems))
+
+
+#疎行列かどうかを判定する。scipy.sparseを読み込んでいなければ疎行列は作られていないので、読み込まずに済ませる
+def is_sparse(mat):
+    return ('scipy.sparse' in sys.modules) and sys.modules['scipy.sparse'].issparse(mat)
+
+
+#全体行列の診断出力。左上の10行10列(と右辺ベクトル)だけを取り出して表示する
+def log_matrix(level, title, mat, vec=None):
+    if(level <= log_level):
+        print(title)
+        mat_head = mat[:10,:10]
+        if(is_sparse(mat_head)):
+            mat_head = mat_head.toarray()
+        for i in range(len(mat_head)):
+            line = "".join("{:7.2f}".format(value) for value in mat_head[i])
+            if(vec is not None):
+                line += ";" +"".join("{:7.2f}".format(value) for value in np.atleast_1d(vec[i]))
+            print(line)
+
+
+#処理段階ごとの計測結果(壁時計時間、CPU時間、メモリ使用量のピーク)と、問題の統計量。JSONで書き出す
+telemetry_enabled = False
+telemetry = {'stages':{}, 'statistics':{}}
+
+
+#計測結果を空にする
+def reset_telemetry():
+    telemetry['stages'].clear()
+    telemetry['statistics'].clear()
+
+
+#問題の統計量(節点数、要素数、非ゼロ成分数、フィルイン、反復回数など)を記録
+def record_statistics(**statistics):
+    if(telemetry_enabled):
+        telemetry['statistics'].update(statistics)
+
+
+#処理段階の関数を計測するデコレータ。同じ段階を複数回呼んだ場合は、時間を合計してピークは最大値を残す
+#メモリはtracemallocで追跡した確保量(NumPy配列を含む)のうち、段階の開始時から増えた分のピーク
+def measure_stage(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if(not telemetry_enabled):
+            return func(*args, **kwargs)
+        if(not tracemalloc.is_tracing()):
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+        wall_time, cpu_time = time.perf_counter(), time.process_time()
+
+        result = func(*args, **kwargs)
+
+        wall_time, cpu_time = time.perf_counter() -wall_time, time.process_time() -cpu_time
+        peak_memory = tracemalloc.get_traced_memory()[1] -memory_start
+        stage = telemetry['stages'].setdefault(func.__name__, {'calls':0, 'wall_time':0.0, 'cpu_time':0.0, 'peak_memory':0})
+        stage['calls'] += 1
+        stage['wall_time'] += wall_time
+        stage['cpu_time'] += cpu_time
+        stage['peak_memory'] = max(stage['peak_memory'], peak_memory)
+        log_print(LOG_SUMMARY, lambda: 'Stage {}: wall = {:0.5f}[sec], cpu = {:0.5f}[sec], peak memory = {:0.3f}[MB]'.format(
+                  func.__name__, wall_time, cpu_time, peak_memory/2**20))
+        return result
+    return wrapper
+
+
+#計測結果をJSONで書き出す。run_infoには計算条件(節点の生成方法など)を渡す
+def write_telemetry(file_path, **run_info):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(run_info, **telemetry), f, indent=2, ensure_ascii=False)
+
+
+#関数func(チャンク番号)を、チャンク番号0〜worker_num-1についてスレッドプールで並列に実行する
+#NumPyの配列演算はGILを解放するので、各スレッドが別のコアを使える。worker_numが1ならこのスレッドで実行する
+def run_parallel(func, worker_num):
+    if(worker_num<=1):
+        func(0)
+        return
+    import concurrent.futures  #スレッドプール
+    with concurrent.futures.ThreadPoolExecutor(max_workers=worker_num) as executor:
+        list(executor.map(func, range(worker_num)))  #例外があればここで送出される
+
+
+#全体行列の組み立て計画
+#csr形式の非ゼロパターンと、各要素成分(e,i,j)がdata配列のどこに足し込まれるかを保持する
+class AssemblyPlan:
+    def __init__(self, nod_num_tri, nod_total):
+        self.nod_num_tri = nod_num_tri
+        self.nod_total = nod_total
+
+        #全要素の(i,j)成分に対応するGlobal節点番号を行優先の通し番号にする
+        row_glo = np.repeat(nod_num_tri, 3, axis=1).ravel().astype(np.int64)  #成分(e,i,j)の行番号nod_num_tri[e,i]
+        col_glo = np.tile(nod_num_tri, (1,3)).ravel().astype(np.int64)  #成分(e,i,j)の列番号nod_num_tri[e,j]
+        key_csr, slot_glo = np.unique(row_glo*nod_total +col_glo, return_inverse=True)
+
+        #csr形式の非ゼロパターン
+        self.indices = (key_csr % nod_total).astype(np.int32)  #各非ゼロ成分の列番号
+        self.indptr = np.zeros(nod_total+1, np.int32)  #各行の先頭位置
+        self.indptr[1:] = np.cumsum(np.bincount(key_csr//nod_total, minlength=nod_total))
+        self.slot_ele = slot_glo.reshape(-1,3,3)  #[tri_ele_total,3,3]、成分(e,i,j)のdata配列内の位置
+        self.nnz = len(key_csr)  #非ゼロ成分の個数
+        self.partitions = {}  #並列に組み立てるための分割(スレッド数ごとに最初の1回だけ作成する)
+
+    #並列に組み立てるための分割。全体行列を行の境界でworker_num個の区間に分け(非ゼロ成分数がほぼ等しくなるように)、
+    #各区間のdata配列の範囲と節点番号の範囲、その区間に足し込む要素成分と要素ベクトル成分の通し番号(元の順のまま)を返す
+    #区間ごとに別のスレッドで足し込むので結果を合わせる処理は要らず、各成分に足す順も逐次の場合と同じになる(結果はビット単位で一致する)
+    def partition(self, worker_num):
+        if(worker_num not in self.partitions):
+            row_bound = np.concatenate(([0], np.searchsorted(self.indptr, np.linspace(0, self.nnz, worker_num+1)[1:-1]), [self.nod_total]))
+            slot_bound = self.indptr[row_bound]
+            part_slot = np.searchsorted(slot_bound[1:-1], self.slot_ele.ravel(), side='right')  #各要素成分が足し込まれる区間
+            part_nod = np.searchsorted(row_bound[1:-1], self.nod_num_tri.ravel(), side='right')  #各要素ベクトル成分が足し込まれる区間
+            slot_part = np.split(np.argsort(part_slot, kind='stable'), np.cumsum(np.bincount(part_slot, minlength=worker_num))[:-1])
+            nod_part = np.split(np.argsort(part_nod, kind='stable'), np.cumsum(np.bincount(part_nod, minlength=worker_num))[:-1])
+            self.partitions[worker_num] = (slot_bound, slot_part, row_bound, nod_part)
+        return self.partitions[worker_num]
+
+    #要素行列をdata配列に足し込む。dataを渡した場合はその配列を0クリアしてから上書きする
+    #worker_numが2以上なら、partitionの区間ごとにスレッドプールで並列に足し込む
+    def assemble(self, mat_ele, data=None, worker_num=1):
+        if(data is None):
+            data = np.zeros(self.nnz, np.float64)
+        else:
+            data[:] = 0.0
+        if(worker_num<=1):
+            np.add.at(data, self.slot_ele.ravel(), mat_ele.ravel())
+            return data
+
+        slot_bound, slot_part, row_bound, nod_part = self.partition(worker_num)
+        slot_ele, mat_ele = self.slot_ele.reshape(-1), mat_ele.reshape(-1)
+        def assemble_part(part):
+            data_part = data[slot_bound[part]:slot_bound[part+1]]  #この区間のdata配列(ビュー)
+            np.add.at(data_part, slot_ele[slot_part[part]] -slot_bound[part], mat_ele[slot_part[part]])
+        run_parallel(assemble_part, worker_num)
+        return data
+
+    #一部の要素(elements)の要素行列だけが変わった場合に、その差分をdata配列に足し込む
+    def update(self, data, elements, mat_ele_old, mat_ele_new):
+        np.add.at(data, self.slot_ele[elements].ravel(), (mat_ele_new -mat_ele_old).ravel())
+        return data
+
+    #要素ベクトルを全体ベクトルに足し込む。vecを渡した場合はその配列を0クリアしてから上書きする
+    #vec_eleが[tri_ele_total,3,荷重ケース数]の場合は、[nod_total,荷重ケース数]の全体ベクトルになる
+    def assemble_vector(self, vec_ele, vec=None, worker_num=1):
+        if(vec is None):
+            vec = np.zeros((self.nod_total,)+vec_ele.shape[2:], np.float64)
+        else:
+            vec[:] = 0.0
+        if(worker_num<=1):
+            np.add.at(vec, self.nod_num_tri.ravel(), vec_ele.reshape((-1,)+vec_ele.shape[2:]))
+            return vec
+
+        slot_bound, slot_part, row_bound, nod_part = self.partition(worker_num)
+        nod_num, vec_ele = self.nod_num_tri.reshape(-1), vec_ele.reshape((-1,)+vec_ele.shape[2:])
+        def assemble_part(part):
+            vec_part = vec[row_bound[part]:row_bound[part+1]]  #この区間の節点の全体ベクトル(ビュー)
+            np.add.at(vec_part, nod_num[nod_part[part]] -row_bound[part], vec_ele[nod_part[part]])
+        run_parallel(assemble_part, worker_num)
+        return vec
+
+    #data配列を共有するcsr形式の圧縮行列を作成
+    def matrix(self, data):
+        import scipy.sparse  #圧縮行列の処理
+        return scipy.sparse.csr_matrix((data, self.indices, self.indptr),
+                                       shape=(self.nod_total,self.nod_total), copy=False)
+
+
+#Dirichlet境界の節点の行と列を0にし、対角成分を1にする
+def eliminate_dirichlet_nodes(mat_A_glo, nod_dirichlet):
+    if(is_sparse(mat_A_glo)):  #csr形式は非ゼロパターンを変えずに、data配列をマスクで書き換える
+        is_dirichlet = np.zeros(mat_A_glo.shape[0], bool)
+        is_dirichlet[nod_dirichlet] = True
+        row_csr = np.repeat(np.arange(mat_A_glo.shape[0]), np.diff(mat_A_glo.indptr))  #各非ゼロ成分の行番号
+        mask = is_dirichlet[row_csr] | is_dirichlet[mat_A_glo.indices]  #Dirichlet節点の行・列の成分
+        mat_A_glo.data[mask] = 0.0  #行・列を全て0にする
+        mat_A_glo.data[mask & (row_csr==mat_A_glo.indices)] = 1.0  #対角成分は1にする
+    else:
+        mat_A_glo[nod_dirichlet,:] = 0.0  #行を全て0にする
+        mat_A_glo[:,nod_dirichlet] = 0.0  #列を全て0にする
+        mat_A_glo[nod_dirichlet,nod_dirichlet] = 1.0  #対角成分は1にする
+
+    return mat_A_glo
+
+
+#係数p,q,ωを変えながら、小さい方からeigen_num個の固有値を求めるパラメータスイープ
+#sweep_pointsは(omega, cons_p, cons_q)の組のリスト。cons_p,cons_qは全体で一定の値か、領域ごとの値のリスト
+#region_eleは各三角形要素の領域番号(Noneなら全体を領域0とする)。Dirichlet境界の節点は未知数から除いて解く
+#戻り値は各点のパラメータと固有値を並べた表(構造化配列)
+@measure_stage
+def sweep_coefficients(mat_A_ele_unit, mat_B_ele_unit, assembly_plan, nod_dirichlet, sweep_points, eigen_num, region_ele=None):
+    import scipy.sparse.linalg  #圧縮行列用ソルバー
+    if(region_ele is None):
+        region_ele = np.zeros(len(mat_A_ele_unit), np.int64)
+    region_total = np.max(region_ele)+1
+    nod_free = np.setdiff1d(np.arange(assembly_plan.nod_total), nod_dirichlet)  #Dirichlet境界以外の節点
+
+    #係数1の全体行列を、領域ごとに1回だけ組み立てておく
+    mat_A_region, mat_B_region = [], []
+    for r in range(region_total):
+        in_region = (region_ele==r)[:,np.newaxis,np.newaxis]
+        mat_A_region.append(assembly_plan.matrix(assembly_plan.assemble(mat_A_ele_unit*in_region))[nod_free][:,nod_free])
+        mat_B_region.append(assembly_plan.matrix(assembly_plan.assemble(mat_B_ele_unit*in_region))[nod_free][:,nod_free])
+
+    sweep_table = np.zeros(len(sweep_points), dtype=[('omega', np.float64), ('cons_p', np.float64, (region_total,)),
+                                                     ('cons_q', np.float64, (region_total,)),
+                                                     ('eigenvalues', np.float64, (eigen_num,))])
+    eigen_ref = None  #固有値分解を行った基準点のパラメータと結果
+    precond = None  #LOBPCG法の前処理(基準点のA+BのLU分解)
+    for n, (omega_n, cons_p_n, cons_q_n) in enumerate(sweep_points):
+        cons_p_n = np.broadcast_to(np.asarray(cons_p_n, np.float64), (region_total,))
+        cons_q_n = np.broadcast_to(np.asarray(cons_q_n, np.float64), (region_total,))
+        scale_A = cons_p_n  #Aの各領域の倍率
+        scale_B = omega_n**2 *cons_q_n  #Bの各領域の倍率
+        mat_A = sum(scale_A[r]*mat_A_region[r] for r in range(region_total)).tocsr()
+        mat_B = sum(scale_B[r]*mat_B_region[r] for r in range(region_total)).tocsr()
+
+        #A,Bが基準点の定数倍かどうか。割り算を使わずに、基準点で絶対値が最大の領域の倍率との比で調べる
+        if(eigen_ref is not None):
+            k_A, k_B = np.argmax(np.absolute(eigen_ref[0])), np.argmax(np.absolute(eigen_ref[1]))
+            is_scaled = np.allclose(scale_A*eigen_ref[0][k_A], eigen_ref[0]*scale_A[k_A]) and \
+                        np.allclose(scale_B*eigen_ref[1][k_B], eigen_ref[1]*scale_B[k_B])
+            ratio_A, ratio_B = scale_A[k_A]/eigen_ref[0][k_A], scale_B[k_B]/eigen_ref[1][k_B]
+
+        if(eigen_ref is not None and is_scaled and 0.0<ratio_A and 0.0<ratio_B):
+            #A,Bが基準点の定数倍なら、固有ベクトルは同じで固有値は倍率の比で変わるだけ
+            eigenvalues = ratio_A/ratio_B *eigen_ref[2]
+            eigen_vec = eigen_ref[3]/np.sqrt(ratio_B)  #Bに関する正規化を保つ
+            sweep_type = 'rescale'
+
+        elif(eigen_ref is not None):  #領域ごとに係数が変わった場合は、前の点の固有ベクトルを初期値にしてLOBPCG法で解く
+            eigenvalues, eigen_vec = scipy.sparse.linalg.lobpcg(mat_A, eigen_vec, B=mat_B, M=precond, largest=False,
+                                                                tol=1.0e-8, maxiter=500)
+            eigen_order = np.argsort(eigenvalues)
+            eigenvalues, eigen_vec = eigenvalues[eigen_order], eigen_vec[:,eigen_order]
+            sweep_type = 'warm start'
+
+            #収束の確認。相対残差|Ax-λBx|/(|Ax|+|λ||Bx|)が大きければ、この点は固有値分解で解き直す
+            vec_Ax, vec_Bx = mat_A.dot(eigen_vec), mat_B.dot(eigen_vec)
+            residual = np.linalg.norm(vec_Ax -vec_Bx*eigenvalues, axis=0) / \
+                       (np.linalg.norm(vec_Ax, axis=0) +np.absolute(eigenvalues)*np.linalg.norm(vec_Bx, axis=0))
+            if(not np.all(residual<=1.0e-6)):
+                log_print(LOG_SUMMARY, 'Sweep {}/{}: LOBPCG did not converge (max relative residual = {:0.3e}), decomposing instead'.format(
+                          n+1, len(sweep_points), np.max(residual)))
+                eigen_ref = None
+
+        if(eigen_ref is None):  #最初の点と、LOBPCG法が収束しなかった点は、shift-invertのLanczos法で固有値分解する
+            eigenvalues, eigen_vec = scipy.sparse.linalg.eigsh(mat_A.tocsc(), k=eigen_num, M=mat_B.tocsc(), sigma=-1.0, which='LM')
+            eigen_order = np.argsort(eigenvalues)
+            eigenvalues, eigen_vec = eigenvalues[eigen_order], eigen_vec[:,eigen_order]
+
+            #以降の点で使うLOBPCG法の前処理として、A+BのLU分解を保持する
+            factor = scipy.sparse.linalg.splu((mat_A +mat_B).tocsc())
+            record_statistics(factor_nnz=int(factor.L.nnz +factor.U.nnz), fill_in=(factor.L.nnz +factor.U.nnz)/(mat_A +mat_B).nnz)
+            precond = scipy.sparse.linalg.LinearOperator(mat_A.shape, matvec=factor.solve, matmat=factor.solve)
+            eigen_ref = (scale_A, scale_B, eigenvalues, eigen_vec)
+            sweep_type = 'decompose'
+
+        sweep_table[n] = (omega_n, cons_p_n, cons_q_n, eigenvalues)
+        log_print(LOG_SUMMARY, 'Sweep {}/{} ({}): omega = {}, p = {}, q = {}, Eig[0] = {:0.6f}'.format(
+                  n+1, len(sweep_points), sweep_type, omega_n, cons_p_n, cons_q_n, eigenvalues[0]))
+
+    record_statistics(sweep_point_total=len(sweep_points))
+    return sweep_table
+
+
+#点がどの三角形要素に含まれるかを探すための索引(バケット格子)
+#計算領域を三角形要素の半分ほどの大きさの格子に分け、各格子に外接長方形が重なる三角形要素の番号をcsr形式で持つ
+class PointLocator:
+    def __init__(self, nod_pos_glo, nod_num_tri):
+        pos_x = nod_pos_glo[:,0][nod_num_tri]  #[tri_ele_total,3]、各Local節点のx座標
+        pos_y = nod_pos_glo[:,1][nod_num_tri]  #[tri_ele_total,3]、各Local節点のy座標
+        tri_ele_total = len(nod_num_tri)
+
+        #格子の大きさと数
+        self.pos_min, self.pos_max = np.min(nod_pos_glo, axis=0), np.max(nod_pos_glo, axis=0)  #メッシュの外接長方形
+        extent = np.maximum(self.pos_max -self.pos_min, np.finfo(np.float64).tiny)
+        cell_size = np.sqrt(extent[0]*extent[1] / max(2.0*tri_ele_total, 1.0))
+        self.grid_num = np.maximum(np.ceil(extent/cell_size).astype(np.int64), 1)  #x・y方向の格子の数
+        self.cell_size = extent/self.grid_num
+
+        #各三角形要素の外接長方形が重なる格子を全て並べ、格子の番号順に並べ替える
+        #外接長方形の上端・右端が格子の境界に一致する場合は、その先の格子には入れない(境界上の点は隣の要素で見つかる)
+        cell_min = self.find_cell(np.stack((np.min(pos_x, axis=1), np.min(pos_y, axis=1)), axis=1))
+        cell_max = np.ceil((np.stack((np.max(pos_x, axis=1), np.max(pos_y, axis=1)), axis=1) -self.pos_min)/self.cell_size).astype(np.int64) -1
+        cell_span = np.clip(cell_max, cell_min, self.grid_num-1) -cell_min +1
+        cell_count = cell_span[:,0]*cell_span[:,1]  #各三角形要素が重なる格子の数
+        tri_list = np.repeat(np.arange(tri_ele_total), cell_count)
+        cell_offset = np.arange(len(tri_list)) -np.repeat(np.cumsum(cell_count) -cell_count, cell_count)
+        cell_x = cell_min[tri_list,0] +cell_offset % cell_span[tri_list,0]
+        cell_y = cell_min[tri_list,1] +cell_offset // cell_span[tri_list,0]
+        cell_list = cell_y*self.grid_num[0] +cell_x
+        self.cell_tri = tri_list[np.argsort(cell_list, kind='stable')].astype(np.int32)  #格子ごとに並べた三角形要素の番号
+        self.cell_ptr = np.zeros(self.grid_num[0]*self.grid_num[1]+1, np.int64)  #各格子の先頭位置
+        self.cell_ptr[1:] = np.cumsum(np.bincount(cell_list, minlength=self.grid_num[0]*self.grid_num[1]))
+
+        #形状関数N_i=(a_i +b_i*x +c_i*y)/2Sの係数を、要素ごとに[a/2S,b/2S,c/2S]×3節点の順に並べる(1回の読み出しで済むように)
+        #面積Sは符号付きにして、節点の回る向きによらず要素の内側でN_iが正になるようにする
+        area_signed = (pos_x[:,1]-pos_x[:,0])*(pos_y[:,2]-pos_y[:,0]) -(pos_x[:,2]-pos_x[:,0])*(pos_y[:,1]-pos_y[:,0])  #2S
+        shape_a = np.roll(pos_x, -1, axis=1)*np.roll(pos_y, -2, axis=1) -np.roll(pos_x, -2, axis=1)*np.roll(pos_y, -1, axis=1)
+        shape_b = np.roll(pos_y, -1, axis=1) -np.roll(pos_y, -2, axis=1)
+        shape_c = np.roll(pos_x, -2, axis=1) -np.roll(pos_x, -1, axis=1)
+        self.shape_coef = np.stack((shape_a, shape_b, shape_c), axis=1) / area_signed[:,np.newaxis,np.newaxis]  #[tri_ele_total,3,3]
+
+    #点[点の数,2]を含む格子のx・y方向の番号[点の数,2]。外接長方形の上端・右端の点は端の格子にする
+    def find_cell(self, points):
+        return np.clip(np.floor((points -self.pos_min)/self.cell_size).astype(np.int64), 0, self.grid_num-1)
+
+    #三角形要素tri_listの形状関数の、点pointsでの値[点の数,3]
+    def shape_values(self, tri_list, points):
+        shape_coef = self.shape_coef[tri_list]
+        return shape_coef[:,0] +shape_coef[:,1]*points[:,0:1] +shape_coef[:,2]*points[:,1:2]
+
+    #点[点の数,2]を含む三角形要素の番号(無ければ-1)と、その要素の形状関数の値(無ければNaN)を求める
+    #全ての点について格子のk番目の候補をまとめて調べ、見つからなかった点だけ次の候補に進む
+    def locate(self, points, tolerance=1.0e-12):
+        points = np.asarray(points, np.float64).reshape(-1,2)
+        tri_index = np.full(len(points), -1, np.int64)
+        shape_val = np.full((len(points),3), np.nan)
+
+        inside = np.all((self.pos_min<=points) & (points<=self.pos_max), axis=1)  #外接長方形の外の点(NaNを含む)は探さない
+        cell = self.find_cell(np.where(inside[:,np.newaxis], points, self.pos_min))
+        cell_first = self.cell_ptr[cell[:,1]*self.grid_num[0] +cell[:,0]]
+        cell_count = np.where(inside, self.cell_ptr[cell[:,1]*self.grid_num[0] +cell[:,0] +1] -cell_first, 0)
+        pending = np.flatnonzero(0<cell_count)  #まだ見つかっていない点
+        candidate = 0
+        while(0<len(pending)):
+            tri_list = self.cell_tri[cell_first[pending] +candidate]
+            shape_try = self.shape_values(tri_list, points[pending])
+            found = np.all(-tolerance<=shape_try, axis=1)
+            tri_index[pending[found]], shape_val[pending[found]] = tri_list[found], shape_try[found]
+            candidate += 1
+            pending = pending[~found & (candidate<cell_count[pending])]
+
+        return tri_index, shape_val
+
+
+#三角形要素のメッシュ。Global節点座標と節点番号(int32)だけを持ち、要素ごとの幾何量は最初に使う時に計算して保持する
+#同じメッシュを複数の問題で使うと、面積・形状関数の係数・線分要素の長さ・全体行列の組み立て計画も共有される
+class Mesh:
+    __slots__ = ('nod_pos_glo', 'nod_num_tri', 'nod_num_seg', '_area_tri', '_shape_b', '_shape_c', '_leng_seg', '_assembly_plan', '_content_hash', '_point_locator')
+
+    def __init__(self, nod_pos_glo, nod_num_tri, nod_num_seg):
+        self.nod_pos_glo = np.ascontiguousarray(nod_pos_glo, np.float64)  #[nod_total,2]
+        self.nod_num_tri = np.ascontiguousarray(nod_num_tri, np.int32)  #[tri_ele_total,3]
+        self.nod_num_seg = np.ascontiguousarray(nod_num_seg, np.int32)  #[seg_ele_total,2]
+        self._area_tri = self._shape_b = self._shape_c = self._leng_seg = self._assembly_plan = self._content_hash = self._point_locator = None
+
+    #三角形要素のLocal節点座標[tri_ele_total,3,2]。保持せず、使う度にGlobal節点座標から集める
+    @property
+    def nod_pos_tri(self):
+        return self.nod_pos_glo[self.nod_num_tri]
+
+    #境界線分要素のLocal節点座標[seg_ele_total,2,2]。保持せず、使う度にGlobal節点座標から集める
+    @property
+    def nod_pos_seg(self):
+        return self.nod_pos_glo[self.nod_num_seg]
+
+    #各要素の面積と、形状関数N_i=(a_i +b_i*x +c_i*y)/2Sの係数b,cを求める(aは要素行列に使わないので求めない)
+    #保持する配列は共有されるので、書き換えられないようにする
+    def _compute_shape(self):
+        pos_x = self.nod_pos_glo[:,0][self.nod_num_tri]  #[tri_ele_total,3]、各Local節点のx座標
+        pos_y = self.nod_pos_glo[:,1][self.nod_num_tri]  #[tri_ele_total,3]、各Local節点のy座標
+        area_tri = (pos_x[:,1]-pos_x[:,0])*(pos_y[:,2]-pos_y[:,0]) -(pos_x[:,2]-pos_x[:,0])*(pos_y[:,1]-pos_y[:,0])
+        self._area_tri = np.absolute(area_tri)/2.0  #[tri_ele_total]
+        self._shape_b = np.roll(pos_y, -1, axis=1) -np.roll(pos_y, -2, axis=1)  #[tri_ele_total,3]、y_(i+1) -y_(i+2)
+        self._shape_c = np.roll(pos_x, -2, axis=1) -np.roll(pos_x, -1, axis=1)  #[tri_ele_total,3]、x_(i+2) -x_(i+1)
+        for array in (self._area_tri, self._shape_b, self._shape_c):
+            array.flags.writeable = False
+
+    @property
+    def area_tri(self):
+        if(self._area_tri is None):
+            self._compute_shape()
+        return self._area_tri
+
+    @property
+    def shape_b(self):
+        if(self._shape_b is None):
+            self._compute_shape()
+        return self._shape_b
+
+    @property
+    def shape_c(self):
+        if(self._shape_c is None):
+            self._compute_shape()
+        return self._shape_c
+
+    #境界線分要素の長さ[seg_ele_total]
+    @property
+    def leng_seg(self):
+        if(self._leng_seg is None):
+            nod_pos_seg = self.nod_pos_seg
+            self._leng_seg = np.sqrt((nod_pos_seg[:,0,0]-nod_pos_seg[:,1,0])**2.0 +(nod_pos_seg[:,0,1]-nod_pos_seg[:,1,1])**2.0)
+            self._leng_seg.flags.writeable = False
+        return self._leng_seg
+
+    #全体行列の組み立て計画(csr形式の非ゼロパターン)
+    @property
+    def assembly_plan(self):
+        if(self._assembly_plan is None):
+            self._assembly_plan = AssemblyPlan(self.nod_num_tri, len(self.nod_pos_glo))
+        return self._assembly_plan
+
+    #点の位置の探索用の索引。同じメッシュで何度探索しても作り直さない
+    @property
+    def point_locator(self):
+        if(self._point_locator is None):
+            self._point_locator = PointLocator(self.nod_pos_glo, self.nod_num_tri)
+        return self._point_locator
+
+    #メッシュのハッシュ値(節点座標と節点番号から作る)。同じメッシュかどうかの判定や、キャッシュのキーに使う
+    @property
+    def content_hash(self):
+        if(self._content_hash is None):
+            self._content_hash = hash_arrays((self.nod_pos_glo, self.nod_num_tri, self.nod_num_seg))
+        return self._content_hash
+
+
+#メッシュと計算結果の保存形式の版数。形式を変えたら増やす
+store_version = 1
+
+
+#配列のハッシュ値(SHA-256)。型と形状も含めるので、同じバイト列でも型や形状が違えば別の値になる
+def hash_arrays(arrays):
+    hash_key = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        hash_key.update('{}{}'.format(array.dtype.str, array.shape).encode())
+        hash_key.update(array)
+    return hash_key.hexdigest()
+
+
+#メッシュと配列(境界のタグ、全体行列、解など)をディレクトリに保存する
+#配列ごとに.npyファイルに書き、名前・型・形状・ハッシュ値の目録をmanifest.jsonに書く(目録は最後に書くので、途中で止まった保存は読み込まれない)
+#疎行列はcsr形式のdata,indices,indptrに分けて保存する
+def save_store(store_dir, mesh, **arrays):
+    os.makedirs(store_dir, exist_ok=True)
+    items = {'nod_pos_glo':mesh.nod_pos_glo, 'nod_num_tri':mesh.nod_num_tri, 'nod_num_seg':mesh.nod_num_seg}
+    manifest = {'version':store_version, 'mesh_hash':mesh.content_hash, 'arrays':{}, 'sparse':{}}
+    for name, array in arrays.items():
+        if(is_sparse(array)):
+            array = array.tocsr()
+            manifest['sparse'][name] = {'shape':list(array.shape)}
+            items.update({name+'.data':array.data, name+'.indices':array.indices, name+'.indptr':array.indptr})
+        else:
+            items[name] = np.asarray(array)
+
+    #別名で書いてから置き換えるので、同じディレクトリからメモリマップで読み込んだ配列もそのまま使える
+    for name, array in items.items():
+        array_file = os.path.join(store_dir, name+'.npy')
+        with open(array_file+'.tmp', 'wb') as f:
+            np.save(f, array)
+        os.replace(array_file+'.tmp', array_file)
+        manifest['arrays'][name] = {'dtype':array.dtype.str, 'shape':list(array.shape), 'hash':hash_arrays([array])}
+    #全体のハッシュ値は、配列ごとのハッシュ値から作る(キャッシュのキーに使う)
+    manifest['content_hash'] = hashlib.sha256(json.dumps(manifest['arrays'], sort_keys=True).encode()).hexdigest()
+
+    manifest_file = os.path.join(store_dir, 'manifest.json')
+    with open(manifest_file+'.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_file+'.tmp', manifest_file)
+    log_print(LOG_SUMMARY, 'Store saved: {} ({} arrays, hash = {})'.format(store_dir, len(items), manifest['content_hash'][:16]))
+    return manifest['content_hash']
+
+
+#save_storeで保存したメッシュと配列を読み込む。mmap_mode='r'ならメモリマップで開くので、触れた部分だけがファイルから読まれる
+#verify=Trueの場合は、全ての配列を読んで目録のハッシュ値と照合する
+def load_store(store_dir, mmap_mode='r', verify=False):
+    with open(os.path.join(store_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if(manifest['version']!=store_version):
+        raise ValueError('Unsupported store version {} in {}'.format(manifest['version'], store_dir))
+
+    arrays = {name: np.load(os.path.join(store_dir, name+'.npy'), mmap_mode=mmap_mode) for name in manifest['arrays']}
+    if(verify):
+        for name, array in arrays.items():
+            if(hash_arrays([array])!=manifest['arrays'][name]['hash']):
+                raise ValueError('Array {} in {} does not match its hash'.format(name, store_dir))
+
+    mesh = Mesh(arrays.pop('nod_pos_glo'), arrays.pop('nod_num_tri'), arrays.pop('nod_num_seg'))
+    if(0<len(manifest['sparse'])):
+        import scipy.sparse  #圧縮行列の処理
+        for name, sparse_info in manifest['sparse'].items():
+            arrays[name] = scipy.sparse.csr_matrix((arrays.pop(name+'.data'), arrays.pop(name+'.indices'), arrays.pop(name+'.indptr')),
+                                                   shape=tuple(sparse_info['shape']))
+    log_print(LOG_SUMMARY, 'Store loaded: {} (hash = {})'.format(store_dir, manifest['content_hash'][:16]))
+    return mesh, arrays
+
+
+#解(節点の値[nod_total]か[nod_total,ケース数])を、任意の点[点の数,2]で線形の形状関数により補間する(プローブ)
+#点の探索はメッシュが保持する索引を使い回す。gradient=Trueなら勾配[点の数,2(,ケース数)]も返す。メッシュの外の点はNaN
+#node_orderを渡した場合は、解が元の節点番号の順(メッシュは並べ替えた後)とみなす。点はchunk_size個ずつ処理する
+def probe_solution(mesh, unknown_vec_u, points, gradient=False, node_order=None, chunk_size=2**18):
+    points = np.asarray(points, np.float64).reshape(-1,2)
+    point_locator = mesh.point_locator
+    probe_u = np.full((len(points),)+unknown_vec_u.shape[1:], np.nan)
+    if(gradient):
+        probe_grad = np.full((len(points),2)+unknown_vec_u.shape[1:], np.nan)
+
+    for i in range(0, len(points), chunk_size):
+        tri_index, shape_val = point_locator.locate(points[i:i+chunk_size])
+        found = np.flatnonzero(0<=tri_index)
+        nod_num_probe = mesh.nod_num_tri[tri_index[found]]  #[見つかった点の数,3]
+        if(node_order is not None):
+            nod_num_probe = node_order[nod_num_probe]
+        vec_u_probe = unknown_vec_u[nod_num_probe]  #[見つかった点の数,3(,ケース数)]
+        probe_u[i+found] = np.einsum('pi,pi...->p...', shape_val[found], vec_u_probe)
+        if(gradient):
+            shape_coef = point_locator.shape_coef[tri_index[found]]  #勾配はdN_i/dx=b_i/2S、dN_i/dy=c_i/2S
+            probe_grad[i+found,0] = np.einsum('pi,pi...->p...', shape_coef[:,1], vec_u_probe)
+            probe_grad[i+found,1] = np.einsum('pi,pi...->p...', shape_coef[:,2], vec_u_probe)
+
+    if(gradient):
+        return probe_u, probe_grad
+    return probe_u
+
+
+#境界線分要素のタグ(どの辺の境界か)。どの辺にも当てはまらない線分要素はTAG_OTHER
+TAG_LEFT, TAG_RIGHT, TAG_BOTTOM, TAG_TOP, TAG_OTHER = 0, 1, 2, 3, 4
+#境界条件の種類。BC_left等で指定する名前から変換する
+BC_NEUMANN, BC_DIRICHLET = 0, 1
+BC_kinds = {'Neumann':BC_NEUMANN, 'Dirichlet':BC_DIRICHLET}
+
+
+#格子点配置の節点、三角形要素、境界線分要素を、ドロネー分割を使わずに式で直接作る(計算量は節点数に比例)
+#節点番号はi +lattice_num*j(x方向が先)。各格子は左下と右上を結ぶ対角線で2つの三角形に分け、節点は反時計回りに並べる
+def generate_lattice(x_min, x_max, y_min, y_max, lattice_num):
+    nod_pos_glo = np.empty((lattice_num*lattice_num,2), np.float64)  #[nod_total,2]
+    nod_pos_glo[:,0] = np.tile(np.linspace(x_min, x_max, lattice_num), lattice_num)
+    nod_pos_glo[:,1] = np.repeat(np.linspace(y_min, y_max, lattice_num), lattice_num)
+
+    #各格子の左下の節点番号から、右下(+1)、左上(+lattice_num)、右上(+lattice_num+1)の節点番号が決まる
+    cell = np.arange(lattice_num-1, dtype=np.int32)
+    nod_ll = (cell[np.newaxis,:] +lattice_num*cell[:,np.newaxis]).ravel()  #[cell_total]
+    nod_num_tri = np.empty((2*len(nod_ll),3), np.int32)  #[tri_ele_total,3]
+    nod_num_tri[0::2,0], nod_num_tri[0::2,1], nod_num_tri[0::2,2] = nod_ll, nod_ll +1, nod_ll +lattice_num +1  #右下の三角形
+    nod_num_tri[1::2,0], nod_num_tri[1::2,1], nod_num_tri[1::2,2] = nod_ll, nod_ll +lattice_num +1, nod_ll +lattice_num  #左上の三角形
+
+    #外周の節点を下辺、右辺、上辺、左辺の順に反時計回りにたどり、隣り合う節点を境界線分要素にする
+    nod_loop = np.concatenate((cell,  #下辺(左から右)
+                               (lattice_num-1) +lattice_num*cell,  #右辺(下から上)
+                               lattice_num*lattice_num-1 -cell,  #上辺(右から左)
+                               lattice_num*(lattice_num-1 -cell)))  #左辺(上から下)
+    nod_num_seg = np.stack((nod_loop, np.roll(nod_loop, -1)), axis=1)  #[seg_ele_total,2]
 
     return nod_pos_glo, nod_num_tri, nod_num_seg
 
 
-def make_mesh_data():
-    print('三角形要素を構成するLocal節点座標')
-    nod_pos_tri = np.empty((len(nod_num_tri),3,2), np.float64)  #各要素のLocal節点のx,y座標
-    for e in range(len(nod_num_tri)):
-        for n in range(3):
-            nod_pos_tri[e,n,0] = nod_pos_glo[nod_num_tri[e,n], 0]
-            nod_pos_tri[e,n,1] = nod_pos_glo[nod_num_tri[e,n], 1]
-    print('nod_pos_tri(x0, y0),(x1, y1),(x2, y2) =\n', nod_pos_tri)
-
-    print('境界線分要素を構成するLocal節点座標')
-    nod_pos_seg = np.empty((len(nod_num_seg),2,2), np.float64)  #各境界要素のLocal節点のx,y座標
-    for e in range(len(nod_num_seg)):
-        for n in range(2):
-            nod_pos_seg[e,n,0] = nod_pos_glo[nod_num_seg[e,n], 0]
-            nod_pos_seg[e,n,1] = nod_pos_glo[nod_num_seg[e,n], 1]
-    print('nod_pos_seg(x0, y0),(x1, y1) =\n', nod_pos_seg)
-
-    return nod_pos_tri, nod_pos_seg
-
-
-#要素行列の構築
-def assemble_element_matrix(nod_num_tri, nod_pos_tri):
-    #各要素の面積
-    print('Element area_tri')
-    area_tri = (nod_pos_tri[:,1,0]-nod_pos_tri[:,0,0])*(nod_pos_tri[:,2,1]-nod_pos_tri[:,0,1])  \
-              -(nod_pos_tri[:,2,0]-nod_pos_tri[:,0,0])*(nod_pos_tri[:,1,1]-nod_pos_tri[:,0,1])
-    area_tri = np.absolute(area_tri)/2.0
-    print(area_tri)
-
-    #各要素の形状関数の係数
-    print('Shape function a,b,c')
-    shape_a = np.empty((len(nod_pos_tri),3), np.float64)
-    shape_b = np.empty((len(nod_pos_tri),3), np.float64)
-    shape_c = np.empty((len(nod_pos_tri),3), np.float64)
-    for e in range(len(nod_pos_tri)):
-        shape_a[e,0] = nod_pos_tri[e,1,0]*nod_pos_tri[e,2,1] -nod_pos_tri[e,2,0]*nod_pos_tri[e,1,1]
-        shape_a[e,1] = nod_pos_tri[e,2,0]*nod_pos_tri[e,0,1] -nod_pos_tri[e,0,0]*nod_pos_tri[e,2,1]
-        shape_a[e,2] = nod_pos_tri[e,0,0]*nod_pos_tri[e,1,1] -nod_pos_tri[e,1,0]*nod_pos_tri[e,0,1]
-
-        shape_b[e,0] = nod_pos_tri[e,1,1] -nod_pos_tri[e,2,1]
-        shape_b[e,1] = nod_pos_tri[e,2,1] -nod_pos_tri[e,0,1]
-        shape_b[e,2] = nod_pos_tri[e,0,1] -nod_pos_tri[e,1,1]
-
-        shape_c[e,0] = nod_pos_tri[e,2,0] -nod_pos_tri[e,1,0]
-        shape_c[e,1] = nod_pos_tri[e,0,0] -nod_pos_tri[e,2,0]
-        shape_c[e,2] = nod_pos_tri[e,1,0] -nod_pos_tri[e,0,0]
-    for e in range(min(len(nod_pos_tri),10)):  #形状関数の係数を10番目の三角形要素まで確認
-        print(shape_a[e,:], shape_b[e,:], shape_c[e,:])
-
-    #要素行列の初期化
-    mat_A_ele = np.zeros((len(nod_num_tri),3,3), np.float64)  #要素係数行列(ゼロで初期化)
-    mat_B_ele = np.zeros((len(nod_num_tri),3,3), np.float64)  #要素係数行列(ゼロで初期化)
-
-    print("Local matrix")
-    for e in range(len(nod_pos_tri)):
-        for i in range(3):
-            for j in range(3):
-                mat_A_ele[e,i,j] = cons_p/(4.0*area_tri[e]) * (shape_b[e,i]*shape_b[e,j] +shape_c[e,i]*shape_c[e,j])
-
-                if(i==j):
-                    mat_B_ele[e,i,j] = cons_q*area_tri[e]/6.0
-                else:
-                    mat_B_ele[e,i,j] = cons_q*area_tri[e]/12.0
-
-    return mat_A_ele, mat_B_ele, area_tri
-
-
-#全体行列の構築
-def assemble_global_matrix(matrix_type):
-    #全体行列を用意
-    if(matrix_type=='basic'):
-        mat_A_glo = np.zeros((len(nod_pos_glo),len(nod_pos_glo)), np.float64) #全体行列(ゼロで初期化)
-        mat_B_glo = np.zeros((len(nod_pos_glo),len(nod_pos_glo)), np.float64) #全体行列(ゼロで初期化)
-    elif(matrix_type=='sparse'):
-        mat_A_glo = scipy.sparse.lil_matrix((len(nod_pos_glo),len(nod_pos_glo))) #lil形式の圧縮行列(ゼロで初期化)
-        mat_B_glo = scipy.sparse.lil_matrix((len(nod_pos_glo),len(nod_pos_glo))) #lil形式の圧縮行列(ゼロで初期化)
-
-    #全体行列を組み立てる
-    print('Assemble matrix')
-    CountPercent = 1
-    for e in range(len(nod_pos_tri)):
-        for i in range(3):
-            for j in range(3):
-                mat_A_glo[ nod_num_tri[e,i], nod_num_tri[e,j] ] += mat_A_ele[e,i,j]
-                mat_B_glo[ nod_num_tri[e,i], nod_num_tri[e,j] ] += mat_B_ele[e,i,j]
-
-        #処理の経過を％表示
-        if(CountPercent <= 100*e/len(nod_pos_tri)):
-            print("{:7.2f}%".format(100*e/len(nod_pos_tri)), end='')
-            CountPercent += 1
-    print(" 100.00%")
-
-    print('Pre global matrix A')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_A_glo[i,j]), end='')
-        print()
-    print('Pre global matrix B')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_B_glo[i,j]), end='')
-        print()
-
-    return mat_A_glo, mat_B_glo
-
-
-#境界要素の情報を設定
-def make_boundary_info(nod_pos_seg):
-    #境界線分要素の長さ
-    leng_seg = (nod_pos_seg[:,0,0]-nod_pos_seg[:,1,0])**2.0 +(nod_pos_seg[:,0,1]-nod_pos_seg[:,1,1])**2.0
-    leng_seg = np.sqrt(leng_seg)
-    print('leng_seg =\n', leng_seg)
-
-    #境界要素の種類を分類
-    BC_type = [""]*len(nod_pos_seg)
-    BC_value = [""]*len(nod_pos_seg)
-    BC_threshold = 0.5*np.mean(leng_seg)
-    for e in range(len(nod_pos_seg)):
-        if(nod_pos_seg[e,0,0] < x_min +BC_threshold and
-           nod_pos_seg[e,1,0] < x_min +BC_threshold):  #左側境界
-            BC_type[e] = BC_left[0]
-            BC_value[e] = BC_left[1]
-        elif(x_max -BC_threshold < nod_pos_seg[e,0,0] and
-             x_max -BC_threshold < nod_pos_seg[e,1,0]):  #右側境界
-            BC_type[e] = BC_right[0]
-            BC_value[e] = BC_right[1]
-        elif(nod_pos_seg[e,0,1] < y_min +BC_threshold and
-             nod_pos_seg[e,1,1] < y_min +BC_threshold):  #下側境界
-            BC_type[e] = BC_bottom[0]
-            BC_value[e] = BC_bottom[1]
-        elif(y_max -BC_threshold < nod_pos_seg[e,0,1] and
-             y_max -BC_threshold < nod_pos_seg[e,1,1]):  #上側境界
-            BC_type[e] = BC_top[0]
-            BC_value[e] = BC_top[1]
-        else:  #それ以外はNeumann境界にしておく（何もしない）
-            BC_type[e] = 'Neumann'
-            BC_value[e] = 0.0
-    print('BC_type =\n', BC_type)
-    print('BC_value =\n', BC_value)
-
-    return BC_type, BC_value, leng_seg
-
-
-#境界条件を実装
-def set_boundary_condition(mat_A_glo, mat_B_glo, BC_type, BC_value, leng_seg):
-    #各要素の各節点に対応したGlobal節点に対して処理する
-    print('Boundary conditions')
-    CountPercent = 1
-    for e in range(len(nod_pos_seg)):
-        for n in range(2):
-            if(BC_type[e]=='Dirichlet'):
-                mat_A_glo[nod_num_seg[e,n],:] = 0.0  #行を全て0にする
-                mat_A_glo[:,nod_num_seg[e,n]] = 0.0  #列を全て0にする
-                mat_A_glo[nod_num_seg[e,n],nod_num_seg[e,n]] = 1.0  #対角成分は1にする
-
-        #処理の経過を％表示
-        if(CountPercent <= 100*e/len(nod_pos_seg)):
-            print("{:7.2f}%".format(100*e/len(nod_pos_seg)), end='')
-            CountPercent += 1
-    print(" 100.00%")
-
-    print('Post global matrix A')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_A_glo[i,j]), end='')
-        print()
-    print('Post global matrix B')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_B_glo[i,j]), end='')
-        print()
-
-    return mat_A_glo, mat_B_glo
-
-
-#連立方程式を解く
-def solve_simultaneous_equations(mat_A_glo, mat_B_glo):
-    print('節点数、三角形要素数、境界線分要素数')
-    print(len(nod_pos_glo), len(nod_pos_tri), len(nod_pos_seg))
-
-    print('Solve linear equations')
-    if(matrix_type=='basic'):
+#固有ベクトルの列をcolumn_orderの順に取り出し(Noneなら全ての列をそのままの順で)、output_typeの型と出力先に書き出す
+#fileの場合は.npyファイルをメモリマップで開き、block_size列ずつ型を変換しながら流し込む(全体の複製は作らない)
+def write_eigenvectors(unknown_vec_u, column_order, output_type, block_size=64):
+    vec_dtype = np.dtype(output_type[1])
+    if(output_type[0]=='memory'):
+        if(column_order is None):
+            return unknown_vec_u.astype(vec_dtype, copy=False)
+        return unknown_vec_u[:,column_order].astype(vec_dtype, copy=False)
+    elif(output_type[0]=='file'):
+        if(column_order is None):
+            column_order = np.arange(unknown_vec_u.shape[1])
+        vec_file = np.lib.format.open_memmap(output_type[2], mode='w+', dtype=vec_dtype, shape=(len(unknown_vec_u), len(column_order)))
+        for i in range(0, len(column_order), block_size):
+            vec_file[:,i:i+block_size] = unknown_vec_u[:,column_order[i:i+block_size]]
+        vec_file.flush()
+        log_print(LOG_SUMMARY, 'Eigenvectors written: {} ({:0.3f}[MB])'.format(output_type[2], vec_file.nbytes/2**20))
+        return vec_file
+
+
+#密行列の一般化固有値問題で、shiftより小さい固有値の個数を数える
+#A-shift*BをLDL^T分解すると、D(1×1と2×2のブロック対角)の負の固有値の個数が求める個数に等しい(シルベスターの慣性法則)
+def count_eigenvalues_below(mat_A_glo, mat_B_glo, shift):
+    import scipy.linalg  #SciPyの線形計算ソルバー
+    _, mat_D, _ = scipy.linalg.ldl(mat_A_glo -shift*mat_B_glo)
+    return int(np.count_nonzero(scipy.linalg.eigvalsh_tridiagonal(np.diag(mat_D), np.diag(mat_D, -1)) < 0.0))
+
+
+#全体行列の帯幅(対角から最も離れた非ゼロ成分までの距離)とプロファイル(各行の最初の非ゼロ成分から対角までの距離の合計)
+#非ゼロ成分は同じ三角形要素に含まれる節点の組なので、全体行列を作らずに節点番号から求める
+def measure_bandwidth(nod_num_tri, nod_total):
+    row_glo = np.repeat(nod_num_tri, 3, axis=1).ravel()  #成分(e,i,j)の行番号nod_num_tri[e,i]
+    col_glo = np.tile(nod_num_tri, (1,3)).ravel()  #成分(e,i,j)の列番号nod_num_tri[e,j]
+    col_first = np.arange(nod_total)  #各行の最初の非ゼロ成分の列番号
+    np.minimum.at(col_first, row_glo, col_glo)
+    bandwidth = int(np.max(np.absolute(row_glo.astype(np.int64) -col_glo))) if(0<len(row_glo)) else 0
+    return bandwidth, int(np.sum(np.arange(nod_total) -col_first))
+
+
+#節点座標のヒルベルト曲線上の位置。計算領域を2^order×2^order の格子に分け、格子を曲線に沿って数えた番号を返す
+def hilbert_index(nod_pos_glo, order=16):
+    pos_min, pos_max = np.min(nod_pos_glo, axis=0), np.max(nod_pos_glo, axis=0)
+    grid_pos = (nod_pos_glo -pos_min) / np.maximum(pos_max -pos_min, np.finfo(np.float64).tiny)
+    grid_x, grid_y = np.minimum((grid_pos*2**order).astype(np.int64), 2**order-1).T
+    curve_index = np.zeros(len(nod_pos_glo), np.int64)
+    s = 2**(order-1)
+    while(0<s):  #上の桁から、4分割したどの象限にあるかを数え、象限に合わせて座標を回転・反転する
+        rx, ry = (grid_x & s)>0, (grid_y & s)>0
+        curve_index += s*s*((3*rx) ^ ry)
+        flip = rx & ~ry
+        grid_x, grid_y = np.where(flip, 2**order-1 -grid_x, grid_x), np.where(flip, 2**order-1 -grid_y, grid_y)
+        grid_x, grid_y = np.where(ry, grid_x, grid_y), np.where(ry, grid_y, grid_x)
+        s //= 2
+    return curve_index
+
+
+#節点の並べ替え順。新しい番号の順に並べた元の節点番号を返す
+#rcm:逆Cuthill-McKee法(帯幅を小さくする)、hilbert:ヒルベルト曲線に沿った順(近くの節点を近い番号にする)
+def make_node_order(mesh, reorder_type):
+    if(reorder_type=='rcm'):
+        import scipy.sparse  #圧縮行列の処理
+        import scipy.sparse.csgraph  #グラフの処理
+        nod_total = len(mesh.nod_pos_glo)
+        row_glo = np.repeat(mesh.nod_num_tri, 3, axis=1).ravel()
+        col_glo = np.tile(mesh.nod_num_tri, (1,3)).ravel()
+        graph = scipy.sparse.csr_matrix((np.ones(len(row_glo), np.int8), (row_glo, col_glo)), shape=(nod_total,nod_total))
+        return scipy.sparse.csgraph.reverse_cuthill_mckee(graph, symmetric_mode=True).astype(np.int32)
+    elif(reorder_type=='hilbert'):
+        return np.argsort(hilbert_index(mesh.nod_pos_glo), kind='stable').astype(np.int32)
+
+
+#2次元Helmholtz方程式の固有値問題。計算条件とメッシュを属性に保持し、1つのプロセスの中で何度でも解ける
+#計算条件は解く前に書き換えてもよい。メッシュを省略して解くと、前回のメッシュと組み立て計画を使い回す
+class Helmholtz2D:
+    def __init__(self, x_min=-1.0, x_max=1.0, y_min=-1.0, y_max=1.0, cons_p=1.0, cons_q=1.0, omega=1.0,
+                 BC_left=('Dirichlet', 0.0), BC_right=('Dirichlet', 0.0), BC_bottom=('Dirichlet', 0.0), BC_top=('Dirichlet', 0.0),
+                 matrix_type='sparse', eigen_type=('lowest', 10), output_modes=None, output_type=('memory', 'float64'), reorder_type=None, assembly_workers=1):
+        self.x_min, self.x_max = x_min, x_max  #計算領域のXの最小値、最大値
+        self.y_min, self.y_max = y_min, y_max  #計算領域のYの最小値、最大値
+        self.cons_p, self.cons_q = cons_p, cons_q  #定数項p,q
+        self.omega = omega  #k0=ω/c、カットオフ波数(ωa/2πc=a/λ)
+        #左部(x=x_min)、右部(x=x_max)、下部(y=y_min)、上部(y=y_max)の、境界の種類(Dirichlet,Neumann)と値
+        self.BC_left, self.BC_right, self.BC_bottom, self.BC_top = BC_left, BC_right, BC_bottom, BC_top
+        self.matrix_type = matrix_type  #全体行列の形式。basic,sparse
+        self.eigen_type = eigen_type  #求める固有値。['all'],['lowest', 個数],['target', 個数, 波数]
+        self.output_modes = output_modes  #残す固有モードの番号(求めた固有値を小さい順に並べた番号)。Noneなら全て
+        self.output_type = output_type  #固有ベクトルの出力。['memory', 型],['file', 型, .npyファイル名]
+        self.reorder_type = reorder_type  #メッシュを作る時の節点の並べ替え。None,rcm,hilbert
+        self.assembly_workers = assembly_workers  #要素行列の計算とsparseの全体行列の組み立てに使うスレッド数。1なら逐次
+        #sparseの全体行列A,Bのdata配列と、境界条件を適用するAの写し。組み立て計画が同じ間は使い回し、新しく確保しない
+        self.data_A = self.data_B = self.data_A_bc = None
+        self.data_source = None  #data_A,data_Bを組み立てた要素行列と組み立て計画
+        self.mesh = None  #メッシュ(Mesh)。他の問題と同じものを代入して共有してもよい
+        self.node_order = None  #節点を並べ替えた場合の、新しい番号の順に並べた元の節点番号
+
+    #メッシュを作成して、属性meshに保持する
+    def set_mesh(self, node_type):
+        self.generate_nodes(node_type)
+        if(self.reorder_type is not None):
+            self.reorder_nodes(self.mesh, self.reorder_type)
+        self.make_mesh_data(self.mesh)
+
+    #要素行列の構築から固有値問題の求解までを行い、固有ベクトルと固有値を返す(節点を並べ替えた場合も元の節点番号の順)
+    #node_typeを省略した場合は、属性meshのメッシュ(要素ごとの幾何量と組み立て計画を含む)を使い回す
+    def solve(self, node_type=None):
+        if(node_type is not None):
+            self.set_mesh(node_type)
+
+        self.assemble_element_matrix(self.mesh)
+        mat_A_glo, mat_B_glo = self.assemble_global_matrix(self.matrix_type)
+        BC_tag, BC_type, BC_value, leng_seg = self.make_boundary_info(self.mesh)
+        mat_A_glo, mat_B_glo = self.set_boundary_condition(mat_A_glo, mat_B_glo, BC_tag, BC_type, BC_value, leng_seg)
+        unknown_vec_u, eigenvalues = self.solve_simultaneous_equations(mat_A_glo, mat_B_glo)
+        return self.restore_node_order(unknown_vec_u), eigenvalues
+
+    #節点データを生成
+    @measure_stage
+    def generate_nodes(self, node_type):
+        #格子点配置。節点、三角形要素、境界線分要素を式で直接作る
+        if (node_type[0]=='lattice'):
+            lattice_num = node_type[1]  #格子分割におけるx・y方向の節点数
+            nod_pos_glo, nod_num_tri, nod_num_seg = generate_lattice(self.x_min, self.x_max, self.y_min, self.y_max, lattice_num)
+
+        #ランダム配置
+        elif (node_type[0]=='random'):
+            import scipy.spatial  #ドロネー分割
+            random_num = node_type[1]  #ランダム分割における節点数
+            nodes = np.random.rand(random_num,2)  #[0~1,0~1]の点をrandom_num個生成
+            nodes[:,0] = self.x_min +(self.x_max-self.x_min)*nodes[:,0]
+            nodes[:,1] = self.y_min +(self.y_max-self.y_min)*nodes[:,1]
+
+            #隅に点を移動
+            if (4<=random_num):
+                nodes[0,0],nodes[0,1] = (self.x_min, (self.y_max+self.y_min)/2)
+                nodes[1,0],nodes[1,1] = (self.x_max, (self.y_max+self.y_min)/2)
+                nodes[2,0],nodes[2,1] = ((self.x_max+self.x_min)/2, self.y_min)
+                nodes[3,0],nodes[3,1] = ((self.x_max+self.x_min)/2, self.y_max)
+                '''nodes[4,0],nodes[4,1] = (self.x_min, self.y_min)
+                nodes[5,0],nodes[5,1] = (self.x_min, self.y_max)
+                nodes[6,0],nodes[6,1] = (self.x_max, self.y_min)
+                nodes[7,0],nodes[7,1] = (self.x_max, self.y_max)  #'''
+
+            #節点をドロネー分割
+            delaunay_data = scipy.spatial.Delaunay(nodes)
+            nod_pos_glo = delaunay_data.points  #[nod_total,2]
+            nod_num_tri = delaunay_data.simplices  #[tri_ele_total,3]
+            nod_num_seg = delaunay_data.convex_hull  #[seg_ele_total,2]
+
+        #save_storeで保存したメッシュを読み込む。文字列は保存先のディレクトリ
+        elif (node_type[0]=='store'):
+            mesh, arrays = load_store(node_type[1])
+            nod_pos_glo, nod_num_tri, nod_num_seg = mesh.nod_pos_glo, mesh.nod_num_tri, mesh.nod_num_seg
+
+        #print('節点数、三角形要素数、境界線分要素数')
+        #print(len(nod_pos_glo), len(nod_num_tri), len(nod_num_seg))
+
+        log_array(LOG_DEBUG, 'Global節点のx,y座標', nod_pos_glo)
+        log_array(LOG_DEBUG, '三角形要素を構成する節点番号', nod_num_tri)
+        log_array(LOG_DEBUG, '境界線分要素を構成する節点番号', nod_num_seg)
+
+        record_statistics(nod_total=int(len(nod_pos_glo)), tri_ele_total=int(len(nod_num_tri)), seg_ele_total=int(len(nod_num_seg)))
+        self.mesh, self.node_order = Mesh(nod_pos_glo, nod_num_tri, nod_num_seg), None
+        return self.mesh
+
+    #節点を並べ替えたメッシュを作り、属性meshに保持する。三角形要素は最も小さい新しい節点番号の順に並べる
+    #元の節点番号(新しい番号の順)を属性node_orderに保持し、solveの結果は元の節点番号の順に戻す
+    @measure_stage
+    def reorder_nodes(self, mesh, reorder_type):
+        node_order = make_node_order(mesh, reorder_type)
+        node_rank = np.empty_like(node_order)  #元の節点番号から新しい節点番号への対応
+        node_rank[node_order] = np.arange(len(node_order), dtype=node_order.dtype)
+        nod_num_tri = node_rank[mesh.nod_num_tri]
+        nod_num_tri = nod_num_tri[np.argsort(np.min(nod_num_tri, axis=1), kind='stable')]
+        reordered_mesh = Mesh(mesh.nod_pos_glo[node_order], nod_num_tri, node_rank[mesh.nod_num_seg])
+
+        bandwidth_before, profile_before = measure_bandwidth(mesh.nod_num_tri, len(node_order))
+        bandwidth, profile = measure_bandwidth(reordered_mesh.nod_num_tri, len(node_order))
+        log_print(LOG_SUMMARY, 'Reorder nodes ({}): bandwidth {} -> {}, profile {} -> {}'.format(
+                  reorder_type, bandwidth_before, bandwidth, profile_before, profile))
+        record_statistics(bandwidth_before=bandwidth_before, bandwidth=bandwidth, profile_before=profile_before, profile=profile)
+
+        self.mesh, self.node_order = reordered_mesh, node_order
+        return reordered_mesh
+
+    #新しい節点番号の順の配列(行が節点)を、元の節点番号の順に戻す(節点を並べ替えていなければそのまま返す)
+    #block_size列ずつその場で書き換えるので、メモリマップの配列にも使える
+    def restore_node_order(self, vec, block_size=64):
+        if(self.node_order is None):
+            return vec
+        node_rank = np.empty_like(self.node_order)
+        node_rank[self.node_order] = np.arange(len(self.node_order), dtype=self.node_order.dtype)
+        vec_2d = vec.reshape(len(vec), -1)
+        for i in range(0, vec_2d.shape[1], block_size):
+            vec_2d[:,i:i+block_size] = vec_2d[node_rank,i:i+block_size]
+        return vec
+
+    #solveで求めた解(元の節点番号の順)を、任意の点[点の数,2]で補間する。gradient=Trueなら勾配も返す。メッシュの外の点はNaN
+    def probe(self, unknown_vec_u, points, gradient=False):
+        return probe_solution(self.mesh, unknown_vec_u, points, gradient, self.node_order)
+
+    #三角形要素の面積と形状関数の係数は、要素行列を作る時に初めて計算される
+    @measure_stage
+    def make_mesh_data(self, mesh):
+        log_print(LOG_SUMMARY, '境界線分要素の長さ')
+        log_array(LOG_DEBUG, 'leng_seg =', mesh.leng_seg)
+
+        return mesh
+
+    #要素行列の構築
+    @measure_stage
+    def assemble_element_matrix(self, mesh):
+        #各要素の面積と形状関数の係数(メッシュが保持する)
+        area_tri, shape_b, shape_c = mesh.area_tri, mesh.shape_b, mesh.shape_c
+
+        #全要素の要素行列を一括で計算
+        log_print(LOG_SUMMARY, "Local matrix")
+        if(self.assembly_workers<=1):
+            mat_A_ele, mat_B_ele = self.compute_element_matrix(area_tri, shape_b, shape_c, self.cons_p, self.cons_q)
+        else:  #要素を連続した区間に分け、スレッドごとに計算して出力配列の区間に書き込む(要素ごとの計算なので結果は逐次と同じ)
+            ele_bound = np.linspace(0, len(area_tri), self.assembly_workers+1).astype(np.int64)
+            mat_A_ele, mat_B_ele = np.empty((len(area_tri),3,3), np.float64), np.empty((len(area_tri),3,3), np.float64)
+            cons_p, cons_q = np.broadcast_to(self.cons_p, area_tri.shape), np.broadcast_to(self.cons_q, area_tri.shape)  #要素ごとの値でも区間で切り出せるように
+            def compute_part(part):
+                ele = slice(ele_bound[part], ele_bound[part+1])
+                mat_A_ele[ele], mat_B_ele[ele] = self.compute_element_matrix(area_tri[ele], shape_b[ele], shape_c[ele], cons_p[ele], cons_q[ele])
+            run_parallel(compute_part, self.assembly_workers)
+
+        self.mat_A_ele, self.mat_B_ele, self.area_tri = mat_A_ele, mat_B_ele, area_tri
+        return mat_A_ele, mat_B_ele, area_tri
+
+    #要素係数行列A,B[要素数,3,3]。各要素の面積と形状関数の係数b,c、係数p,q(全体で一定の値か要素ごとの値)から求める
+    def compute_element_matrix(self, area_tri, shape_b, shape_c, cons_p, cons_q):
+        mat_A_ele = (cons_p/(4.0*area_tri))[:,np.newaxis,np.newaxis] \
+                   * (np.einsum('ei,ej->eij', shape_b, shape_b) +np.einsum('ei,ej->eij', shape_c, shape_c))  #要素係数行列[tri_ele_total,3,3]
+        mat_B_ele = (cons_q*area_tri/12.0)[:,np.newaxis,np.newaxis] \
+                   * (np.ones((3,3)) +np.eye(3))  #要素係数行列[tri_ele_total,3,3]、対角成分はqS/6、非対角成分はqS/12
+        return mat_A_ele, mat_B_ele
+
+    #一部の要素elements(重複なし)の要素行列だけを置き換える
+    #組み立て済みのdata配列があれば、変わった要素の差分だけを足し込むので、次のassemble_global_matrixでは組み立て直さない
+    @measure_stage
+    def update_element_matrix(self, elements, mat_A_ele_new, mat_B_ele_new):
+        if(self.data_source is not None and self.data_source[0] is self.mat_A_ele):
+            self.data_source[2].update(self.data_A, elements, self.mat_A_ele[elements], mat_A_ele_new)
+            self.data_source[2].update(self.data_B, elements, self.mat_B_ele[elements], mat_B_ele_new)
+        self.mat_A_ele[elements], self.mat_B_ele[elements] = mat_A_ele_new, mat_B_ele_new
+
+    #材料の領域(要素elements、重複なし)の係数p,qを変える。その領域の要素行列だけを計算し直して、全体行列には差分だけを足し込む
+    #属性の係数p,qも要素ごとの値に書き換えるので、後で要素行列を全て作り直しても同じ係数になる
+    def update_region(self, elements, cons_p, cons_q):
+        mesh = self.mesh
+        self.cons_p, self.cons_q = np.array(np.broadcast_to(self.cons_p, mesh.area_tri.shape)), np.array(np.broadcast_to(self.cons_q, mesh.area_tri.shape))
+        self.cons_p[elements], self.cons_q[elements] = cons_p, cons_q
+        mat_A_ele_new, mat_B_ele_new = self.compute_element_matrix(mesh.area_tri[elements], mesh.shape_b[elements], mesh.shape_c[elements], cons_p, cons_q)
+        self.update_element_matrix(elements, mat_A_ele_new, mat_B_ele_new)
+
+    #全体行列の構築
+    @measure_stage
+    def assemble_global_matrix(self, matrix_type, assembly_plan=None):
+        nod_num_tri = self.mesh.nod_num_tri
+        nod_total = len(self.mesh.nod_pos_glo)
+
+        #全体行列を組み立てる（同じ位置の成分は足し合わされる）
+        log_print(LOG_SUMMARY, 'Assemble matrix')
+        if(matrix_type=='basic'):
+            row_glo = np.repeat(nod_num_tri, 3, axis=1).ravel()  #[tri_ele_total*9]、成分(e,i,j)の行番号nod_num_tri[e,i]
+            col_glo = np.tile(nod_num_tri, (1,3)).ravel()  #[tri_ele_total*9]、成分(e,i,j)の列番号nod_num_tri[e,j]
+            mat_A_glo = np.bincount(row_glo*nod_total +col_glo, weights=self.mat_A_ele.ravel(),
+                                    minlength=nod_total*nod_total).reshape(nod_total,nod_total)  #全体行列
+            mat_B_glo = np.bincount(row_glo*nod_total +col_glo, weights=self.mat_B_ele.ravel(),
+                                    minlength=nod_total*nod_total).reshape(nod_total,nod_total)  #全体行列
+        elif(matrix_type=='sparse'):
+            if(assembly_plan is None):  #組み立て計画を渡さなければ、メッシュが保持するものを使う(最初の1回だけ作成する)
+                assembly_plan = self.mesh.assembly_plan
+            #data配列は同じ組み立て計画の間は使い回し、要素行列が前回組み立てたもの(update_element_matrixで差分を足し込んだもの)なら組み立て直さない
+            if(self.data_A is None or len(self.data_A)!=assembly_plan.nnz):
+                self.data_A, self.data_B, self.data_A_bc = [np.empty(assembly_plan.nnz, np.float64) for i in range(3)]
+            if(self.data_source is None or self.data_source[0] is not self.mat_A_ele or self.data_source[1] is not self.mat_B_ele
+               or self.data_source[2] is not assembly_plan):
+                assembly_plan.assemble(self.mat_A_ele, self.data_A, worker_num=self.assembly_workers)  #既存のdata配列に足し込む
+                assembly_plan.assemble(self.mat_B_ele, self.data_B, worker_num=self.assembly_workers)
+                self.data_source = (self.mat_A_ele, self.mat_B_ele, assembly_plan)
+            np.copyto(self.data_A_bc, self.data_A)  #境界条件はAのdata配列を書き換えるので、写しの方に適用する
+            mat_A_glo = assembly_plan.matrix(self.data_A_bc)  #csr形式の圧縮行列(次の組み立てで上書きされる)
+            mat_B_glo = assembly_plan.matrix(self.data_B)  #csr形式の圧縮行列(境界条件では書き換えない)
+
+        log_matrix(LOG_DEBUG, 'Pre global matrix A', mat_A_glo)  #全体行列を10行10列まで確認
+        log_matrix(LOG_DEBUG, 'Pre global matrix B', mat_B_glo)
+        record_statistics(nnz=int(mat_A_glo.nnz if is_sparse(mat_A_glo) else np.count_nonzero(mat_A_glo)))
+
+        return mat_A_glo, mat_B_glo
+
+    #境界要素の情報を設定
+    @measure_stage
+    def make_boundary_info(self, mesh):
+        nod_pos_seg = mesh.nod_pos_seg  #[seg_ele_total,2,2]
+        leng_seg = mesh.leng_seg  #境界線分要素の長さ(メッシュが保持する)
+
+        #境界線分要素を、両端の節点がどの辺の近くにあるかで分類する(左、右、下、上の順に優先する)
+        BC_threshold = 0.5*np.mean(leng_seg)
+        pos_x, pos_y = nod_pos_seg[:,:,0], nod_pos_seg[:,:,1]  #[seg_ele_total,2]
+        BC_tag = np.select([np.all(pos_x < self.x_min +BC_threshold, axis=1),  #左側境界
+                            np.all(self.x_max -BC_threshold < pos_x, axis=1),  #右側境界
+                            np.all(pos_y < self.y_min +BC_threshold, axis=1),  #下側境界
+                            np.all(self.y_max -BC_threshold < pos_y, axis=1)],  #上側境界
+                           [TAG_LEFT, TAG_RIGHT, TAG_BOTTOM, TAG_TOP], TAG_OTHER).astype(np.int8)  #[seg_ele_total]
+
+        #タグごとの境界条件の種類と値。それ以外の線分要素はNeumann境界にしておく（何もしない）
+        BC_sides = [self.BC_left, self.BC_right, self.BC_bottom, self.BC_top, ('Neumann', 0.0)]
+        BC_type = np.array([BC_kinds[BC_side[0]] for BC_side in BC_sides], np.int8)  #[tag_total]
+        BC_value = np.array(np.broadcast_arrays(*[np.asarray(BC_side[1], np.float64) for BC_side in BC_sides]))  #[tag_total]
+        log_array(LOG_DEBUG, 'BC_tag =', BC_tag)
+        log_array(LOG_DEBUG, 'BC_type =', BC_type)
+        log_array(LOG_DEBUG, 'BC_value =', BC_value)
+
+        return BC_tag, BC_type, BC_value, leng_seg
+
+    #Dirichlet境界の節点を集める（複数の線分要素が共有する節点も1回だけ数える）
+    def get_dirichlet_nodes(self, BC_tag, BC_type):
+        seg_dirichlet = np.flatnonzero(BC_type[BC_tag]==BC_DIRICHLET)
+        return np.unique(self.mesh.nod_num_seg[seg_dirichlet])
+
+    #境界条件を実装
+    @measure_stage
+    def set_boundary_condition(self, mat_A_glo, mat_B_glo, BC_tag, BC_type, BC_value, leng_seg):
+        log_print(LOG_SUMMARY, 'Boundary conditions')
+
+        #Dirichlet境界条件の処理
+        nod_dirichlet = self.get_dirichlet_nodes(BC_tag, BC_type)  #Dirichlet境界の節点番号
+        mat_A_glo = eliminate_dirichlet_nodes(mat_A_glo, nod_dirichlet)  #行・列を0にし、対角成分は1にする
+        record_statistics(dirichlet_nod_total=int(len(nod_dirichlet)), neumann_seg_total=int(np.count_nonzero(BC_type[BC_tag]==BC_NEUMANN)))
+
+        log_matrix(LOG_DEBUG, 'Post global matrix A', mat_A_glo)  #全体行列を10行10列まで確認
+        log_matrix(LOG_DEBUG, 'Post global matrix B', mat_B_glo)
+
+        return mat_A_glo, mat_B_glo
+
+    #連立方程式を解く
+    @measure_stage
+    def solve_simultaneous_equations(self, mat_A_glo, mat_B_glo):
+        log_print(LOG_SUMMARY, '節点数、三角形要素数、境界線分要素数')
+        log_print(LOG_SUMMARY, len(self.mesh.nod_pos_glo), len(self.mesh.nod_num_tri), len(self.mesh.nod_num_seg))
+
+        log_print(LOG_SUMMARY, 'Solve linear equations')
+        mode_index = None if(self.output_modes is None) else np.asarray(self.output_modes)
+
         #Au=λBuから、固有値Eigと固有値ベクトルUを求める
-        eigenvalues, unknown_vec_u = scipy.linalg.eigh(mat_A_glo, omega**2 *mat_B_glo)
-    elif(matrix_type=='sparse'):
-        #lil形式をcsr形式に変換して計算。全ての固有値は求められない（kで個数を指定）
-        eigenvalues, unknown_vec_u = scipy.sparse.linalg.eigsh(mat_A_glo.tocsr(), k=len(nod_pos_glo)-1, M=omega**2 *mat_B_glo.tocsr())
-
-    print("Eigenvalues =\n", eigenvalues)  #固有値
-    print("Unkown vector U =\n", unknown_vec_u)  #未知数ベクトル
-
-    print("N_Eig = ", np.count_nonzero(eigenvalues))  #非ゼロの固有値の個数
-    eigenvalues_nonzero = eigenvalues[np.where(0.000001<abs(eigenvalues))]
-    print("eigenvalues_nonzero =\n", eigenvalues_nonzero)  #固有値の非ゼロ成分
-
-    return unknown_vec_u, eigenvalues
-
-
-#メッシュを表示
-def visualize_mesh(nod_pos_glo, show_text, out_type):
-    #plt.rcParams['font.family'] = 'Times New Roman' #全体のフォントを設定
-    fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
-
-    #plt.title("2D mesh for FEM") #グラフタイトル
-    plt.xlabel('$x$') #x軸の名前
-    plt.ylabel('$y$') #y軸の名前
-
-    #メッシュをプロット
-    plt.triplot(nod_pos_glo[:,0],nod_pos_glo[:,1], nod_num_tri, color='#0000ff')  #三角形要素
-    plt.scatter(nod_pos_glo[:,0],nod_pos_glo[:,1], color='#0000ff')  #節点
-
-    if(show_text==True):
-        for n in range(len(nod_pos_glo)):  #節点番号
-            plt.text(nod_pos_glo[n,0], nod_pos_glo[n,1], n, ha='right')
-        for e in range(len(nod_pos_tri)):  #三角形要素番号
-            meanX = (nod_pos_tri[e,0,0] +nod_pos_tri[e,1,0] +nod_pos_tri[e,2,0])/3.0
-            meanY = (nod_pos_tri[e,0,1] +nod_pos_tri[e,1,1] +nod_pos_tri[e,2,1])/3.0
-            plt.text(meanX, meanY, '#%d' %e, ha='center')
-        for e in range(len(nod_pos_seg)):  #線分要素番号
-            meanX = (nod_pos_seg[e,0,0] +nod_pos_seg[e,1,0])/2.0
-            meanY = (nod_pos_seg[e,0,1] +nod_pos_seg[e,1,1])/2.0
-            plt.text(meanX, meanY, '*%d' %e, ha='center')
-
-    #グラフを表示
-    if(out_type=='show'):
-        plt.show()
-    elif(out_type=='save'):
-        plt.savefig("fem2d_mesh.png")
-    plt.close()  #作成した図のウィンドウを消す
-
-
-#計算結果を表示
-def visualize_result(nod_pos_glo, unknown_vec_u, show_text=False, out_type='show'):
-    plt.rcParams['font.family'] = 'Times New Roman' #全体のフォントを設定
-    fig = plt.figure(figsize=(16, 12), dpi=100, facecolor='#ffffff')
-
-    fig.suptitle("FEA of 2D Helmholtz's equation", fontsize=16)  #全体のグラフタイトル
-
-    #表示する固有値・固有ベクトルの番号
-    if (BC_left[0]=='Dirichlet' or BC_right[0]=='Dirichlet' or
-        BC_bottom[0]=='Dirichlet' or BC_top[0]=='Dirichlet'):
-        count = 0
-    else:
-        count = 1
-
-    #数値解をプロット
-    for i in range(plot_num[0]*plot_num[1]):
-        ax = fig.add_subplot(plot_num[0], plot_num[1], i+1, projection='3d', azim=-120, elev=30)
-        #ax.set_title("Eig={:0.5f}".format(eigenvalues[count]))
-        ax.set_title("k={:0.5f}".format( np.sqrt(eigenvalues[count]) ))
-        ax.plot_trisurf(nod_pos_glo[:,0],nod_pos_glo[:,1],unknown_vec_u[:,count], cmap=cm.jet, linewidth=0)
-        count += 1
-    plt.tight_layout()  #余白を調整
-    plt.subplots_adjust(left=None, bottom=0.05, right=None, top=0.9, wspace=0.1, hspace=0.3)  #余白を調整
-
-    #グラフを表示
-    if(out_type=='show'):
-        plt.show()
-    elif(out_type=='save'):
-        plt.savefig("fem2d_helmholtz.png")
-    plt.close()  #作成した図のウィンドウを消す
+        if(self.matrix_type=='basic'):
+            import scipy.linalg  #SciPyの線形計算ソルバー
+            #求める固有ベクトルの、固有値を小さい順に数えた番号の範囲(Noneなら全て)
+            if(self.eigen_type[0]=='all'):  #全ての固有値を求める
+                index_range = None
+            elif(self.eigen_type[0]=='lowest'):  #小さい方からeigen_type[1]個の固有値を求める
+                index_range = [0, self.eigen_type[1]-1]
+            elif(self.eigen_type[0]=='target'):  #波数eigen_type[2]に近いeigen_type[1]個の固有値を求める
+                #シフトより小さい固有値の個数を慣性で数え、その前後eigen_num個ずつの番号の範囲だけを求める(近い個数はこの範囲に必ず入る)
+                eigen_num, nod_total = self.eigen_type[1], mat_A_glo.shape[0]
+                index_shift = count_eigenvalues_below(mat_A_glo, self.omega**2 *mat_B_glo, self.eigen_type[2]**2)
+                index_range = [max(index_shift -eigen_num, 0), min(index_shift +eigen_num, nod_total) -1]
+
+            #残す固有モードを指定した場合は、そのモードを含む範囲に狭める(メモリは節点数×範囲の個数に比例)
+            if(mode_index is not None and self.eigen_type[0]!='target'):
+                index_first = 0 if(index_range is None) else index_range[0]
+                index_range = [index_first +mode_index.min(), index_first +mode_index.max()]
+                mode_index = mode_index -mode_index.min()
+            eigenvalues, unknown_vec_u = scipy.linalg.eigh(mat_A_glo, self.omega**2 *mat_B_glo, subset_by_index=index_range)
+            if(self.eigen_type[0]=='target'):  #求めた範囲から、シフトに近いeigen_num個(番号は連続する)だけを残す
+                index_near = np.sort(np.argsort(np.absolute(eigenvalues -self.eigen_type[2]**2))[:eigen_num])
+                eigenvalues, unknown_vec_u = eigenvalues[index_near], unknown_vec_u[:,index_near]
+
+        elif(self.matrix_type=='sparse'):
+            import scipy.sparse.linalg  #圧縮行列用ソルバー
+            if(self.eigen_type[0]=='all'):  #全ての固有値を求める
+                #全ての固有値は求められない（kで個数を指定）
+                eigenvalues, unknown_vec_u = scipy.sparse.linalg.eigsh(mat_A_glo, k=len(self.mesh.nod_pos_glo)-1, M=self.omega**2 *mat_B_glo)
+            elif(self.eigen_type[0]=='lowest'):  #小さい方からeigen_type[1]個の固有値を求める
+                #固有値は0以上なので、負のシフトσ=-1でshift-invertすると、σに近い順＝小さい順に求まる
+                eigenvalues, unknown_vec_u = scipy.sparse.linalg.eigsh(mat_A_glo, k=self.eigen_type[1], M=self.omega**2 *mat_B_glo,
+                                                                       sigma=-1.0, which='LM')
+            elif(self.eigen_type[0]=='target'):  #波数eigen_type[2]に近いeigen_type[1]個の固有値を求める
+                eigenvalues, unknown_vec_u = scipy.sparse.linalg.eigsh(mat_A_glo, k=self.eigen_type[1], M=self.omega**2 *mat_B_glo,
+                                                                       sigma=self.eigen_type[2]**2, which='LM')
+
+        #固有値を小さい順に並べ替え、残す固有モードだけを指定の型と出力先に書き出す
+        eigen_order = np.argsort(eigenvalues)
+        if(mode_index is not None):
+            eigen_order = eigen_order[mode_index]
+        eigenvalues = eigenvalues[eigen_order]
+        unknown_vec_u = write_eigenvectors(unknown_vec_u, eigen_order, self.output_type)
+
+        log_array(LOG_SUMMARY, "Eigenvalues =", eigenvalues)  #固有値
+        log_array(LOG_DEBUG, "Unkown vector U =", unknown_vec_u)  #未知数ベクトル
+
+        log_print(LOG_SUMMARY, "N_Eig = ", np.count_nonzero(eigenvalues))  #非ゼロの固有値の個数
+        record_statistics(eigen_num=int(len(eigenvalues)))
+        eigenvalues_nonzero = eigenvalues[np.where(0.000001<abs(eigenvalues))]
+        log_array(LOG_DEBUG, "eigenvalues_nonzero =", eigenvalues_nonzero)  #固有値の非ゼロ成分
+
+        return unknown_vec_u, eigenvalues
+
+    #メッシュを表示
+    def visualize_mesh(self, nod_pos_glo, show_text, out_type):
+        import matplotlib.pyplot as plt  #グラフ作成
+        #plt.rcParams['font.family'] = 'Times New Roman' #全体のフォントを設定
+        fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
+
+        #plt.title("2D mesh for FEM") #グラフタイトル
+        plt.xlabel('$x$') #x軸の名前
+        plt.ylabel('$y$') #y軸の名前
+
+        #メッシュをプロット
+        plt.triplot(nod_pos_glo[:,0],nod_pos_glo[:,1], self.mesh.nod_num_tri, color='#0000ff')  #三角形要素
+        plt.scatter(nod_pos_glo[:,0],nod_pos_glo[:,1], color='#0000ff')  #節点
+
+        if(show_text==True):
+            nod_pos_tri, nod_pos_seg = self.mesh.nod_pos_tri, self.mesh.nod_pos_seg  #Local節点座標
+            for n in range(len(nod_pos_glo)):  #節点番号
+                plt.text(nod_pos_glo[n,0], nod_pos_glo[n,1], n, ha='right')
+            for e in range(len(nod_pos_tri)):  #三角形要素番号
+                meanX = (nod_pos_tri[e,0,0] +nod_pos_tri[e,1,0] +nod_pos_tri[e,2,0])/3.0
+                meanY = (nod_pos_tri[e,0,1] +nod_pos_tri[e,1,1] +nod_pos_tri[e,2,1])/3.0
+                plt.text(meanX, meanY, '#%d' %e, ha='center')
+            for e in range(len(nod_pos_seg)):  #線分要素番号
+                meanX = (nod_pos_seg[e,0,0] +nod_pos_seg[e,1,0])/2.0
+                meanY = (nod_pos_seg[e,0,1] +nod_pos_seg[e,1,1])/2.0
+                plt.text(meanX, meanY, '*%d' %e, ha='center')
+
+        #グラフを表示
+        if(out_type=='show'):
+            plt.show()
+        elif(out_type=='save'):
+            plt.savefig("fem2d_mesh.png")
+        plt.close()  #作成した図のウィンドウを消す
+
+    #計算結果を表示
+    def visualize_result(self, nod_pos_glo, unknown_vec_u, eigenvalues, show_text=False, out_type='show', plot_num=(5, 6)):
+        import matplotlib.pyplot as plt  #グラフ作成
+        from mpl_toolkits.mplot3d import Axes3D  #3Dグラフ
+        from matplotlib import cm  #カラーマップ
+        plt.rcParams['font.family'] = 'Times New Roman' #全体のフォントを設定
+        fig = plt.figure(figsize=(16, 12), dpi=100, facecolor='#ffffff')
+
+        fig.suptitle("FEA of 2D Helmholtz's equation", fontsize=16)  #全体のグラフタイトル
+
+        #表示する固有値・固有ベクトルの番号
+        if (self.BC_left[0]=='Dirichlet' or self.BC_right[0]=='Dirichlet' or
+            self.BC_bottom[0]=='Dirichlet' or self.BC_top[0]=='Dirichlet'):
+            count = 0
+        else:
+            count = 1
+
+        #数値解をプロット
+        for i in range(plot_num[0]*plot_num[1]):
+            ax = fig.add_subplot(plot_num[0], plot_num[1], i+1, projection='3d', azim=-120, elev=30)
+            #ax.set_title("Eig={:0.5f}".format(eigenvalues[count]))
+            ax.set_title("k={:0.5f}".format( np.sqrt(eigenvalues[count]) ))
+            ax.plot_trisurf(nod_pos_glo[:,0],nod_pos_glo[:,1],unknown_vec_u[:,count], cmap=cm.jet, linewidth=0)
+            count += 1
+        plt.tight_layout()  #余白を調整
+        plt.subplots_adjust(left=None, bottom=0.05, right=None, top=0.9, wspace=0.1, hspace=0.3)  #余白を調整
+
+        #グラフを表示
+        if(out_type=='show'):
+            plt.show()
+        elif(out_type=='save'):
+            plt.savefig("fem2d_helmholtz.png")
+        plt.close()  #作成した図のウィンドウを消す
 
 
 #スクリプトとして起動した時のみ実行
@@ -351,45 +1069,113 @@ if (__name__=='__main__'):
     #BC_bottom = ['Neumann', 0.0]
     #BC_top = ['Neumann', 0.0]
 
-    #節点の生成方法。lattice,random
+    #節点の生成方法。lattice,random,store
     node_type = ['lattice', 30]  #数字は格子分割におけるx・y方向の節点数
     #node_type = ['random', 1000]  #数字はランダム分割における節点数
+    #node_type = ['store', 'mesh_store']  #文字列はsave_storeで保存したディレクトリ(同じメッシュを読み込む)
     matrix_type = 'basic'  #全体行列の形式。basic,sparse
+    log_level = LOG_SUMMARY  #診断出力のレベル。LOG_SILENT,LOG_SUMMARY,LOG_DEBUG
+    telemetry_enabled = False  #処理段階ごとの計測(時間、メモリ、統計量)の有無
+    telemetry_file = 'telemetry.json'  #計測結果の出力先(JSON)
+    store_dir = None  #メッシュと計算結果の保存先のディレクトリ。Noneなら保存しない
+    reorder_type = None  #節点の並べ替え。None,rcm(逆Cuthill-McKee法),hilbert(ヒルベルト曲線)
+    assembly_workers = 1  #要素行列の計算と全体行列の組み立てに使うスレッド数。結果はスレッド数によらず同じ
+    probe_points = None  #解を補間して求める点の座標[点の数,2]。Noneなら求めない
+    #probe_points = np.array([[0.0, 0.0], [0.5, 0.25], [2.0, 0.0]])  #メッシュの外の点はNaNになる
+
+    #求める固有値の範囲。all,lowest,target
+    plot_num = [5, 6]  #グラフの縦横の作成数
+    eigen_type = ['lowest', plot_num[0]*plot_num[1]+1]  #数字は小さい方から求める固有値の個数
+    #eigen_type = ['all']  #全ての固有値を求める
+    #eigen_type = ['target', 10, 5.0]  #数字は求める固有値の個数と、目標の波数k
+
+    #固有ベクトルの出力。残す固有モードの番号(求めた固有値を小さい順に並べた番号、Noneなら全て)と、出力先・型
+    output_modes = None
+    #output_modes = range(plot_num[0]*plot_num[1]+1)  #グラフに使う固有モードだけを残す
+    output_type = ['memory', 'float64']  #メモリ上に保持。型はfloat64,float32
+    #output_type = ['file', 'float32', 'eigenvectors.npy']  #.npyファイルにメモリマップで書き出す
 
-    #節点データ生成。Global節点座標、三角形要素の節点番号、境界線分要素の節点番号
-    nod_pos_glo, nod_num_tri, nod_num_seg = generate_nodes(node_type)
+    #係数のパラメータスイープ。(omega, cons_p, cons_q)の組のリスト。空ならスイープしない
+    #cons_p,cons_qは全体で一定の値か、領域ごとの値のリスト(region_eleで各三角形要素の領域番号を指定)
+    sweep_points = []
+    region_ele = None
+    sweep_file = 'sweep_table.npy'  #スイープ結果の表(各点のパラメータと固有値)の保存先。Noneなら保存しない
+    #sweep_points = [(omega_i, 1.0, 1.0) for omega_i in np.linspace(0.5, 2.0, 7)]
+    #sweep_points = [(1.0, [1.0, cons_p_i], 1.0) for cons_p_i in np.linspace(1.0, 4.0, 7)]  #領域1(x>0)の係数pだけを変える
 
-    #Local節点座標を作成。三角形要素のLocal節点座標、境界線分要素のLocal節点座標
-    nod_pos_tri, nod_pos_seg = make_mesh_data()
+    #問題を作成。計算条件は属性として保持する
+    problem = Helmholtz2D(x_min, x_max, y_min, y_max, cons_p, cons_q, omega, BC_left, BC_right, BC_bottom, BC_top,
+                          matrix_type, eigen_type, output_modes, output_type, reorder_type, assembly_workers)
+
+    #節点データ生成。Global節点座標、三角形要素の節点番号、境界線分要素の節点番号を持つメッシュ
+    mesh = problem.generate_nodes(node_type)
+
+    #節点の並べ替え。帯幅を小さくし、近くの節点を近い番号にする。並べ替えた場合は、以降は新しい節点番号のメッシュで計算する
+    if(reorder_type is not None):
+        mesh = problem.reorder_nodes(mesh, reorder_type)
+    nod_pos_glo = mesh.nod_pos_glo
+
+    #境界線分要素の長さを求めて、メッシュに保持する(面積と形状関数の係数は要素行列の構築時に求めて保持する)
+    problem.make_mesh_data(mesh)
+
+    #全体行列の組み立て計画。メッシュが保持し、同じメッシュで何度も組み立てる場合は使い回す
+    assembly_plan = mesh.assembly_plan
+
+    #パラメータスイープで領域ごとに係数を変える場合は、各三角形要素の領域番号を設定
+    #region_ele = (np.mean(mesh.nod_pos_tri[:,:,0], axis=1) > 0.0).astype(np.int64)  #x>0を領域1にする
 
     #メッシュを表示(ポストプロセス)。番号などの有無(True,False)、グラフの表示方法(show,save)
-    visualize_mesh(nod_pos_glo, show_text=False, out_type='show')
+    problem.visualize_mesh(nod_pos_glo, show_text=False, out_type='show')
 
 
     ##### メインプロセス #####
     #計算の開始時刻を記録
-    print ("Calculation start: ", time.ctime())  #計算開始時刻を表示
+    log_print(LOG_SUMMARY, "Calculation start: ", time.ctime())  #計算開始時刻を表示
     compute_time = time.time()  #計算の開始時刻
 
     #要素行列の構築
-    mat_A_ele, mat_B_ele, area_tri = assemble_element_matrix(nod_num_tri, nod_pos_tri)
+    mat_A_ele, mat_B_ele, area_tri = problem.assemble_element_matrix(mesh)
 
     #全体行列の構築
-    mat_A_glo, mat_B_glo = assemble_global_matrix(matrix_type)
+    mat_A_glo, mat_B_glo = problem.assemble_global_matrix(matrix_type, assembly_plan)
 
     #境界要素の情報を設定
-    BC_type, BC_value, leng_seg = make_boundary_info(nod_pos_seg)
+    BC_tag, BC_type, BC_value, leng_seg = problem.make_boundary_info(mesh)
 
     #境界条件を実装
-    mat_A_glo, mat_B_glo = set_boundary_condition(mat_A_glo, mat_B_glo, BC_type, BC_value, leng_seg)
+    mat_A_glo, mat_B_glo = problem.set_boundary_condition(mat_A_glo, mat_B_glo, BC_tag, BC_type, BC_value, leng_seg)
 
     #連立方程式を解く
-    unknown_vec_u, eigenvalues = solve_simultaneous_equations(mat_A_glo, mat_B_glo)
+    unknown_vec_u, eigenvalues = problem.solve_simultaneous_equations(mat_A_glo, mat_B_glo)
 
     #計算時間の表示
     compute_time = time.time() -compute_time
-    print ("Calculation time: {:0.5f}[sec]".format(compute_time))
+    log_print(LOG_SUMMARY, "Calculation time: {:0.5f}[sec]".format(compute_time))
+
+    #係数のパラメータスイープ
+    if(0<len(sweep_points)):
+        sweep_table = sweep_coefficients(mat_A_ele/cons_p, mat_B_ele/cons_q, assembly_plan, problem.get_dirichlet_nodes(BC_tag, BC_type),
+                                         sweep_points, plot_num[0]*plot_num[1], region_ele)
+        log_print(LOG_SUMMARY, 'Sweep table (omega, p, q, eigenvalues)')
+        for sweep_row in sweep_table:
+            log_print(LOG_SUMMARY, sweep_row['omega'], sweep_row['cons_p'], sweep_row['cons_q'], sweep_row['eigenvalues'])
+        if(sweep_file is not None):
+            np.save(sweep_file, sweep_table)
+
+    #任意の点での解と勾配(プローブ)
+    if(probe_points is not None):
+        probe_u, probe_grad = probe_solution(mesh, unknown_vec_u, probe_points, gradient=True)
+        log_array(LOG_SUMMARY, 'Probe U =', probe_u)
+        log_array(LOG_SUMMARY, 'Probe grad U =', probe_grad)
+
+    #メッシュと計算結果を保存する。次回はnode_type = ['store', store_dir]で同じメッシュを使える
+    if(store_dir is not None):
+        save_store(store_dir, mesh, BC_tag=BC_tag, BC_type=BC_type, BC_value=BC_value, mat_A_glo=mat_A_glo, mat_B_glo=mat_B_glo,
+                   unknown_vec_u=unknown_vec_u, eigenvalues=eigenvalues)
+
+    #処理段階ごとの計測結果をJSONで書き出す
+    if(telemetry_enabled):
+        write_telemetry(telemetry_file, script='fem2d_helmholtz', node_type=node_type, matrix_type=matrix_type, compute_time=compute_time)
 
     #計算結果を表示(ポストプロセス)。番号などの有無(True,False)、グラフの表示方法(show,save)
-    plot_num = [5, 6]  #グラフの縦横の作成数
-    visualize_result(nod_pos_glo, unknown_vec_u, show_text=False, out_type='show')
+    problem.visualize_result(nod_pos_glo, unknown_vec_u, eigenvalues, show_text=False, out_type='show', plot_num=plot_num)
@@ -1,324 +1,1349 @@
 #2次元Poisson方程式を、有限要素法で解く
 #偏微分方程式： ∇・[p(x,y)∇u(x,y)] = f(x,y)  (in Ω)
 #境界条件： u(x,y)=alpha  (on Γ1),  du(x,y)/dx=beta  (on Γ2)
+import os  #保存先のファイル操作
+import sys  #読み込み済みのモジュール
 import time  #時刻を扱うライブラリ
+import functools  #計測用のデコレータ
+import json  #計測結果の書き出し
+import tracemalloc  #メモリ使用量の計測
+import collections  #LU分解のキャッシュ(OrderedDict)
+import hashlib  #キャッシュのキーを作るハッシュ関数
 import numpy as np  #数値計算用
-import scipy.spatial  #ドロネー分割
-import scipy.linalg  #SciPyの線形計算ソルバー
-import scipy.sparse  #圧縮行列の処理
-import scipy.sparse.linalg  #圧縮行列用ソルバー
-import matplotlib.pyplot as plt  #グラフ作成
-from mpl_toolkits.mplot3d import Axes3D  #3Dグラフ
-from matplotlib import cm  #カラーマップ
-
-
-#節点データを生成
-def generate_nodes(node_type):
-    #格子点配置
-    if (node_type[0]=='lattice'):
-        lattice_num = node_type[1]  #格子分割におけるx・y方向の節点数
-        x = np.linspace(x_min, x_max, lattice_num)
-        y = np.linspace(y_min, y_max, lattice_num)
-
-        nodes = np.empty((lattice_num*lattice_num,2), np.float64)
-        for j in range(lattice_num):
-            for i in range(lattice_num):
-                nodes[i +lattice_num*j, 0] = x[i]
-                nodes[i +lattice_num*j, 1] = y[j]
-
-    #ランダム配置
-    elif (node_type[0]=='random'):
-        random_num = node_type[1]  #ランダム分割における節点数
-        nodes = np.random.rand(random_num,2)  #[0~1,0~1]の点をrandom_num個生成
-        nodes[:,0] = x_min +(x_max-x_min)*nodes[:,0]
-        nodes[:,1] = y_min +(y_max-y_min)*nodes[:,1]
-
-        #隅に点を移動
-        if (4<=random_num):
-            nodes[0,0],nodes[0,1] = (x_min, (y_max+y_min)/2)
-            nodes[1,0],nodes[1,1] = (x_max, (y_max+y_min)/2)
-            nodes[2,0],nodes[2,1] = ((x_max+x_min)/2, y_min)
-            nodes[3,0],nodes[3,1] = ((x_max+x_min)/2, y_max)
-            '''nodes[4,0],nodes[4,1] = (x_min, y_min)
-            nodes[5,0],nodes[5,1] = (x_min, y_max)
-            nodes[6,0],nodes[6,1] = (x_max, y_min)
-            nodes[7,0],nodes[7,1] = (x_max, y_max)  #'''
-
-    #節点をドロネー分割
-    delaunay_data = scipy.spatial.Delaunay(nodes)
-
-    nod_total = delaunay_data.points.shape[0]
-    tri_ele_total = delaunay_data.simplices.shape[0]
-    seg_ele_total = delaunay_data.convex_hull.shape[0]
-    print('節点数、三角形要素数、境界線分要素数')
-    print(nod_total, tri_ele_total, seg_ele_total)
-
-    nod_pos_glo = delaunay_data.points  #[nod_total,2]
-    print('Global節点のx,y座標\n', nod_pos_glo)
-
-    nod_num_tri = delaunay_data.simplices  #[tri_ele_total,3]
-    print('三角形要素を構成する節点番号\n', nod_num_tri)
-
-    nod_num_seg = delaunay_data.convex_hull  #[seg_ele_total,2]
-    print('境界線分要素を構成する節点番号\n', nod_num_seg)
+#SciPyのサブモジュールとMatplotlibは、使う関数の中で読み込む(計算だけなら描画用のモジュールは読み込まない)
+
+
+#診断出力のレベル。silent:何も表示しない、summary:処理の流れと要約のみ、debug:配列や行列の中身も表示
+LOG_SILENT, LOG_SUMMARY, LOG_DEBUG = 0, 1, 2
+log_level = LOG_SUMMARY
+log_edgeitems = 3  #debugで配列を表示する場合の、先頭と末尾の要素数
+
+
+#診断出力。levelがlog_level以下の場合のみ表示する
+#引数に関数を渡した場合は、表示する時にだけ呼び出す(表示しない文字列は作らない)
+def log_print(level, *args):
+    if(level <= log_level):
+        print(*[arg() if callable(arg) else arg for arg in args])
+
+
+#配列の診断出力。大きな配列は先頭と末尾のlog_edgeitems個だけに切り詰める
+def log_array(level, title, array):
+    if(level <= log_level):
+        print(title)
+        print(np.array2string(np.asarray(array), threshold=2*log_edgeitems, edgeitems=log_edgeitems))
+
+
+#疎行列かどうかを判定する。scipy.sparseを読み込んでいなければ疎行列は作られていないので、読み込まずに済ませる
+def is_sparse(mat):
+    return ('scipy.sparse' in sys.modules) and sys.modules['scipy.sparse'].issparse(mat)
+
+
+#全体行列の診断出力。左上の10行10列(と右辺ベクトル)だけを取り出して表示する
+def log_matrix(level, title, mat, vec=None):
+    if(level <= log_level):
+        print(title)
+        mat_head = mat[:10,:10]
+        if(is_sparse(mat_head)):
+            mat_head = mat_head.toarray()
+        for i in range(len(mat_head)):
+            line = "".join("{:7.2f}".format(value) for value in mat_head[i])
+            if(vec is not None):
+                line += ";" +"".join("{:7.2f}".format(value) for value in np.atleast_1d(vec[i]))
+            print(line)
+
+
+#処理段階ごとの計測結果(壁時計時間、CPU時間、メモリ使用量のピーク)と、問題の統計量。JSONで書き出す
+telemetry_enabled = False
+telemetry = {'stages':{}, 'statistics':{}}
+
+
+#計測結果を空にする
+def reset_telemetry():
+    telemetry['stages'].clear()
+    telemetry['statistics'].clear()
+
+
+#問題の統計量(節点数、要素数、非ゼロ成分数、フィルイン、反復回数など)を記録
+def record_statistics(**statistics):
+    if(telemetry_enabled):
+        telemetry['statistics'].update(statistics)
+
+
+#処理段階の関数を計測するデコレータ。同じ段階を複数回呼んだ場合は、時間を合計してピークは最大値を残す
+#メモリはtracemallocで追跡した確保量(NumPy配列を含む)のうち、段階の開始時から増えた分のピーク
+def measure_stage(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if(not telemetry_enabled):
+            return func(*args, **kwargs)
+        if(not tracemalloc.is_tracing()):
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+        wall_time, cpu_time = time.perf_counter(), time.process_time()
+
+        result = func(*args, **kwargs)
+
+        wall_time, cpu_time = time.perf_counter() -wall_time, time.process_time() -cpu_time
+        peak_memory = tracemalloc.get_traced_memory()[1] -memory_start
+        stage = telemetry['stages'].setdefault(func.__name__, {'calls':0, 'wall_time':0.0, 'cpu_time':0.0, 'peak_memory':0})
+        stage['calls'] += 1
+        stage['wall_time'] += wall_time
+        stage['cpu_time'] += cpu_time
+        stage['peak_memory'] = max(stage['peak_memory'], peak_memory)
+        log_print(LOG_SUMMARY, lambda: 'Stage {}: wall = {:0.5f}[sec], cpu = {:0.5f}[sec], peak memory = {:0.3f}[MB]'.format(
+                  func.__name__, wall_time, cpu_time, peak_memory/2**20))
+        return result
+    return wrapper
+
+
+#計測結果をJSONで書き出す。run_infoには計算条件(節点の生成方法など)を渡す
+def write_telemetry(file_path, **run_info):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(run_info, **telemetry), f, indent=2, ensure_ascii=False)
+
+
+#関数func(チャンク番号)を、チャンク番号0〜worker_num-1についてスレッドプールで並列に実行する
+#NumPyの配列演算はGILを解放するので、各スレッドが別のコアを使える。worker_numが1ならこのスレッドで実行する
+def run_parallel(func, worker_num):
+    if(worker_num<=1):
+        func(0)
+        return
+    import concurrent.futures  #スレッドプール
+    with concurrent.futures.ThreadPoolExecutor(max_workers=worker_num) as executor:
+        list(executor.map(func, range(worker_num)))  #例外があればここで送出される
+
+
+#全体行列の組み立て計画
+#csr形式の非ゼロパターンと、各要素成分(e,i,j)がdata配列のどこに足し込まれるかを保持する
+class AssemblyPlan:
+    def __init__(self, nod_num_tri, nod_total):
+        self.nod_num_tri = nod_num_tri
+        self.nod_total = nod_total
+
+        #全要素の(i,j)成分に対応するGlobal節点番号を行優先の通し番号にする
+        row_glo = np.repeat(nod_num_tri, 3, axis=1).ravel().astype(np.int64)  #成分(e,i,j)の行番号nod_num_tri[e,i]
+        col_glo = np.tile(nod_num_tri, (1,3)).ravel().astype(np.int64)  #成分(e,i,j)の列番号nod_num_tri[e,j]
+        key_csr, slot_glo = np.unique(row_glo*nod_total +col_glo, return_inverse=True)
+
+        #csr形式の非ゼロパターン
+        self.indices = (key_csr % nod_total).astype(np.int32)  #各非ゼロ成分の列番号
+        self.indptr = np.zeros(nod_total+1, np.int32)  #各行の先頭位置
+        self.indptr[1:] = np.cumsum(np.bincount(key_csr//nod_total, minlength=nod_total))
+        self.slot_ele = slot_glo.reshape(-1,3,3)  #[tri_ele_total,3,3]、成分(e,i,j)のdata配列内の位置
+        self.nnz = len(key_csr)  #非ゼロ成分の個数
+        self.partitions = {}  #並列に組み立てるための分割(スレッド数ごとに最初の1回だけ作成する)
+
+    #並列に組み立てるための分割。全体行列を行の境界でworker_num個の区間に分け(非ゼロ成分数がほぼ等しくなるように)、
+    #各区間のdata配列の範囲と節点番号の範囲、その区間に足し込む要素成分と要素ベクトル成分の通し番号(元の順のまま)を返す
+    #区間ごとに別のスレッドで足し込むので結果を合わせる処理は要らず、各成分に足す順も逐次の場合と同じになる(結果はビット単位で一致する)
+    def partition(self, worker_num):
+        if(worker_num not in self.partitions):
+            row_bound = np.concatenate(([0], np.searchsorted(self.indptr, np.linspace(0, self.nnz, worker_num+1)[1:-1]), [self.nod_total]))
+            slot_bound = self.indptr[row_bound]
+            part_slot = np.searchsorted(slot_bound[1:-1], self.slot_ele.ravel(), side='right')  #各要素成分が足し込まれる区間
+            part_nod = np.searchsorted(row_bound[1:-1], self.nod_num_tri.ravel(), side='right')  #各要素ベクトル成分が足し込まれる区間
+            slot_part = np.split(np.argsort(part_slot, kind='stable'), np.cumsum(np.bincount(part_slot, minlength=worker_num))[:-1])
+            nod_part = np.split(np.argsort(part_nod, kind='stable'), np.cumsum(np.bincount(part_nod, minlength=worker_num))[:-1])
+            self.partitions[worker_num] = (slot_bound, slot_part, row_bound, nod_part)
+        return self.partitions[worker_num]
+
+    #要素行列をdata配列に足し込む。dataを渡した場合はその配列を0クリアしてから上書きする
+    #worker_numが2以上なら、partitionの区間ごとにスレッドプールで並列に足し込む
+    def assemble(self, mat_ele, data=None, worker_num=1):
+        if(data is None):
+            data = np.zeros(self.nnz, np.float64)
+        else:
+            data[:] = 0.0
+        if(worker_num<=1):
+            np.add.at(data, self.slot_ele.ravel(), mat_ele.ravel())
+            return data
+
+        slot_bound, slot_part, row_bound, nod_part = self.partition(worker_num)
+        slot_ele, mat_ele = self.slot_ele.reshape(-1), mat_ele.reshape(-1)
+        def assemble_part(part):
+            data_part = data[slot_bound[part]:slot_bound[part+1]]  #この区間のdata配列(ビュー)
+            np.add.at(data_part, slot_ele[slot_part[part]] -slot_bound[part], mat_ele[slot_part[part]])
+        run_parallel(assemble_part, worker_num)
+        return data
+
+    #一部の要素(elements)の要素行列だけが変わった場合に、その差分をdata配列に足し込む
+    def update(self, data, elements, mat_ele_old, mat_ele_new):
+        np.add.at(data, self.slot_ele[elements].ravel(), (mat_ele_new -mat_ele_old).ravel())
+        return data
+
+    #要素ベクトルを全体ベクトルに足し込む。vecを渡した場合はその配列を0クリアしてから上書きする
+    #vec_eleが[tri_ele_total,3,荷重ケース数]の場合は、[nod_total,荷重ケース数]の全体ベクトルになる
+    def assemble_vector(self, vec_ele, vec=None, worker_num=1):
+        if(vec is None):
+            vec = np.zeros((self.nod_total,)+vec_ele.shape[2:], np.float64)
+        else:
+            vec[:] = 0.0
+        if(worker_num<=1):
+            np.add.at(vec, self.nod_num_tri.ravel(), vec_ele.reshape((-1,)+vec_ele.shape[2:]))
+            return vec
+
+        slot_bound, slot_part, row_bound, nod_part = self.partition(worker_num)
+        nod_num, vec_ele = self.nod_num_tri.reshape(-1), vec_ele.reshape((-1,)+vec_ele.shape[2:])
+        def assemble_part(part):
+            vec_part = vec[row_bound[part]:row_bound[part+1]]  #この区間の節点の全体ベクトル(ビュー)
+            np.add.at(vec_part, nod_num[nod_part[part]] -row_bound[part], vec_ele[nod_part[part]])
+        run_parallel(assemble_part, worker_num)
+        return vec
+
+    #data配列を共有するcsr形式の圧縮行列を作成
+    def matrix(self, data):
+        import scipy.sparse  #圧縮行列の処理
+        return scipy.sparse.csr_matrix((data, self.indices, self.indptr),
+                                       shape=(self.nod_total,self.nod_total), copy=False)
+
+
+#Dirichlet境界の節点の行と列を0にし、対角成分を1にする
+def eliminate_dirichlet_nodes(mat_A_glo, nod_dirichlet):
+    if(is_sparse(mat_A_glo)):  #csr形式は非ゼロパターンを変えずに、data配列をマスクで書き換える
+        is_dirichlet = np.zeros(mat_A_glo.shape[0], bool)
+        is_dirichlet[nod_dirichlet] = True
+        row_csr = np.repeat(np.arange(mat_A_glo.shape[0]), np.diff(mat_A_glo.indptr))  #各非ゼロ成分の行番号
+        mask = is_dirichlet[row_csr] | is_dirichlet[mat_A_glo.indices]  #Dirichlet節点の行・列の成分
+        mat_A_glo.data[mask] = 0.0  #行・列を全て0にする
+        mat_A_glo.data[mask & (row_csr==mat_A_glo.indices)] = 1.0  #対角成分は1にする
+    else:
+        mat_A_glo[nod_dirichlet,:] = 0.0  #行を全て0にする
+        mat_A_glo[:,nod_dirichlet] = 0.0  #列を全て0にする
+        mat_A_glo[nod_dirichlet,nod_dirichlet] = 1.0  #対角成分は1にする
+
+    return mat_A_glo
+
+
+#代数的マルチグリッド(smoothed aggregation)の集約を作成
+#強い結合でつながった節点をまとめ、各節点が属する集約の番号を返す
+def amg_aggregate(mat_A, theta):
+    import scipy.sparse  #圧縮行列の処理
+    nod_total = mat_A.shape[0]
+    mat_coo = mat_A.tocoo()
+    diag = np.absolute(mat_A.diagonal())
+    strong = (mat_coo.row!=mat_coo.col) & (mat_coo.data!=0.0) & \
+             (np.absolute(mat_coo.data) >= theta*np.sqrt(diag[mat_coo.row]*diag[mat_coo.col]))  #強い結合
+    mat_S = scipy.sparse.csr_matrix((np.ones(np.count_nonzero(strong)), (mat_coo.row[strong], mat_coo.col[strong])),
+                                    shape=(nod_total,nod_total))
+    indptr, indices = mat_S.indptr.tolist(), mat_S.indices.tolist()
+    neighbor = [indices[indptr[i]:indptr[i+1]] for i in range(nod_total)]  #強く結合した隣接節点
+
+    aggregate = [-1]*nod_total  #各節点の集約番号(-1は未割り当て)
+    agg_total = 0
+    #1段目：隣接節点が全て未割り当ての節点を中心に、新しい集約を作る
+    for i in range(nod_total):
+        if(aggregate[i]==-1 and all(aggregate[j]==-1 for j in neighbor[i])):
+            aggregate[i] = agg_total
+            for j in neighbor[i]:
+                aggregate[j] = agg_total
+            agg_total += 1
+    #2段目：残った節点は、隣接する集約に加える
+    aggregate_first = list(aggregate)
+    for i in range(nod_total):
+        if(aggregate[i]==-1):
+            for j in neighbor[i]:
+                if(aggregate_first[j]!=-1):
+                    aggregate[i] = aggregate_first[j]
+                    break
+    #3段目：それでも残った節点は、未割り当ての隣接節点とまとめて新しい集約にする
+    for i in range(nod_total):
+        if(aggregate[i]==-1):
+            aggregate[i] = agg_total
+            for j in neighbor[i]:
+                if(aggregate[j]==-1):
+                    aggregate[j] = agg_total
+            agg_total += 1
+
+    return np.array(aggregate, np.int64), agg_total
+
+
+#D^-1*Aのスペクトル半径を、べき乗法で見積もる
+def estimate_spectral_radius(mat_A, diag_inv, iter_num=15):
+    vec_x = np.random.default_rng(0).random(mat_A.shape[0])
+    rho = 1.0
+    for i in range(iter_num):
+        vec_y = diag_inv*mat_A.dot(vec_x)
+        rho = np.linalg.norm(vec_y) / np.linalg.norm(vec_x)
+        vec_x = vec_y / np.linalg.norm(vec_y)
+    return rho
+
+
+#代数的マルチグリッド(smoothed aggregation)の階層を作成
+#各階層の係数行列、平滑化用の対角成分の逆数と重み、補間行列を保持する
+def amg_setup(mat_A_glo, theta=0.08, coarse_size=500, max_levels=10):
+    import scipy.sparse.linalg  #圧縮行列用ソルバー
+    levels = []
+    mat_A = scipy.sparse.csr_matrix(mat_A_glo)
+    while(coarse_size < mat_A.shape[0] and len(levels) < max_levels-1):
+        diag_inv = 1.0 / mat_A.diagonal()
+        weight = 4.0 / (3.0*estimate_spectral_radius(mat_A, diag_inv))  #Jacobi法の重み
+
+        #集約から区分的に一定な補間行列を作り、重み付きJacobi法で平滑化する
+        aggregate, agg_total = amg_aggregate(mat_A, theta)
+        if(mat_A.shape[0] <= agg_total):  #粗くならなければ終了
+            break
+        mat_P0 = scipy.sparse.csr_matrix((np.ones(mat_A.shape[0]), (np.arange(mat_A.shape[0]), aggregate)),
+                                         shape=(mat_A.shape[0],agg_total))
+        mat_P = (mat_P0 -weight*scipy.sparse.diags(diag_inv).dot(mat_A).dot(mat_P0)).tocsr()
+
+        levels.append({'A':mat_A, 'diag_inv':diag_inv, 'weight':weight, 'P':mat_P, 'R':mat_P.T.tocsr()})
+        mat_A = (mat_P.T.dot(mat_A).dot(mat_P)).tocsr()  #粗い階層の係数行列(ガラーキン近似)
+
+    #最も粗い階層は直接法で解く
+    levels.append({'A':mat_A, 'solve':scipy.sparse.linalg.factorized(mat_A.tocsc())})
+    log_print(LOG_SUMMARY, 'AMG levels: ', [level['A'].shape[0] for level in levels])
+    record_statistics(amg_levels=[int(level['A'].shape[0]) for level in levels])
+
+    return levels
+
+
+#マルチグリッドのVサイクル。重み付きJacobi法で前後に同じ回数だけ平滑化するので、CGの前処理に使える対称な作用になる
+def multigrid_vcycle(levels, vec_b, lev=0, smooth_num=2):
+    level = levels[lev]
+    if(lev==len(levels)-1):  #最も粗い階層
+        return level['solve'](vec_b)
+
+    mat_A, diag_inv, weight = level['A'], level['diag_inv'], level['weight']
+    vec_x = weight*diag_inv*vec_b  #前平滑化(初期値0から)
+    for i in range(smooth_num-1):
+        vec_x += weight*diag_inv*(vec_b -mat_A.dot(vec_x))
+    vec_x += level['P'].dot(multigrid_vcycle(levels, level['R'].dot(vec_b -mat_A.dot(vec_x)), lev+1, smooth_num))  #粗い階層での補正
+    for i in range(smooth_num):  #後平滑化
+        vec_x += weight*diag_inv*(vec_b -mat_A.dot(vec_x))
+
+    return vec_x
+
+
+#格子点配置の補間行列。x・y方向の節点数lattice_coarseの格子から、各格子を4つに分けた(2*lattice_coarse-1)の格子への線形補間
+#細かい格子の節点(I,J)の値は、粗い格子の節点(I//2,J//2)と((I+1)//2,(J+1)//2)の平均になる
+#(I,Jが偶数なら粗い格子の節点そのもの、奇数なら辺の中点。両方奇数なら左下と右上を結ぶ対角線の中点)
+def make_lattice_prolongation(lattice_coarse):
+    import scipy.sparse  #圧縮行列の処理
+    lattice_fine = 2*lattice_coarse -1
+    index_fine = np.arange(lattice_fine)
+    index_lo, index_hi = np.tile(index_fine//2, lattice_fine), np.tile((index_fine+1)//2, lattice_fine)  #x方向
+    index_lo_y, index_hi_y = np.repeat(index_fine//2, lattice_fine), np.repeat((index_fine+1)//2, lattice_fine)  #y方向
+    row = np.tile(np.arange(lattice_fine*lattice_fine), 2)
+    col = np.concatenate((index_lo +lattice_coarse*index_lo_y, index_hi +lattice_coarse*index_hi_y))
+    return scipy.sparse.csr_matrix((np.full(len(row), 0.5), (row, col)), shape=(lattice_fine*lattice_fine,lattice_coarse*lattice_coarse))
+
+
+#格子点配置の幾何マルチグリッドの階層を作成。各階層はamg_setupと同じ形(係数行列、平滑化用の対角成分の逆数と重み、補間行列)
+#x・y方向の節点数を(n+1)/2にしながら、節点数がcoarse_size以下になるか、nが偶数で分けられなくなるまで粗くする
+#Dirichlet境界の節点(行と列が0で対角成分が1の行)は、補間行列の行と列を0にして補正しないようにし、粗い階層でも対角成分を1にする
+#Neumann境界は、粗い階層の係数行列をガラーキン近似(R*A*P)で作るので自然に引き継がれる
+#節点を並べ替えた場合は、node_order(新しい番号の順に並べた元の節点番号)で最も細かい階層の補間行列の行を並べ替える
+def gmg_setup(mat_A_glo, lattice_num, node_order=None, coarse_size=500, max_levels=20):
+    import scipy.sparse  #圧縮行列の処理
+    import scipy.sparse.linalg  #圧縮行列用ソルバー
+    levels = []
+    mat_A = scipy.sparse.csr_matrix(mat_A_glo)
+    off_diag = np.asarray(abs(mat_A).sum(axis=1)).ravel() -np.absolute(mat_A.diagonal())
+    is_dirichlet = (off_diag==0.0) & (mat_A.diagonal()==1.0)  #[nod_total]
+    while(coarse_size < mat_A.shape[0] and (lattice_num-1)%2==0 and len(levels) < max_levels-1):
+        diag_inv = 1.0 / mat_A.diagonal()
+        weight = 4.0 / (3.0*estimate_spectral_radius(mat_A, diag_inv))  #Jacobi法の重み
+
+        lattice_coarse = (lattice_num+1)//2
+        mat_P = make_lattice_prolongation(lattice_coarse)
+        index_coarse = np.arange(lattice_coarse)
+        nod_inject = (2*index_coarse[np.newaxis,:] +2*lattice_num*index_coarse[:,np.newaxis]).ravel()  #粗い格子の節点と同じ位置の細かい格子の節点
+        if(not levels and node_order is not None):
+            mat_P = mat_P[node_order]
+            nod_inject = np.argsort(node_order)[nod_inject]
+        is_dirichlet_coarse = is_dirichlet[nod_inject]  #[粗い階層の節点数]
+        mat_P = (scipy.sparse.diags((~is_dirichlet).astype(np.float64)).dot(mat_P).dot(scipy.sparse.diags((~is_dirichlet_coarse).astype(np.float64)))).tocsr()
+        mat_P.eliminate_zeros()
+
+        levels.append({'A':mat_A, 'diag_inv':diag_inv, 'weight':weight, 'P':mat_P, 'R':mat_P.T.tocsr()})
+        mat_A = (mat_P.T.dot(mat_A).dot(mat_P) +scipy.sparse.diags(is_dirichlet_coarse.astype(np.float64))).tocsr()  #粗い階層の係数行列
+        lattice_num, is_dirichlet = lattice_coarse, is_dirichlet_coarse
+
+    if(coarse_size < mat_A.shape[0]):
+        log_print(LOG_SUMMARY, 'GMG: lattice_num = {} cannot be coarsened further, solving {} nodes directly'.format(lattice_num, mat_A.shape[0]))
+
+    #最も粗い階層は直接法で解く
+    levels.append({'A':mat_A, 'solve':scipy.sparse.linalg.factorized(mat_A.tocsc())})
+    log_print(LOG_SUMMARY, 'GMG levels: ', [level['A'].shape[0] for level in levels])
+    record_statistics(gmg_levels=[int(level['A'].shape[0]) for level in levels])
+
+    return levels
+
+
+#マルチグリッド法で解く。cycle_typeがvならVサイクルを繰り返し、fmgなら完全マルチグリッド
+#(右辺を最も粗い階層まで制限して解き、補間してはVサイクル1回で改善することを最も細かい階層まで繰り返す)で初期値を作ってから繰り返す
+#各サイクルの相対残差を表示し、サイクル数も返す
+def solve_multigrid(mat_A_glo, vec_b_glo, levels, cycle_type, tolerance, max_cycles=100):
+    norm_b = np.linalg.norm(vec_b_glo)
+    if(cycle_type=='fmg'):
+        vec_b_list = [vec_b_glo]
+        for level in levels[:-1]:
+            vec_b_list.append(level['R'].dot(vec_b_list[-1]))
+        unknown_vec_u = levels[-1]['solve'](vec_b_list[-1])
+        for lev in range(len(levels)-2, -1, -1):
+            unknown_vec_u = levels[lev]['P'].dot(unknown_vec_u)
+            unknown_vec_u += multigrid_vcycle(levels, vec_b_list[lev] -levels[lev]['A'].dot(unknown_vec_u), lev)
+    else:
+        unknown_vec_u = np.zeros(len(vec_b_glo), np.float64)
+
+    residual_history = []  #各サイクルの相対残差
+    vec_r = vec_b_glo -mat_A_glo.dot(unknown_vec_u)
+    for cycle in range(max_cycles):
+        residual_history.append(np.linalg.norm(vec_r) / norm_b if norm_b else 0.0)
+        log_print(LOG_SUMMARY, 'MG cycle {}: relative residual = {:0.3e}'.format(cycle, residual_history[-1]))
+        if(residual_history[-1]<=tolerance):
+            break
+        unknown_vec_u += multigrid_vcycle(levels, vec_r)
+        vec_r = vec_b_glo -mat_A_glo.dot(unknown_vec_u)
+    else:
+        residual_history.append(np.linalg.norm(vec_r) / norm_b if norm_b else 0.0)
+        log_print(LOG_SUMMARY, 'MG did not converge (relative residual = {:0.3e})'.format(residual_history[-1]))
+
+    cycle_num = len(residual_history) -1
+    record_statistics(mg_cycles=telemetry['statistics'].get('mg_cycles', []) +[cycle_num],  #荷重ケースごとのサイクル数
+                      mg_residual_history=residual_history)
+    return unknown_vec_u, cycle_num
+
+
+#CG法の前処理を作成。none,jacobi,ic,amg,gmg。CG法に使うので、どれも対称正定値の演算子にする
+#gmgの場合は、gmg_setupで作った階層をmg_levelsに渡す
+def make_preconditioner(mat_A_glo, precond_type, mg_levels=None):
+    import scipy.sparse.linalg  #圧縮行列用ソルバー
+    nod_total = mat_A_glo.shape[0]
+    if(precond_type=='none'):
+        return None
+    elif(precond_type=='jacobi'):  #対角スケーリング
+        diag_inv = 1.0 / mat_A_glo.diagonal()
+        return scipy.sparse.linalg.LinearOperator((nod_total,nod_total), matvec=lambda vec_r: diag_inv*vec_r)
+    elif(precond_type=='ic'):  #不完全Cholesky分解。不完全LU分解のLと対角だけを使い、M=P L D L^T P^Tとする
+        #spiluのsolveはUも使うのでM^-1が非対称になり、CG法の前提が崩れる。Lと対角から作り直せば対称になる
+        ilu = scipy.sparse.linalg.spilu(mat_A_glo.tocsc(), drop_tol=1.0e-4, fill_factor=10,
+                                        permc_spec='MMD_AT_PLUS_A', diag_pivot_thresh=0.0)
+        mat_L, mat_Lt = ilu.L.tocsr(), ilu.L.T.tocsr()  #単位下三角行列とその転置
+        diag_inv = 1.0 / np.abs(ilu.U.diagonal())  #正定値にするため絶対値を使う(対称正定値の行列なら元々正)
+        perm = ilu.perm_c  #フィルインを減らす並べ替え(対称に適用する)
+        def solve_ic(vec_r):
+            vec_y = np.empty_like(vec_r)
+            vec_y[perm] = vec_r
+            vec_y = scipy.sparse.linalg.spsolve_triangular(mat_L, vec_y, lower=True, unit_diagonal=True)
+            vec_y = scipy.sparse.linalg.spsolve_triangular(mat_Lt, diag_inv*vec_y, lower=False, unit_diagonal=True)
+            return vec_y[perm]
+        return scipy.sparse.linalg.LinearOperator((nod_total,nod_total), matvec=solve_ic)
+    elif(precond_type=='amg'):  #代数的マルチグリッドのVサイクル1回
+        levels = amg_setup(mat_A_glo)
+        return scipy.sparse.linalg.LinearOperator((nod_total,nod_total), matvec=lambda vec_r: multigrid_vcycle(levels, vec_r))
+    elif(precond_type=='gmg'):  #幾何マルチグリッドのVサイクル1回
+        return scipy.sparse.linalg.LinearOperator((nod_total,nod_total), matvec=lambda vec_r: multigrid_vcycle(mg_levels, vec_r))
+
+
+#前処理付きCG法で解く。反復回数も返す
+def solve_cg(mat_A_glo, vec_b_glo, precond_type, tolerance, mg_levels=None):
+    import scipy.sparse.linalg  #圧縮行列用ソルバー
+    mat_M = make_preconditioner(mat_A_glo, precond_type, mg_levels)
+
+    iter_count = [0]  #反復回数
+    residual_history = []  #各反復の相対残差。行列ベクトル積が1回余分に必要なので、debugの場合のみ記録する
+    norm_b = np.linalg.norm(vec_b_glo)
+    def count_iteration(vec_x):
+        iter_count[0] += 1
+        if(LOG_DEBUG <= log_level):
+            residual_history.append(np.linalg.norm(vec_b_glo -mat_A_glo.dot(vec_x)) / norm_b)
+
+    unknown_vec_u, info = scipy.sparse.linalg.cg(mat_A_glo, vec_b_glo, rtol=tolerance, atol=0.0,
+                                                 maxiter=10*mat_A_glo.shape[0], M=mat_M, callback=count_iteration)
+    iter_num = iter_count[0]
+    log_print(LOG_SUMMARY, lambda: 'CG precond = {}, iterations = {}, relative residual = {:0.3e}'.format(
+              precond_type, iter_num, np.linalg.norm(vec_b_glo -mat_A_glo.dot(unknown_vec_u)) / norm_b if norm_b else 0.0))
+    log_array(LOG_DEBUG, 'CG residual history =', residual_history)
+    if(info!=0):
+        log_print(LOG_SUMMARY, 'CG did not converge (info = {})'.format(info))
+
+    record_statistics(cg_iterations=telemetry['statistics'].get('cg_iterations', []) +[iter_num])  #荷重ケースごとの反復回数
+    return unknown_vec_u, iter_num
+
+
+#LU分解のキャッシュ。最近使ったものほど後ろに並ぶ(LRU)
+factor_cache = collections.OrderedDict()
+factor_cache_size = 8  #キャッシュに保持するLU分解の最大数
+
+
+#境界条件を適用した係数行列のLU分解を、キャッシュから取り出す(無ければ分解してキャッシュに入れる)
+#キーは行列の非ゼロパターンと値のハッシュなので、メッシュと係数が同じなら同じ分解を使い回す
+def get_factorization(mat_A_glo):
+    import scipy.sparse.linalg  #圧縮行列用ソルバー
+    mat_A_csr = scipy.sparse.csr_matrix(mat_A_glo)
+    hash_key = hashlib.sha1(np.array(mat_A_csr.shape, np.int64))
+    for array in (mat_A_csr.indptr, mat_A_csr.indices, mat_A_csr.data):
+        hash_key.update(np.ascontiguousarray(array))
+    key = hash_key.hexdigest()
+
+    if(key in factor_cache):
+        factor_cache.move_to_end(key)  #最近使ったものとして後ろに移す
+        log_print(LOG_SUMMARY, 'Factorization cache: hit')
+    else:
+        factor_cache[key] = scipy.sparse.linalg.splu(mat_A_csr.tocsc())  #LU分解
+        factor_nnz = factor_cache[key].L.nnz +factor_cache[key].U.nnz
+        log_print(LOG_SUMMARY, 'Factorization cache: miss (nnz(L+U) = {})'.format(factor_nnz))
+        record_statistics(factor_nnz=int(factor_nnz), fill_in=factor_nnz/mat_A_csr.nnz)  #フィルイン(分解後と分解前の非ゼロ成分数の比)
+        if(factor_cache_size < len(factor_cache)):
+            factor_cache.popitem(last=False)  #最も長く使われていないものを捨てる
+
+    return factor_cache[key]
+
+
+#複数の荷重ケースの右辺ベクトル[nod_total,荷重ケース数]をまとめて解く
+#LU分解はキャッシュから使い回すので、1ケースあたりの計算は前進・後退代入だけになる
+def solve_load_cases(mat_A_glo, vec_b_block):
+    factor = get_factorization(mat_A_glo)
+    return factor.solve(np.ascontiguousarray(vec_b_block, np.float64))
+
+
+#点がどの三角形要素に含まれるかを探すための索引(バケット格子)
+#計算領域を三角形要素の半分ほどの大きさの格子に分け、各格子に外接長方形が重なる三角形要素の番号をcsr形式で持つ
+class PointLocator:
+    def __init__(self, nod_pos_glo, nod_num_tri):
+        pos_x = nod_pos_glo[:,0][nod_num_tri]  #[tri_ele_total,3]、各Local節点のx座標
+        pos_y = nod_pos_glo[:,1][nod_num_tri]  #[tri_ele_total,3]、各Local節点のy座標
+        tri_ele_total = len(nod_num_tri)
+
+        #格子の大きさと数
+        self.pos_min, self.pos_max = np.min(nod_pos_glo, axis=0), np.max(nod_pos_glo, axis=0)  #メッシュの外接長方形
+        extent = np.maximum(self.pos_max -self.pos_min, np.finfo(np.float64).tiny)
+        cell_size = np.sqrt(extent[0]*extent[1] / max(2.0*tri_ele_total, 1.0))
+        self.grid_num = np.maximum(np.ceil(extent/cell_size).astype(np.int64), 1)  #x・y方向の格子の数
+        self.cell_size = extent/self.grid_num
+
+        #各三角形要素の外接長方形が重なる格子を全て並べ、格子の番号順に並べ替える
+        #外接長方形の上端・右端が格子の境界に一致する場合は、その先の格子には入れない(境界上の点は隣の要素で見つかる)
+        cell_min = self.find_cell(np.stack((np.min(pos_x, axis=1), np.min(pos_y, axis=1)), axis=1))
+        cell_max = np.ceil((np.stack((np.max(pos_x, axis=1), np.max(pos_y, axis=1)), axis=1) -self.pos_min)/self.cell_size).astype(np.int64) -1
+        cell_span = np.clip(cell_max, cell_min, self.grid_num-1) -cell_min +1
+        cell_count = cell_span[:,0]*cell_span[:,1]  #各三角形要素が重なる格子の数
+        tri_list = np.repeat(np.arange(tri_ele_total), cell_count)
+        cell_offset = np.arange(len(tri_list)) -np.repeat(np.cumsum(cell_count) -cell_count, cell_count)
+        cell_x = cell_min[tri_list,0] +cell_offset % cell_span[tri_list,0]
+        cell_y = cell_min[tri_list,1] +cell_offset // cell_span[tri_list,0]
+        cell_list = cell_y*self.grid_num[0] +cell_x
+        self.cell_tri = tri_list[np.argsort(cell_list, kind='stable')].astype(np.int32)  #格子ごとに並べた三角形要素の番号
+        self.cell_ptr = np.zeros(self.grid_num[0]*self.grid_num[1]+1, np.int64)  #各格子の先頭位置
+        self.cell_ptr[1:] = np.cumsum(np.bincount(cell_list, minlength=self.grid_num[0]*self.grid_num[1]))
+
+        #形状関数N_i=(a_i +b_i*x +c_i*y)/2Sの係数を、要素ごとに[a/2S,b/2S,c/2S]×3節点の順に並べる(1回の読み出しで済むように)
+        #面積Sは符号付きにして、節点の回る向きによらず要素の内側でN_iが正になるようにする
+        area_signed = (pos_x[:,1]-pos_x[:,0])*(pos_y[:,2]-pos_y[:,0]) -(pos_x[:,2]-pos_x[:,0])*(pos_y[:,1]-pos_y[:,0])  #2S
+        shape_a = np.roll(pos_x, -1, axis=1)*np.roll(pos_y, -2, axis=1) -np.roll(pos_x, -2, axis=1)*np.roll(pos_y, -1, axis=1)
+        shape_b = np.roll(pos_y, -1, axis=1) -np.roll(pos_y, -2, axis=1)
+        shape_c = np.roll(pos_x, -2, axis=1) -np.roll(pos_x, -1, axis=1)
+        self.shape_coef = np.stack((shape_a, shape_b, shape_c), axis=1) / area_signed[:,np.newaxis,np.newaxis]  #[tri_ele_total,3,3]
+
+    #点[点の数,2]を含む格子のx・y方向の番号[点の数,2]。外接長方形の上端・右端の点は端の格子にする
+    def find_cell(self, points):
+        return np.clip(np.floor((points -self.pos_min)/self.cell_size).astype(np.int64), 0, self.grid_num-1)
+
+    #三角形要素tri_listの形状関数の、点pointsでの値[点の数,3]
+    def shape_values(self, tri_list, points):
+        shape_coef = self.shape_coef[tri_list]
+        return shape_coef[:,0] +shape_coef[:,1]*points[:,0:1] +shape_coef[:,2]*points[:,1:2]
+
+    #点[点の数,2]を含む三角形要素の番号(無ければ-1)と、その要素の形状関数の値(無ければNaN)を求める
+    #全ての点について格子のk番目の候補をまとめて調べ、見つからなかった点だけ次の候補に進む
+    def locate(self, points, tolerance=1.0e-12):
+        points = np.asarray(points, np.float64).reshape(-1,2)
+        tri_index = np.full(len(points), -1, np.int64)
+        shape_val = np.full((len(points),3), np.nan)
+
+        inside = np.all((self.pos_min<=points) & (points<=self.pos_max), axis=1)  #外接長方形の外の点(NaNを含む)は探さない
+        cell = self.find_cell(np.where(inside[:,np.newaxis], points, self.pos_min))
+        cell_first = self.cell_ptr[cell[:,1]*self.grid_num[0] +cell[:,0]]
+        cell_count = np.where(inside, self.cell_ptr[cell[:,1]*self.grid_num[0] +cell[:,0] +1] -cell_first, 0)
+        pending = np.flatnonzero(0<cell_count)  #まだ見つかっていない点
+        candidate = 0
+        while(0<len(pending)):
+            tri_list = self.cell_tri[cell_first[pending] +candidate]
+            shape_try = self.shape_values(tri_list, points[pending])
+            found = np.all(-tolerance<=shape_try, axis=1)
+            tri_index[pending[found]], shape_val[pending[found]] = tri_list[found], shape_try[found]
+            candidate += 1
+            pending = pending[~found & (candidate<cell_count[pending])]
+
+        return tri_index, shape_val
+
+
+#三角形要素のメッシュ。Global節点座標と節点番号(int32)だけを持ち、要素ごとの幾何量は最初に使う時に計算して保持する
+#同じメッシュを複数の問題で使うと、面積・形状関数の係数・線分要素の長さ・全体行列の組み立て計画も共有される
+class Mesh:
+    __slots__ = ('nod_pos_glo', 'nod_num_tri', 'nod_num_seg', '_area_tri', '_shape_b', '_shape_c', '_leng_seg', '_assembly_plan', '_content_hash', '_point_locator')
+
+    def __init__(self, nod_pos_glo, nod_num_tri, nod_num_seg):
+        self.nod_pos_glo = np.ascontiguousarray(nod_pos_glo, np.float64)  #[nod_total,2]
+        self.nod_num_tri = np.ascontiguousarray(nod_num_tri, np.int32)  #[tri_ele_total,3]
+        self.nod_num_seg = np.ascontiguousarray(nod_num_seg, np.int32)  #[seg_ele_total,2]
+        self._area_tri = self._shape_b = self._shape_c = self._leng_seg = self._assembly_plan = self._content_hash = self._point_locator = None
+
+    #三角形要素のLocal節点座標[tri_ele_total,3,2]。保持せず、使う度にGlobal節点座標から集める
+    @property
+    def nod_pos_tri(self):
+        return self.nod_pos_glo[self.nod_num_tri]
+
+    #境界線分要素のLocal節点座標[seg_ele_total,2,2]。保持せず、使う度にGlobal節点座標から集める
+    @property
+    def nod_pos_seg(self):
+        return self.nod_pos_glo[self.nod_num_seg]
+
+    #各要素の面積と、形状関数N_i=(a_i +b_i*x +c_i*y)/2Sの係数b,cを求める(aは要素行列に使わないので求めない)
+    #保持する配列は共有されるので、書き換えられないようにする
+    def _compute_shape(self):
+        pos_x = self.nod_pos_glo[:,0][self.nod_num_tri]  #[tri_ele_total,3]、各Local節点のx座標
+        pos_y = self.nod_pos_glo[:,1][self.nod_num_tri]  #[tri_ele_total,3]、各Local節点のy座標
+        area_tri = (pos_x[:,1]-pos_x[:,0])*(pos_y[:,2]-pos_y[:,0]) -(pos_x[:,2]-pos_x[:,0])*(pos_y[:,1]-pos_y[:,0])
+        self._area_tri = np.absolute(area_tri)/2.0  #[tri_ele_total]
+        self._shape_b = np.roll(pos_y, -1, axis=1) -np.roll(pos_y, -2, axis=1)  #[tri_ele_total,3]、y_(i+1) -y_(i+2)
+        self._shape_c = np.roll(pos_x, -2, axis=1) -np.roll(pos_x, -1, axis=1)  #[tri_ele_total,3]、x_(i+2) -x_(i+1)
+        for array in (self._area_tri, self._shape_b, self._shape_c):
+            array.flags.writeable = False
+
+    @property
+    def area_tri(self):
+        if(self._area_tri is None):
+            self._compute_shape()
+        return self._area_tri
+
+    @property
+    def shape_b(self):
+        if(self._shape_b is None):
+            self._compute_shape()
+        return self._shape_b
+
+    @property
+    def shape_c(self):
+        if(self._shape_c is None):
+            self._compute_shape()
+        return self._shape_c
+
+    #境界線分要素の長さ[seg_ele_total]
+    @property
+    def leng_seg(self):
+        if(self._leng_seg is None):
+            nod_pos_seg = self.nod_pos_seg
+            self._leng_seg = np.sqrt((nod_pos_seg[:,0,0]-nod_pos_seg[:,1,0])**2.0 +(nod_pos_seg[:,0,1]-nod_pos_seg[:,1,1])**2.0)
+            self._leng_seg.flags.writeable = False
+        return self._leng_seg
+
+    #全体行列の組み立て計画(csr形式の非ゼロパターン)
+    @property
+    def assembly_plan(self):
+        if(self._assembly_plan is None):
+            self._assembly_plan = AssemblyPlan(self.nod_num_tri, len(self.nod_pos_glo))
+        return self._assembly_plan
+
+    #点の位置の探索用の索引。同じメッシュで何度探索しても作り直さない
+    @property
+    def point_locator(self):
+        if(self._point_locator is None):
+            self._point_locator = PointLocator(self.nod_pos_glo, self.nod_num_tri)
+        return self._point_locator
+
+    #メッシュのハッシュ値(節点座標と節点番号から作る)。同じメッシュかどうかの判定や、キャッシュのキーに使う
+    @property
+    def content_hash(self):
+        if(self._content_hash is None):
+            self._content_hash = hash_arrays((self.nod_pos_glo, self.nod_num_tri, self.nod_num_seg))
+        return self._content_hash
+
+
+#メッシュと計算結果の保存形式の版数。形式を変えたら増やす
+store_version = 1
+
+
+#配列のハッシュ値(SHA-256)。型と形状も含めるので、同じバイト列でも型や形状が違えば別の値になる
+def hash_arrays(arrays):
+    hash_key = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        hash_key.update('{}{}'.format(array.dtype.str, array.shape).encode())
+        hash_key.update(array)
+    return hash_key.hexdigest()
+
+
+#メッシュと配列(境界のタグ、全体行列、解など)をディレクトリに保存する
+#配列ごとに.npyファイルに書き、名前・型・形状・ハッシュ値の目録をmanifest.jsonに書く(目録は最後に書くので、途中で止まった保存は読み込まれない)
+#疎行列はcsr形式のdata,indices,indptrに分けて保存する
+def save_store(store_dir, mesh, **arrays):
+    os.makedirs(store_dir, exist_ok=True)
+    items = {'nod_pos_glo':mesh.nod_pos_glo, 'nod_num_tri':mesh.nod_num_tri, 'nod_num_seg':mesh.nod_num_seg}
+    manifest = {'version':store_version, 'mesh_hash':mesh.content_hash, 'arrays':{}, 'sparse':{}}
+    for name, array in arrays.items():
+        if(is_sparse(array)):
+            array = array.tocsr()
+            manifest['sparse'][name] = {'shape':list(array.shape)}
+            items.update({name+'.data':array.data, name+'.indices':array.indices, name+'.indptr':array.indptr})
+        else:
+            items[name] = np.asarray(array)
+
+    #別名で書いてから置き換えるので、同じディレクトリからメモリマップで読み込んだ配列もそのまま使える
+    for name, array in items.items():
+        array_file = os.path.join(store_dir, name+'.npy')
+        with open(array_file+'.tmp', 'wb') as f:
+            np.save(f, array)
+        os.replace(array_file+'.tmp', array_file)
+        manifest['arrays'][name] = {'dtype':array.dtype.str, 'shape':list(array.shape), 'hash':hash_arrays([array])}
+    #全体のハッシュ値は、配列ごとのハッシュ値から作る(キャッシュのキーに使う)
+    manifest['content_hash'] = hashlib.sha256(json.dumps(manifest['arrays'], sort_keys=True).encode()).hexdigest()
+
+    manifest_file = os.path.join(store_dir, 'manifest.json')
+    with open(manifest_file+'.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_file+'.tmp', manifest_file)
+    log_print(LOG_SUMMARY, 'Store saved: {} ({} arrays, hash = {})'.format(store_dir, len(items), manifest['content_hash'][:16]))
+    return manifest['content_hash']
+
+
+#save_storeで保存したメッシュと配列を読み込む。mmap_mode='r'ならメモリマップで開くので、触れた部分だけがファイルから読まれる
+#verify=Trueの場合は、全ての配列を読んで目録のハッシュ値と照合する
+def load_store(store_dir, mmap_mode='r', verify=False):
+    with open(os.path.join(store_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if(manifest['version']!=store_version):
+        raise ValueError('Unsupported store version {} in {}'.format(manifest['version'], store_dir))
+
+    arrays = {name: np.load(os.path.join(store_dir, name+'.npy'), mmap_mode=mmap_mode) for name in manifest['arrays']}
+    if(verify):
+        for name, array in arrays.items():
+            if(hash_arrays([array])!=manifest['arrays'][name]['hash']):
+                raise ValueError('Array {} in {} does not match its hash'.format(name, store_dir))
+
+    mesh = Mesh(arrays.pop('nod_pos_glo'), arrays.pop('nod_num_tri'), arrays.pop('nod_num_seg'))
+    if(0<len(manifest['sparse'])):
+        import scipy.sparse  #圧縮行列の処理
+        for name, sparse_info in manifest['sparse'].items():
+            arrays[name] = scipy.sparse.csr_matrix((arrays.pop(name+'.data'), arrays.pop(name+'.indices'), arrays.pop(name+'.indptr')),
+                                                   shape=tuple(sparse_info['shape']))
+    log_print(LOG_SUMMARY, 'Store loaded: {} (hash = {})'.format(store_dir, manifest['content_hash'][:16]))
+    return mesh, arrays
+
+
+#解(節点の値[nod_total]か[nod_total,ケース数])を、任意の点[点の数,2]で線形の形状関数により補間する(プローブ)
+#点の探索はメッシュが保持する索引を使い回す。gradient=Trueなら勾配[点の数,2(,ケース数)]も返す。メッシュの外の点はNaN
+#node_orderを渡した場合は、解が元の節点番号の順(メッシュは並べ替えた後)とみなす。点はchunk_size個ずつ処理する
+def probe_solution(mesh, unknown_vec_u, points, gradient=False, node_order=None, chunk_size=2**18):
+    points = np.asarray(points, np.float64).reshape(-1,2)
+    point_locator = mesh.point_locator
+    probe_u = np.full((len(points),)+unknown_vec_u.shape[1:], np.nan)
+    if(gradient):
+        probe_grad = np.full((len(points),2)+unknown_vec_u.shape[1:], np.nan)
+
+    for i in range(0, len(points), chunk_size):
+        tri_index, shape_val = point_locator.locate(points[i:i+chunk_size])
+        found = np.flatnonzero(0<=tri_index)
+        nod_num_probe = mesh.nod_num_tri[tri_index[found]]  #[見つかった点の数,3]
+        if(node_order is not None):
+            nod_num_probe = node_order[nod_num_probe]
+        vec_u_probe = unknown_vec_u[nod_num_probe]  #[見つかった点の数,3(,ケース数)]
+        probe_u[i+found] = np.einsum('pi,pi...->p...', shape_val[found], vec_u_probe)
+        if(gradient):
+            shape_coef = point_locator.shape_coef[tri_index[found]]  #勾配はdN_i/dx=b_i/2S、dN_i/dy=c_i/2S
+            probe_grad[i+found,0] = np.einsum('pi,pi...->p...', shape_coef[:,1], vec_u_probe)
+            probe_grad[i+found,1] = np.einsum('pi,pi...->p...', shape_coef[:,2], vec_u_probe)
+
+    if(gradient):
+        return probe_u, probe_grad
+    return probe_u
+
+
+#境界線分要素のタグ(どの辺の境界か)。どの辺にも当てはまらない線分要素はTAG_OTHER
+TAG_LEFT, TAG_RIGHT, TAG_BOTTOM, TAG_TOP, TAG_OTHER = 0, 1, 2, 3, 4
+#境界条件の種類。BC_left等で指定する名前から変換する
+BC_NEUMANN, BC_DIRICHLET = 0, 1
+BC_kinds = {'Neumann':BC_NEUMANN, 'Dirichlet':BC_DIRICHLET}
+
+
+#格子点配置の節点、三角形要素、境界線分要素を、ドロネー分割を使わずに式で直接作る(計算量は節点数に比例)
+#節点番号はi +lattice_num*j(x方向が先)。各格子は左下と右上を結ぶ対角線で2つの三角形に分け、節点は反時計回りに並べる
+def generate_lattice(x_min, x_max, y_min, y_max, lattice_num):
+    nod_pos_glo = np.empty((lattice_num*lattice_num,2), np.float64)  #[nod_total,2]
+    nod_pos_glo[:,0] = np.tile(np.linspace(x_min, x_max, lattice_num), lattice_num)
+    nod_pos_glo[:,1] = np.repeat(np.linspace(y_min, y_max, lattice_num), lattice_num)
+
+    #各格子の左下の節点番号から、右下(+1)、左上(+lattice_num)、右上(+lattice_num+1)の節点番号が決まる
+    cell = np.arange(lattice_num-1, dtype=np.int32)
+    nod_ll = (cell[np.newaxis,:] +lattice_num*cell[:,np.newaxis]).ravel()  #[cell_total]
+    nod_num_tri = np.empty((2*len(nod_ll),3), np.int32)  #[tri_ele_total,3]
+    nod_num_tri[0::2,0], nod_num_tri[0::2,1], nod_num_tri[0::2,2] = nod_ll, nod_ll +1, nod_ll +lattice_num +1  #右下の三角形
+    nod_num_tri[1::2,0], nod_num_tri[1::2,1], nod_num_tri[1::2,2] = nod_ll, nod_ll +lattice_num +1, nod_ll +lattice_num  #左上の三角形
+
+    #外周の節点を下辺、右辺、上辺、左辺の順に反時計回りにたどり、隣り合う節点を境界線分要素にする
+    nod_loop = np.concatenate((cell,  #下辺(左から右)
+                               (lattice_num-1) +lattice_num*cell,  #右辺(下から上)
+                               lattice_num*lattice_num-1 -cell,  #上辺(右から左)
+                               lattice_num*(lattice_num-1 -cell)))  #左辺(上から下)
+    nod_num_seg = np.stack((nod_loop, np.roll(nod_loop, -1)), axis=1)  #[seg_ele_total,2]
 
     return nod_pos_glo, nod_num_tri, nod_num_seg
 
 
-def make_mesh_data():
-    print('三角形要素を構成するLocal節点座標')
-    nod_pos_tri = np.empty((len(nod_num_tri),3,2), np.float64)  #各要素のLocal節点のx,y座標
-    for e in range(len(nod_num_tri)):
-        for n in range(3):
-            nod_pos_tri[e,n,0] = nod_pos_glo[nod_num_tri[e,n], 0]
-            nod_pos_tri[e,n,1] = nod_pos_glo[nod_num_tri[e,n], 1]
-    print('nod_pos_tri(x0, y0),(x1, y1),(x2, y2) =\n', nod_pos_tri)
-
-    print('境界線分要素を構成するLocal節点座標')
-    nod_pos_seg = np.empty((len(nod_num_seg),2,2), np.float64)  #各境界要素のLocal節点のx,y座標
-    for e in range(len(nod_num_seg)):
-        for n in range(2):
-            nod_pos_seg[e,n,0] = nod_pos_glo[nod_num_seg[e,n], 0]
-            nod_pos_seg[e,n,1] = nod_pos_glo[nod_num_seg[e,n], 1]
-    print('nod_pos_seg(x0, y0),(x1, y1) =\n', nod_pos_seg)
-
-    return nod_pos_tri, nod_pos_seg
-
-
-#要素行列の構築
-def assemble_element_matrix(nod_num_tri, nod_pos_tri):
-    #各要素の面積
-    print('Element area_tri')
-    area_tri = (nod_pos_tri[:,1,0]-nod_pos_tri[:,0,0])*(nod_pos_tri[:,2,1]-nod_pos_tri[:,0,1])  \
-              -(nod_pos_tri[:,2,0]-nod_pos_tri[:,0,0])*(nod_pos_tri[:,1,1]-nod_pos_tri[:,0,1])
-    area_tri = np.absolute(area_tri)/2.0
-    print(area_tri)
-
-    #各要素の形状関数の係数
-    print('Shape function a,b,c')
-    shape_a = np.empty((len(nod_pos_tri),3), np.float64)
-    shape_b = np.empty((len(nod_pos_tri),3), np.float64)
-    shape_c = np.empty((len(nod_pos_tri),3), np.float64)
-    for e in range(len(nod_pos_tri)):
-        shape_a[e,0] = nod_pos_tri[e,1,0]*nod_pos_tri[e,2,1] -nod_pos_tri[e,2,0]*nod_pos_tri[e,1,1]
-        shape_a[e,1] = nod_pos_tri[e,2,0]*nod_pos_tri[e,0,1] -nod_pos_tri[e,0,0]*nod_pos_tri[e,2,1]
-        shape_a[e,2] = nod_pos_tri[e,0,0]*nod_pos_tri[e,1,1] -nod_pos_tri[e,1,0]*nod_pos_tri[e,0,1]
-
-        shape_b[e,0] = nod_pos_tri[e,1,1] -nod_pos_tri[e,2,1]
-        shape_b[e,1] = nod_pos_tri[e,2,1] -nod_pos_tri[e,0,1]
-        shape_b[e,2] = nod_pos_tri[e,0,1] -nod_pos_tri[e,1,1]
-
-        shape_c[e,0] = nod_pos_tri[e,2,0] -nod_pos_tri[e,1,0]
-        shape_c[e,1] = nod_pos_tri[e,0,0] -nod_pos_tri[e,2,0]
-        shape_c[e,2] = nod_pos_tri[e,1,0] -nod_pos_tri[e,0,0]
-    for e in range(min(len(nod_pos_tri),10)):  #形状関数の係数を10番目の三角形要素まで確認
-        print(shape_a[e,:], shape_b[e,:], shape_c[e,:])
-
-    #要素行列の初期化
-    mat_A_ele = np.zeros((len(nod_num_tri),3,3), np.float64)  #要素係数行列(ゼロで初期化)
-    vec_b_ele = np.zeros((len(nod_num_tri),3), np.float64)  #要素係数ベクトル(ゼロで初期化)
-
-    print("Local matrix")
-    for e in range(len(nod_pos_tri)):
-        for i in range(3):
-            for j in range(3):
-                mat_A_ele[e,i,j] = (shape_b[e,i]*shape_b[e,j] +shape_c[e,i]*shape_c[e,j]) / (4.0*area_tri[e])
-            vec_b_ele[e,i] = -func_f *area_tri[e]/3.0
-
-    return mat_A_ele, vec_b_ele, area_tri
-
-
-#全体行列の構築
-def assemble_global_matrix(matrix_type):
-    #全体行列を用意
-    if(matrix_type=='basic'):
-        mat_A_glo = np.zeros((len(nod_pos_glo),len(nod_pos_glo)), np.float64) #全体行列(ゼロで初期化)
-    elif(matrix_type=='sparse'):
-        mat_A_glo = scipy.sparse.lil_matrix((len(nod_pos_glo),len(nod_pos_glo))) #lil形式の圧縮行列(ゼロで初期化)
-    vec_b_glo = np.zeros(len(nod_pos_glo), np.float64) #全体ベクトル(ゼロで初期化)
-
-    #全体行列を組み立てる
-    print('Assemble matrix')
-    CountPercent = 1
-    for e in range(len(nod_pos_tri)):
-        for i in range(3):
-            for j in range(3):
-                mat_A_glo[ nod_num_tri[e,i], nod_num_tri[e,j] ] += mat_A_ele[e,i,j]
-            vec_b_glo[ nod_num_tri[e,i] ] += vec_b_ele[e,i]
-
-        #処理の経過を％表示
-        if(CountPercent <= 100*e/len(nod_pos_tri)):
-            print("{:7.2f}%".format(100*e/len(nod_pos_tri)), end='')
-            CountPercent += 1
-    print(" 100.00%")
-
-    print('Pre global matrix')
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_A_glo[i,j]), end='')
-        print(";{:7.2f}".format(vec_b_glo[i]))
-    #print(np.concatenate((mat_A_glo, np.reshape(vec_b_glo, (-1,1))), axis=1))
-
-    return mat_A_glo, vec_b_glo
-
-
-#境界要素の情報を設定
-def make_boundary_info(nod_pos_seg):
-    #境界線分要素の長さ
-    leng_seg = (nod_pos_seg[:,0,0]-nod_pos_seg[:,1,0])**2.0 +(nod_pos_seg[:,0,1]-nod_pos_seg[:,1,1])**2.0
-    leng_seg = np.sqrt(leng_seg)
-    print('leng_seg =\n', leng_seg)
-
-    #境界要素の種類を分類
-    BC_type = [""]*len(nod_pos_seg)
-    BC_value = [""]*len(nod_pos_seg)
-    BC_threshold = 0.5*np.mean(leng_seg)
-    for e in range(len(nod_pos_seg)):
-        if(nod_pos_seg[e,0,0] < x_min +BC_threshold and
-           nod_pos_seg[e,1,0] < x_min +BC_threshold):  #左側境界
-            BC_type[e] = BC_left[0]
-            BC_value[e] = BC_left[1]
-        elif(x_max -BC_threshold < nod_pos_seg[e,0,0] and
-             x_max -BC_threshold < nod_pos_seg[e,1,0]):  #右側境界
-            BC_type[e] = BC_right[0]
-            BC_value[e] = BC_right[1]
-        elif(nod_pos_seg[e,0,1] < y_min +BC_threshold and
-             nod_pos_seg[e,1,1] < y_min +BC_threshold):  #下側境界
-            BC_type[e] = BC_bottom[0]
-            BC_value[e] = BC_bottom[1]
-        elif(y_max -BC_threshold < nod_pos_seg[e,0,1] and
-             y_max -BC_threshold < nod_pos_seg[e,1,1]):  #上側境界
-            BC_type[e] = BC_top[0]
-            BC_value[e] = BC_top[1]
-        else:  #それ以外はNeumann境界にしておく（何もしない）
-            BC_type[e] = 'Neumann'
-            BC_value[e] = 0.0
-    print('BC_type =\n', BC_type)
-    print('BC_value =\n', BC_value)
-
-    return BC_type, BC_value, leng_seg
-
-
-#境界条件を実装
-def set_boundary_condition(mat_A_glo, vec_b_glo, BC_type, BC_value, leng_seg):
-    #各要素の各節点に対応したGlobal節点に対して処理する
-    print('Boundary conditions')
-    CountPercent = 1
-    for e in range(len(nod_pos_seg)):
-        for n in range(2):
-            if(BC_type[e]=='Dirichlet'):
-                vec_b_glo[:] -= BC_value[e]*mat_A_glo[nod_num_seg[e,n],:]  #移項
-                vec_b_glo[nod_num_seg[e,n]] = BC_value[e]  #関数を任意の値で固定
-                mat_A_glo[nod_num_seg[e,n],:] = 0.0  #行を全て0にする
-                mat_A_glo[:,nod_num_seg[e,n]] = 0.0  #列を全て0にする
-                mat_A_glo[nod_num_seg[e,n],nod_num_seg[e,n]] = 1.0  #対角成分は1にする
-
-            if (BC_type[e]=='Neumann'):  #Neumann境界条件の処理
-                vec_b_glo[nod_num_seg[e,n]] += BC_value[e]*leng_seg[e]/2.0  #関数を任意の傾きで固定
-
-        #処理の経過を％表示
-        if(CountPercent <= 100*e/len(nod_pos_seg)):
-            print("{:7.2f}%".format(100*e/len(nod_pos_seg)), end='')
-            CountPercent += 1
-    print(" 100.00%")
-
-    print("Post global matrix")
-    for i in range(min(len(nod_pos_glo),10)):   #全体行列を10行10列まで確認
-        for j in range(min(len(nod_pos_glo),10)):
-            print("{:7.2f}".format(mat_A_glo[i,j]), end='')
-        print(";{:7.2f}".format(vec_b_glo[i]))
-    #print(np.concatenate((mat_A_glo, np.reshape(vec_b_glo, (-1,1))), axis=1))
-
-    return mat_A_glo, vec_b_glo
-
-
-#連立方程式を解く
-def solve_simultaneous_equations(mat_A_glo, vec_b_glo):
-    print('節点数、三角形要素数、境界線分要素数')
-    print(len(nod_pos_glo), len(nod_pos_tri), len(nod_pos_seg))
-    #print("detA = ", scipy.linalg.det(mat_A_glo)) #Aの行列式
-    #print("Rank A = ", np.linalg.matrix_rank(mat_A_glo)) #AのRank(階数)
-    #print("Inverse A = ", scipy.linalg.inv(mat_A_glo)) #Aの逆行列
-
-    print('Solve linear equations')
-    if(matrix_type=='basic'):
-        unknown_vec_u = scipy.linalg.solve(mat_A_glo,vec_b_glo)  #Au=bから、未知数ベクトルUを求める
-    elif(matrix_type=='sparse'):
-        unknown_vec_u = scipy.sparse.linalg.spsolve(mat_A_glo,vec_b_glo)  #lil形式をcsr形式に変換して計算
-
-    print('Unkown vector U = ') #未知数ベクトル
-    print(unknown_vec_u)
-    print('Max U = ', max(unknown_vec_u), ',  Min U = ',min(unknown_vec_u)) #uの最大値、最小値
-
-    return unknown_vec_u
-
-
-#メッシュを表示
-def visualize_mesh(nod_pos_glo, show_text, out_type):
-    #plt.rcParams['font.family'] = 'Times New Roman' #全体のフォントを設定
-    fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
-
-    #plt.title("2D mesh for FEM") #グラフタイトル
-    plt.xlabel('$x$') #x軸の名前
-    plt.ylabel('$y$') #y軸の名前
-
-    #メッシュをプロット
-    plt.triplot(nod_pos_glo[:,0],nod_pos_glo[:,1], nod_num_tri, color='#0000ff')  #三角形要素
-    plt.scatter(nod_pos_glo[:,0],nod_pos_glo[:,1], color='#0000ff')  #節点
-
-    if(show_text==True):
-        for n in range(len(nod_pos_glo)):  #節点番号
-            plt.text(nod_pos_glo[n,0], nod_pos_glo[n,1], n, ha='right')
-        for e in range(len(nod_pos_tri)):  #三角形要素番号
-            meanX = (nod_pos_tri[e,0,0] +nod_pos_tri[e,1,0] +nod_pos_tri[e,2,0])/3.0
-            meanY = (nod_pos_tri[e,0,1] +nod_pos_tri[e,1,1] +nod_pos_tri[e,2,1])/3.0
-            plt.text(meanX, meanY, '#%d' %e, ha='center')
-        for e in range(len(nod_pos_seg)):  #線分要素番号
-            meanX = (nod_pos_seg[e,0,0] +nod_pos_seg[e,1,0])/2.0
-            meanY = (nod_pos_seg[e,0,1] +nod_pos_seg[e,1,1])/2.0
-            plt.text(meanX, meanY, '*%d' %e, ha='center')
-
-    #グラフを表示
-    if(out_type=='show'):
-        plt.show()
-    elif(out_type=='save'):
-        plt.savefig("fem2d_mesh.png")
-    plt.close()  #作成した図のウィンドウを消す
-
-
-#計算結果を表示
-def visualize_result(nod_pos_glo, unknown_vec_u, show_text, out_type):
-    #plt.rcParams['font.family'] = 'Times New Roman'  #全体のフォントを設定
-    fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
-    ax = fig.gca(projection='3d', azim=-120, elev=20)  #3Dグラフを設定
-
-    #plt.title("FEA of 2D Poisson's equation")  #グラフタイトル
-    ax.set_xlabel('$x$')  #x軸の名前
-    ax.set_ylabel('$y$')  #y軸の名前
-    ax.set_zlabel('$u(x,y)$')  #z軸の名前
-
-    #数値解をプロット
-    surf = ax.plot_trisurf(nod_pos_glo[:,0],nod_pos_glo[:,1],unknown_vec_u, cmap=cm.jet, linewidth=0)
-    plt.colorbar(surf, shrink=0.8, aspect=10)  #カラーバー
-
-    #更に体裁を整える
-    plt.legend(loc='best')  #凡例(グラフラベル)を表示
-
-    if(show_text==True):
-        for n in range(len(nod_pos_glo)):  #節点番号
-            ax.text(nod_pos_glo[n,0],nod_pos_glo[n,1],unknown_vec_u[n], 'n%d' %n, ha='center',va='bottom', color='#000000')
-        for e in range(len(nod_pos_tri)):  #三角形要素番号
-            meanX = (nod_pos_tri[e,0,0] +nod_pos_tri[e,1,0] +nod_pos_tri[e,2,0])/3.0
-            meanY = (nod_pos_tri[e,0,1] +nod_pos_tri[e,1,1] +nod_pos_tri[e,2,1])/3.0
-            meanU = (unknown_vec_u[nod_num_tri[e,0]] +unknown_vec_u[nod_num_tri[e,1]] +unknown_vec_u[nod_num_tri[e,2]])/3.0
-            ax.text(meanX, meanY, meanU, 'e%d' %e, ha='center', color='#000000')
-
-    #グラフを表示
-    if(out_type=='show'):
-        plt.show()
-    elif(out_type=='save'):
-        plt.savefig("fem2d_poisson.png")
-    plt.close()  #作成した図のウィンドウを消す
+#全体行列の帯幅(対角から最も離れた非ゼロ成分までの距離)とプロファイル(各行の最初の非ゼロ成分から対角までの距離の合計)
+#非ゼロ成分は同じ三角形要素に含まれる節点の組なので、全体行列を作らずに節点番号から求める
+def measure_bandwidth(nod_num_tri, nod_total):
+    row_glo = np.repeat(nod_num_tri, 3, axis=1).ravel()  #成分(e,i,j)の行番号nod_num_tri[e,i]
+    col_glo = np.tile(nod_num_tri, (1,3)).ravel()  #成分(e,i,j)の列番号nod_num_tri[e,j]
+    col_first = np.arange(nod_total)  #各行の最初の非ゼロ成分の列番号
+    np.minimum.at(col_first, row_glo, col_glo)
+    bandwidth = int(np.max(np.absolute(row_glo.astype(np.int64) -col_glo))) if(0<len(row_glo)) else 0
+    return bandwidth, int(np.sum(np.arange(nod_total) -col_first))
+
+
+#節点座標のヒルベルト曲線上の位置。計算領域を2^order×2^order の格子に分け、格子を曲線に沿って数えた番号を返す
+def hilbert_index(nod_pos_glo, order=16):
+    pos_min, pos_max = np.min(nod_pos_glo, axis=0), np.max(nod_pos_glo, axis=0)
+    grid_pos = (nod_pos_glo -pos_min) / np.maximum(pos_max -pos_min, np.finfo(np.float64).tiny)
+    grid_x, grid_y = np.minimum((grid_pos*2**order).astype(np.int64), 2**order-1).T
+    curve_index = np.zeros(len(nod_pos_glo), np.int64)
+    s = 2**(order-1)
+    while(0<s):  #上の桁から、4分割したどの象限にあるかを数え、象限に合わせて座標を回転・反転する
+        rx, ry = (grid_x & s)>0, (grid_y & s)>0
+        curve_index += s*s*((3*rx) ^ ry)
+        flip = rx & ~ry
+        grid_x, grid_y = np.where(flip, 2**order-1 -grid_x, grid_x), np.where(flip, 2**order-1 -grid_y, grid_y)
+        grid_x, grid_y = np.where(ry, grid_x, grid_y), np.where(ry, grid_y, grid_x)
+        s //= 2
+    return curve_index
+
+
+#節点の並べ替え順。新しい番号の順に並べた元の節点番号を返す
+#rcm:逆Cuthill-McKee法(帯幅を小さくする)、hilbert:ヒルベルト曲線に沿った順(近くの節点を近い番号にする)
+def make_node_order(mesh, reorder_type):
+    if(reorder_type=='rcm'):
+        import scipy.sparse  #圧縮行列の処理
+        import scipy.sparse.csgraph  #グラフの処理
+        nod_total = len(mesh.nod_pos_glo)
+        row_glo = np.repeat(mesh.nod_num_tri, 3, axis=1).ravel()
+        col_glo = np.tile(mesh.nod_num_tri, (1,3)).ravel()
+        graph = scipy.sparse.csr_matrix((np.ones(len(row_glo), np.int8), (row_glo, col_glo)), shape=(nod_total,nod_total))
+        return scipy.sparse.csgraph.reverse_cuthill_mckee(graph, symmetric_mode=True).astype(np.int32)
+    elif(reorder_type=='hilbert'):
+        return np.argsort(hilbert_index(mesh.nod_pos_glo), kind='stable').astype(np.int32)
+
+
+#辺の一覧。三角形要素の辺k(節点kと節点k+1を結ぶ)の辺番号[tri_ele_total,3]と、各辺の両端の節点番号[edge_total,2](小さい番号が先)
+#線分要素から辺番号を引けるように、辺のキー(両端の節点番号の組を1つの整数にしたもの、昇順)も返す
+def make_edge_list(nod_num_tri, nod_total):
+    edge_nod = np.sort(np.stack((nod_num_tri, np.roll(nod_num_tri, -1, axis=1)), axis=2).reshape(-1,2), axis=1).astype(np.int64)
+    edge_key, tri_edge = np.unique(edge_nod[:,0]*nod_total +edge_nod[:,1], return_inverse=True)
+    return tri_edge.reshape(-1,3), np.stack((edge_key//nod_total, edge_key%nod_total), axis=1), edge_key
+
+
+#最長辺の2等分による細分化。印を付けた要素の最長辺に印を付け、印の付いた辺を持つ要素の最長辺にも印を付けることを
+#変わらなくなるまで繰り返す(適合性を保つ)。印の付いた辺の中点に節点を加え、各要素を最長辺の2等分と、
+#残りの印の付いた辺の2等分で2〜4個に分ける。節点の回る向きは元の要素と同じになる
+#細分しない要素を元の順で先に並べ、その後に新しい要素を並べる。細分しない要素の番号tri_keptと、
+#新しい線分要素の元の線分要素の番号seg_parent(境界のタグを引き継ぐために使う)も返す
+def refine_longest_edge(mesh, tri_marked):
+    nod_total, tri_ele_total = len(mesh.nod_pos_glo), len(mesh.nod_num_tri)
+    tri_edge, edge_nod, edge_key = make_edge_list(mesh.nod_num_tri, nod_total)
+    edge_vec = mesh.nod_pos_glo[edge_nod[:,1]] -mesh.nod_pos_glo[edge_nod[:,0]]
+    leng_edge = np.sqrt(edge_vec[:,0]**2.0 +edge_vec[:,1]**2.0)
+    edge_longest = np.argmax(leng_edge[tri_edge], axis=1)  #[tri_ele_total]、各要素の最長辺のLocal番号
+    tri_longest = tri_edge[np.arange(tri_ele_total), edge_longest]  #各要素の最長辺の辺番号
+
+    edge_mark = np.zeros(len(edge_nod), bool)
+    edge_mark[tri_longest[tri_marked]] = True
+    while(True):
+        tri_refine = np.any(edge_mark[tri_edge], axis=1)
+        tri_closure = tri_refine & ~edge_mark[tri_longest]  #最長辺以外の辺だけに印が付いた要素
+        if(not np.any(tri_closure)):
+            break
+        edge_mark[tri_longest[tri_closure]] = True
+
+    #印の付いた辺の中点を、新しい節点として後ろに加える
+    edge_mid = np.full(len(edge_nod), -1, np.int64)  #各辺の中点の節点番号(印が無ければ-1)
+    edge_mid[edge_mark] = nod_total +np.arange(np.count_nonzero(edge_mark))
+    nod_pos_glo = np.concatenate((mesh.nod_pos_glo, np.mean(mesh.nod_pos_glo[edge_nod[edge_mark]], axis=1)))
+
+    #細分する要素を、最長辺が辺0(節点0と節点1を結ぶ)になるように回してから分ける
+    tri_list = np.flatnonzero(tri_refine)
+    local_order = (np.arange(3) +edge_longest[tri_list,np.newaxis]) % 3
+    nod_v = np.take_along_axis(mesh.nod_num_tri[tri_list], local_order, axis=1).astype(np.int64).T  #[3,細分する要素数]
+    mid_01, mid_12, mid_20 = edge_mid[np.take_along_axis(tri_edge[tri_list], local_order, axis=1)].T
+    has_12, has_20 = (0<=mid_12), (0<=mid_20)
+    nod_num_tri = np.concatenate((mesh.nod_num_tri[~tri_refine],
+                                  np.stack((nod_v[0], mid_01, np.where(has_20, mid_20, nod_v[2])), axis=1),  #最長辺で分けた節点0側
+                                  np.stack((mid_01, nod_v[1], np.where(has_12, mid_12, nod_v[2])), axis=1),  #最長辺で分けた節点1側
+                                  np.stack((mid_01, nod_v[2], mid_20), axis=1)[has_20],  #節点0側を辺2でさらに分けた残り
+                                  np.stack((mid_01, mid_12, nod_v[2]), axis=1)[has_12]))  #節点1側を辺1でさらに分けた残り
+
+    #線分要素は、辺に印が付いていれば中点で2つに分ける
+    seg_mid = edge_mid[np.searchsorted(edge_key, np.min(mesh.nod_num_seg, axis=1).astype(np.int64)*nod_total +np.max(mesh.nod_num_seg, axis=1))]
+    seg_split = np.flatnonzero(0<=seg_mid)
+    nod_num_seg = np.concatenate((mesh.nod_num_seg[seg_mid<0],
+                                  np.stack((mesh.nod_num_seg[seg_split,0], seg_mid[seg_split]), axis=1),
+                                  np.stack((seg_mid[seg_split], mesh.nod_num_seg[seg_split,1]), axis=1)))
+    seg_parent = np.concatenate((np.flatnonzero(seg_mid<0), seg_split, seg_split))
+
+    return Mesh(nod_pos_glo, nod_num_tri, nod_num_seg), np.flatnonzero(~tri_refine), seg_parent
+
+
+#2次元Poisson方程式の問題。計算条件とメッシュを属性に保持し、1つのプロセスの中で何度でも解ける
+#計算条件は解く前に書き換えてもよい。係数行列が同じなら、LU分解のキャッシュ(factor_cache)が使い回される
+class Poisson2D:
+    def __init__(self, x_min=-1.0, x_max=1.0, y_min=-1.0, y_max=1.0, func_f=1.0,
+                 BC_left=('Dirichlet', 0.0), BC_right=('Neumann', 1.0), BC_bottom=('Neumann', 0.0), BC_top=('Neumann', 0.0),
+                 matrix_type='sparse', solver_type=('direct',), reorder_type=None, assembly_workers=1):
+        self.x_min, self.x_max = x_min, x_max  #計算領域のXの最小値、最大値
+        self.y_min, self.y_max = y_min, y_max  #計算領域のYの最小値、最大値
+        self.func_f = func_f  #定数関数f。配列の場合は荷重ケースごとの値
+        #左部(x=x_min)、右部(x=x_max)、下部(y=y_min)、上部(y=y_max)の、境界の種類(Dirichlet,Neumann)と値
+        self.BC_left, self.BC_right, self.BC_bottom, self.BC_top = BC_left, BC_right, BC_bottom, BC_top
+        self.matrix_type = matrix_type  #全体行列の形式。basic,sparse
+        self.solver_type = solver_type  #sparseの場合の連立方程式の解法。['direct']、['cg', 前処理, 収束判定の相対残差]か['mg', サイクル, 収束判定の相対残差]
+        self.reorder_type = reorder_type  #メッシュを作る時の節点の並べ替え。None,rcm,hilbert
+        self.assembly_workers = assembly_workers  #要素行列の計算とsparseの全体行列の組み立てに使うスレッド数。1なら逐次
+        #sparseの全体行列のdata配列(境界条件を適用する前と、適用する写し)。組み立て計画が同じ間は使い回し、新しく確保しない
+        self.data_A = self.data_A_bc = None
+        self.data_source = None  #data_Aを組み立てた要素行列と組み立て計画
+        self.mesh = None  #メッシュ(Mesh)。他の問題と同じものを代入して共有してもよい
+        self.node_order = None  #節点を並べ替えた場合の、新しい番号の順に並べた元の節点番号
+        self.lattice_num = None  #格子点配置の場合のx・y方向の節点数(幾何マルチグリッドの階層を作るのに使う)
+
+    #メッシュを作成して、属性meshに保持する
+    def set_mesh(self, node_type):
+        self.generate_nodes(node_type)
+        if(self.reorder_type is not None):
+            self.reorder_nodes(self.mesh, self.reorder_type)
+        self.make_mesh_data(self.mesh)
+
+    #要素行列の構築から連立方程式の求解までを行い、未知数ベクトルを返す(節点を並べ替えた場合も元の節点番号の順)
+    #node_typeを省略した場合は、属性meshのメッシュ(要素ごとの幾何量と組み立て計画を含む)を使い回す
+    def solve(self, node_type=None):
+        if(node_type is not None):
+            self.set_mesh(node_type)
+
+        self.assemble_element_matrix(self.mesh)
+        mat_A_glo, vec_b_glo = self.assemble_global_matrix(self.matrix_type)
+        BC_tag, BC_type, BC_value, leng_seg = self.make_boundary_info(self.mesh)
+        mat_A_glo, vec_b_glo = self.set_boundary_condition(mat_A_glo, vec_b_glo, BC_tag, BC_type, BC_value, leng_seg)
+        return self.restore_node_order(self.solve_simultaneous_equations(mat_A_glo, vec_b_glo))
+
+    #誤差指標による適応的な細分化。解く→誤差を評価→誤差の大きい要素に印を付ける→細分化 を、
+    #相対誤差の推定値がtolerance以下になるか、細分化すると節点数がmax_nodesを超えるまで繰り返す
+    #印を付ける要素は、誤差指標の大きい順に、指標の2乗の和が全体のmark_ratioの割合に達するまで選ぶ(Dörflerの方法)
+    #細分しない要素の要素行列と、境界線分要素のタグは前回のものを引き継ぐ(新しい要素の要素行列だけを求める)
+    #解と、各回の(節点数, 相対誤差の推定値)の一覧を返す。解は最後に解いた属性meshの節点番号の順
+    #(節点を並べ替えたメッシュでも並べ替えた番号のまま使うので、属性node_orderは最初に消す。probeもこの番号で補間する)
+    def solve_adaptive(self, node_type=None, tolerance=0.05, max_nodes=100000, mark_ratio=0.5, max_iterations=50):
+        if(node_type is not None):
+            self.set_mesh(node_type)
+
+        mesh, self.node_order, self.lattice_num = self.mesh, None, None
+        mat_A_ele, vec_b_ele, area_tri = self.assemble_element_matrix(mesh)
+        BC_tag, BC_type, BC_value, leng_seg = self.make_boundary_info(mesh)
+        adaptive_history = []
+        for iteration in range(max_iterations):
+            mat_A_glo, vec_b_glo = self.assemble_global_matrix(self.matrix_type)
+            mat_A_glo, vec_b_glo = self.set_boundary_condition(mat_A_glo, vec_b_glo, BC_tag, BC_type, BC_value, mesh.leng_seg)
+            unknown_vec_u = self.solve_simultaneous_equations(mat_A_glo, vec_b_glo)
+
+            error_tri, error_relative = self.estimate_error(mesh, unknown_vec_u, BC_tag, BC_type, BC_value)
+            adaptive_history.append((len(mesh.nod_pos_glo), error_relative))
+            log_print(LOG_SUMMARY, 'Adaptive iteration {}: nod_total = {}, estimated relative error = {:0.5f}'.format(
+                      iteration, len(mesh.nod_pos_glo), error_relative))
+            if(error_relative<=tolerance or iteration==max_iterations-1):  #最後の回は、解いたメッシュのまま終える
+                break
+
+            error_order = np.argsort(error_tri)[::-1]
+            mark_num = np.searchsorted(np.cumsum(error_tri[error_order]**2.0), mark_ratio*np.sum(error_tri**2.0)) +1
+            refined_mesh, tri_kept, seg_parent = self.refine_mesh(mesh, error_order[:mark_num])
+            if(max_nodes < len(refined_mesh.nod_pos_glo)):  #節点数の上限を超える細分化はしない
+                break
+
+            #新しい要素の要素行列だけを求め、細分しない要素の要素行列と合わせる
+            mesh, self.mesh = refined_mesh, refined_mesh
+            BC_tag = BC_tag[seg_parent]
+            tri_new = Mesh(mesh.nod_pos_glo, mesh.nod_num_tri[len(tri_kept):], mesh.nod_num_seg[:0])
+            mat_A_new, vec_b_new, area_new = self.assemble_element_matrix(tri_new)
+            mat_A_ele = np.concatenate((mat_A_ele[tri_kept], mat_A_new))
+            vec_b_ele = np.concatenate((vec_b_ele[tri_kept], vec_b_new))
+            area_tri = np.concatenate((area_tri[tri_kept], area_new))
+            self.mat_A_ele, self.vec_b_ele, self.area_tri = mat_A_ele, vec_b_ele, area_tri
+
+        record_statistics(adaptive_iterations=len(adaptive_history), error_relative=float(adaptive_history[-1][1]))
+        return unknown_vec_u, adaptive_history
+
+    #節点データを生成
+    @measure_stage
+    def generate_nodes(self, node_type):
+        #格子点配置。節点、三角形要素、境界線分要素を式で直接作る
+        if (node_type[0]=='lattice'):
+            lattice_num = node_type[1]  #格子分割におけるx・y方向の節点数
+            nod_pos_glo, nod_num_tri, nod_num_seg = generate_lattice(self.x_min, self.x_max, self.y_min, self.y_max, lattice_num)
+
+        #ランダム配置
+        elif (node_type[0]=='random'):
+            import scipy.spatial  #ドロネー分割
+            random_num = node_type[1]  #ランダム分割における節点数
+            nodes = np.random.rand(random_num,2)  #[0~1,0~1]の点をrandom_num個生成
+            nodes[:,0] = self.x_min +(self.x_max-self.x_min)*nodes[:,0]
+            nodes[:,1] = self.y_min +(self.y_max-self.y_min)*nodes[:,1]
+
+            #隅に点を移動
+            if (4<=random_num):
+                nodes[0,0],nodes[0,1] = (self.x_min, (self.y_max+self.y_min)/2)
+                nodes[1,0],nodes[1,1] = (self.x_max, (self.y_max+self.y_min)/2)
+                nodes[2,0],nodes[2,1] = ((self.x_max+self.x_min)/2, self.y_min)
+                nodes[3,0],nodes[3,1] = ((self.x_max+self.x_min)/2, self.y_max)
+                '''nodes[4,0],nodes[4,1] = (self.x_min, self.y_min)
+                nodes[5,0],nodes[5,1] = (self.x_min, self.y_max)
+                nodes[6,0],nodes[6,1] = (self.x_max, self.y_min)
+                nodes[7,0],nodes[7,1] = (self.x_max, self.y_max)  #'''
+
+            #節点をドロネー分割
+            delaunay_data = scipy.spatial.Delaunay(nodes)
+            nod_pos_glo = delaunay_data.points  #[nod_total,2]
+            nod_num_tri = delaunay_data.simplices  #[tri_ele_total,3]
+            nod_num_seg = delaunay_data.convex_hull  #[seg_ele_total,2]
+
+        #save_storeで保存したメッシュを読み込む。文字列は保存先のディレクトリ
+        elif (node_type[0]=='store'):
+            mesh, arrays = load_store(node_type[1])
+            nod_pos_glo, nod_num_tri, nod_num_seg = mesh.nod_pos_glo, mesh.nod_num_tri, mesh.nod_num_seg
+
+        log_print(LOG_SUMMARY, '節点数、三角形要素数、境界線分要素数')
+        log_print(LOG_SUMMARY, len(nod_pos_glo), len(nod_num_tri), len(nod_num_seg))
+
+        log_array(LOG_DEBUG, 'Global節点のx,y座標', nod_pos_glo)
+        log_array(LOG_DEBUG, '三角形要素を構成する節点番号', nod_num_tri)
+        log_array(LOG_DEBUG, '境界線分要素を構成する節点番号', nod_num_seg)
+
+        record_statistics(nod_total=int(len(nod_pos_glo)), tri_ele_total=int(len(nod_num_tri)), seg_ele_total=int(len(nod_num_seg)))
+        self.mesh, self.node_order = Mesh(nod_pos_glo, nod_num_tri, nod_num_seg), None
+        self.lattice_num = node_type[1] if(node_type[0]=='lattice') else None
+        return self.mesh
+
+    #節点を並べ替えたメッシュを作り、属性meshに保持する。三角形要素は最も小さい新しい節点番号の順に並べる
+    #元の節点番号(新しい番号の順)を属性node_orderに保持し、solveの結果は元の節点番号の順に戻す
+    @measure_stage
+    def reorder_nodes(self, mesh, reorder_type):
+        node_order = make_node_order(mesh, reorder_type)
+        node_rank = np.empty_like(node_order)  #元の節点番号から新しい節点番号への対応
+        node_rank[node_order] = np.arange(len(node_order), dtype=node_order.dtype)
+        nod_num_tri = node_rank[mesh.nod_num_tri]
+        nod_num_tri = nod_num_tri[np.argsort(np.min(nod_num_tri, axis=1), kind='stable')]
+        reordered_mesh = Mesh(mesh.nod_pos_glo[node_order], nod_num_tri, node_rank[mesh.nod_num_seg])
+
+        bandwidth_before, profile_before = measure_bandwidth(mesh.nod_num_tri, len(node_order))
+        bandwidth, profile = measure_bandwidth(reordered_mesh.nod_num_tri, len(node_order))
+        log_print(LOG_SUMMARY, 'Reorder nodes ({}): bandwidth {} -> {}, profile {} -> {}'.format(
+                  reorder_type, bandwidth_before, bandwidth, profile_before, profile))
+        record_statistics(bandwidth_before=bandwidth_before, bandwidth=bandwidth, profile_before=profile_before, profile=profile)
+
+        self.mesh, self.node_order = reordered_mesh, node_order
+        return reordered_mesh
+
+    #新しい節点番号の順の配列(行が節点)を、元の節点番号の順に戻す(節点を並べ替えていなければそのまま返す)
+    #block_size列ずつその場で書き換えるので、メモリマップの配列にも使える
+    def restore_node_order(self, vec, block_size=64):
+        if(self.node_order is None):
+            return vec
+        node_rank = np.empty_like(self.node_order)
+        node_rank[self.node_order] = np.arange(len(self.node_order), dtype=self.node_order.dtype)
+        vec_2d = vec.reshape(len(vec), -1)
+        for i in range(0, vec_2d.shape[1], block_size):
+            vec_2d[:,i:i+block_size] = vec_2d[node_rank,i:i+block_size]
+        return vec
+
+    #solveで求めた解(元の節点番号の順)を、任意の点[点の数,2]で補間する。gradient=Trueなら勾配も返す。メッシュの外の点はNaN
+    def probe(self, unknown_vec_u, points, gradient=False):
+        return probe_solution(self.mesh, unknown_vec_u, points, gradient, self.node_order)
+
+    #三角形要素の面積と形状関数の係数は、要素行列を作る時に初めて計算される
+    @measure_stage
+    def make_mesh_data(self, mesh):
+        log_print(LOG_SUMMARY, '境界線分要素の長さ')
+        log_array(LOG_DEBUG, 'leng_seg =', mesh.leng_seg)
+
+        return mesh
+
+    #要素行列の構築
+    @measure_stage
+    def assemble_element_matrix(self, mesh):
+        #各要素の面積と形状関数の係数(メッシュが保持する)
+        area_tri, shape_b, shape_c = mesh.area_tri, mesh.shape_b, mesh.shape_c
+
+        #全要素の要素行列を一括で計算
+        log_print(LOG_SUMMARY, "Local matrix")
+        def compute_element_matrix(area_tri, shape_b, shape_c):
+            mat_A_ele = (np.einsum('ei,ej->eij', shape_b, shape_b) +np.einsum('ei,ej->eij', shape_c, shape_c)) \
+                       / (4.0*area_tri[:,np.newaxis,np.newaxis])  #要素係数行列[tri_ele_total,3,3]
+            #要素係数ベクトル[tri_ele_total,3]。func_fが配列の場合は[tri_ele_total,3,荷重ケース数]
+            vec_b_ele = np.repeat((-np.multiply.outer(area_tri, self.func_f)/3.0)[:,np.newaxis], 3, axis=1)
+            return mat_A_ele, vec_b_ele
+        if(self.assembly_workers<=1):
+            mat_A_ele, vec_b_ele = compute_element_matrix(area_tri, shape_b, shape_c)
+        else:  #要素を連続した区間に分け、スレッドごとに計算して出力配列の区間に書き込む(要素ごとの計算なので結果は逐次と同じ)
+            ele_bound = np.linspace(0, len(area_tri), self.assembly_workers+1).astype(np.int64)
+            mat_A_ele = np.empty((len(area_tri),3,3), np.float64)
+            vec_b_ele = np.empty((len(area_tri),3)+np.shape(self.func_f), np.float64)
+            def compute_part(part):
+                ele = slice(ele_bound[part], ele_bound[part+1])
+                mat_A_ele[ele], vec_b_ele[ele] = compute_element_matrix(area_tri[ele], shape_b[ele], shape_c[ele])
+            run_parallel(compute_part, self.assembly_workers)
+
+        self.mat_A_ele, self.vec_b_ele, self.area_tri = mat_A_ele, vec_b_ele, area_tri
+        return mat_A_ele, vec_b_ele, area_tri
+
+    #全体行列の構築
+    @measure_stage
+    def assemble_global_matrix(self, matrix_type, assembly_plan=None):
+        nod_num_tri = self.mesh.nod_num_tri
+        nod_total = len(self.mesh.nod_pos_glo)
+
+        #全体行列を組み立てる（同じ位置の成分は足し合わされる）
+        log_print(LOG_SUMMARY, 'Assemble matrix')
+        if(matrix_type=='basic'):
+            row_glo = np.repeat(nod_num_tri, 3, axis=1).ravel()  #[tri_ele_total*9]、成分(e,i,j)の行番号nod_num_tri[e,i]
+            col_glo = np.tile(nod_num_tri, (1,3)).ravel()  #[tri_ele_total*9]、成分(e,i,j)の列番号nod_num_tri[e,j]
+            mat_A_glo = np.bincount(row_glo*nod_total +col_glo, weights=self.mat_A_ele.ravel(),
+                                    minlength=nod_total*nod_total).reshape(nod_total,nod_total)  #全体行列
+            vec_b_glo = np.zeros((nod_total,)+self.vec_b_ele.shape[2:], np.float64)  #全体ベクトル
+            np.add.at(vec_b_glo, nod_num_tri.ravel(), self.vec_b_ele.reshape((-1,)+self.vec_b_ele.shape[2:]))
+        elif(matrix_type=='sparse'):
+            if(assembly_plan is None):  #組み立て計画を渡さなければ、メッシュが保持するものを使う(最初の1回だけ作成する)
+                assembly_plan = self.mesh.assembly_plan
+            #data配列は同じ組み立て計画の間は使い回し、要素行列が前回組み立てたもの(update_element_matrixで差分を足し込んだもの)なら組み立て直さない
+            if(self.data_A is None or len(self.data_A)!=assembly_plan.nnz):
+                self.data_A, self.data_A_bc = np.empty(assembly_plan.nnz, np.float64), np.empty(assembly_plan.nnz, np.float64)
+            if(self.data_source is None or self.data_source[0] is not self.mat_A_ele or self.data_source[1] is not assembly_plan):
+                assembly_plan.assemble(self.mat_A_ele, self.data_A, worker_num=self.assembly_workers)  #既存のdata配列に足し込む
+                self.data_source = (self.mat_A_ele, assembly_plan)
+            np.copyto(self.data_A_bc, self.data_A)  #境界条件はdata配列を書き換えるので、写しの方に適用する
+            mat_A_glo = assembly_plan.matrix(self.data_A_bc)  #csr形式の圧縮行列(次の組み立てで上書きされる)
+            vec_b_glo = assembly_plan.assemble_vector(self.vec_b_ele, worker_num=self.assembly_workers)  #全体ベクトル
+
+        log_matrix(LOG_DEBUG, 'Pre global matrix', mat_A_glo, vec_b_glo)  #全体行列を10行10列まで確認
+        record_statistics(nnz=int(mat_A_glo.nnz if is_sparse(mat_A_glo) else np.count_nonzero(mat_A_glo)))
+
+        return mat_A_glo, vec_b_glo
+
+    #一部の要素elements(重複なし)の要素行列と要素ベクトルだけを置き換える。材料の領域ごとに係数を変えた場合など
+    #組み立て済みのdata配列があれば、変わった要素の差分だけを足し込むので、次のassemble_global_matrixでは組み立て直さない
+    @measure_stage
+    def update_element_matrix(self, elements, mat_A_ele_new, vec_b_ele_new=None):
+        if(self.data_source is not None and self.data_source[0] is self.mat_A_ele):
+            self.data_source[1].update(self.data_A, elements, self.mat_A_ele[elements], mat_A_ele_new)
+        self.mat_A_ele[elements] = mat_A_ele_new
+        if(vec_b_ele_new is not None):
+            self.vec_b_ele[elements] = vec_b_ele_new
+
+    #境界要素の情報を設定
+    @measure_stage
+    def make_boundary_info(self, mesh):
+        nod_pos_seg = mesh.nod_pos_seg  #[seg_ele_total,2,2]
+        leng_seg = mesh.leng_seg  #境界線分要素の長さ(メッシュが保持する)
+
+        #境界線分要素を、両端の節点がどの辺の近くにあるかで分類する(左、右、下、上の順に優先する)
+        BC_threshold = 0.5*np.mean(leng_seg)
+        pos_x, pos_y = nod_pos_seg[:,:,0], nod_pos_seg[:,:,1]  #[seg_ele_total,2]
+        BC_tag = np.select([np.all(pos_x < self.x_min +BC_threshold, axis=1),  #左側境界
+                            np.all(self.x_max -BC_threshold < pos_x, axis=1),  #右側境界
+                            np.all(pos_y < self.y_min +BC_threshold, axis=1),  #下側境界
+                            np.all(self.y_max -BC_threshold < pos_y, axis=1)],  #上側境界
+                           [TAG_LEFT, TAG_RIGHT, TAG_BOTTOM, TAG_TOP], TAG_OTHER).astype(np.int8)  #[seg_ele_total]
+
+        #タグごとの境界条件の種類と値。それ以外の線分要素はNeumann境界にしておく（何もしない）
+        BC_sides = [self.BC_left, self.BC_right, self.BC_bottom, self.BC_top, ('Neumann', 0.0)]
+        BC_type = np.array([BC_kinds[BC_side[0]] for BC_side in BC_sides], np.int8)  #[tag_total]
+        BC_value = np.array(np.broadcast_arrays(*[np.asarray(BC_side[1], np.float64) for BC_side in BC_sides]))  #[tag_total]、荷重ケースがあれば[tag_total,荷重ケース数]
+        log_array(LOG_DEBUG, 'BC_tag =', BC_tag)
+        log_array(LOG_DEBUG, 'BC_type =', BC_type)
+        log_array(LOG_DEBUG, 'BC_value =', BC_value)
+
+        return BC_tag, BC_type, BC_value, leng_seg
+
+    #境界条件を実装
+    @measure_stage
+    def set_boundary_condition(self, mat_A_glo, vec_b_glo, BC_tag, BC_type, BC_value, leng_seg):
+        log_print(LOG_SUMMARY, 'Boundary conditions')
+
+        #荷重ケースがあり(vec_b_gloが[nod_total,荷重ケース数])、境界の値が1つの場合は、全ケースで同じ値を使う
+        BC_value = BC_value.reshape(BC_value.shape +(1,)*(vec_b_glo.ndim -BC_value.ndim))
+
+        #Neumann境界条件の処理。全てのNeumann境界の線分要素の寄与(値×長さ/2)を、両端の節点に1回のscatter-addで足し込む
+        seg_neumann = np.flatnonzero(BC_type[BC_tag]==BC_NEUMANN)
+        load_seg = BC_value[BC_tag[seg_neumann]] *(leng_seg[seg_neumann]/2.0).reshape((-1,)+(1,)*(BC_value.ndim-1))
+        load_seg = np.broadcast_to(load_seg, (len(seg_neumann),)+vec_b_glo.shape[1:])
+        np.add.at(vec_b_glo, self.mesh.nod_num_seg[seg_neumann], load_seg[:,np.newaxis])  #関数を任意の傾きで固定
+
+        #Dirichlet境界の節点と値を集める（複数の線分要素が共有する節点も1回だけ処理する）
+        #BC_valueが配列の場合は、荷重ケースごとの値として扱う
+        seg_dirichlet = np.flatnonzero(BC_type[BC_tag]==BC_DIRICHLET)
+        nod_dirichlet = np.unique(self.mesh.nod_num_seg[seg_dirichlet])  #Dirichlet境界の節点番号
+        record_statistics(dirichlet_nod_total=int(len(nod_dirichlet)), neumann_seg_total=int(len(seg_neumann)))
+        vec_u_dirichlet = np.zeros(vec_b_glo.shape, np.float64)  #Dirichlet境界の値(それ以外の節点は0)
+        vec_u_dirichlet[self.mesh.nod_num_seg[seg_dirichlet]] = np.broadcast_to(BC_value[BC_tag[seg_dirichlet]],
+                                                                           (len(seg_dirichlet),)+vec_b_glo.shape[1:])[:,np.newaxis]
+
+        #Dirichlet境界条件の処理
+        vec_b_glo[:] -= mat_A_glo.dot(vec_u_dirichlet)  #移項（疎行列とベクトルの積1回で行う）
+        vec_b_glo[nod_dirichlet] = vec_u_dirichlet[nod_dirichlet]  #関数を任意の値で固定
+        mat_A_glo = eliminate_dirichlet_nodes(mat_A_glo, nod_dirichlet)  #行・列を0にし、対角成分は1にする
+
+        log_matrix(LOG_DEBUG, "Post global matrix", mat_A_glo, vec_b_glo)  #全体行列を10行10列まで確認
+
+        return mat_A_glo, vec_b_glo
+
+    #連立方程式を解く
+    @measure_stage
+    def solve_simultaneous_equations(self, mat_A_glo, vec_b_glo):
+        log_print(LOG_SUMMARY, '節点数、三角形要素数、境界線分要素数')
+        log_print(LOG_SUMMARY, len(self.mesh.nod_pos_glo), len(self.mesh.nod_num_tri), len(self.mesh.nod_num_seg))
+        #print("detA = ", scipy.linalg.det(mat_A_glo)) #Aの行列式
+        #print("Rank A = ", np.linalg.matrix_rank(mat_A_glo)) #AのRank(階数)
+        #print("Inverse A = ", scipy.linalg.inv(mat_A_glo)) #Aの逆行列
+
+        #vec_b_gloが[nod_total,荷重ケース数]の場合は、全ての荷重ケースをまとめて解く
+        log_print(LOG_SUMMARY, 'Solve linear equations')
+        if(self.matrix_type=='basic'):
+            import scipy.linalg  #SciPyの線形計算ソルバー
+            unknown_vec_u = scipy.linalg.solve(mat_A_glo,vec_b_glo)  #Au=bから、未知数ベクトルUを求める
+        elif(self.matrix_type=='sparse'):
+            if(self.solver_type[0]=='direct'):
+                unknown_vec_u = solve_load_cases(mat_A_glo, vec_b_glo)  #LU分解をキャッシュして前進・後退代入で解く
+            elif(self.solver_type[0]=='cg'):  #前処理付きCG法。荷重ケースごとに解く
+                mg_levels = self.setup_multigrid(mat_A_glo) if(self.solver_type[1]=='gmg') else None
+                unknown_vec_u = np.stack([solve_cg(mat_A_glo, vec_b_col, self.solver_type[1], self.solver_type[2], mg_levels)[0]
+                                          for vec_b_col in vec_b_glo.reshape(len(vec_b_glo),-1).T], axis=1).reshape(vec_b_glo.shape)
+            elif(self.solver_type[0]=='mg'):  #幾何マルチグリッド法。階層は全ての荷重ケースで共通
+                mg_levels = self.setup_multigrid(mat_A_glo)
+                unknown_vec_u = np.stack([solve_multigrid(mat_A_glo, vec_b_col, mg_levels, self.solver_type[1], self.solver_type[2])[0]
+                                          for vec_b_col in vec_b_glo.reshape(len(vec_b_glo),-1).T], axis=1).reshape(vec_b_glo.shape)
+
+        log_array(LOG_DEBUG, 'Unkown vector U = ', unknown_vec_u) #未知数ベクトル
+        log_print(LOG_SUMMARY, 'Max U = ', np.max(unknown_vec_u), ',  Min U = ',np.min(unknown_vec_u)) #uの最大値、最小値
+
+        return unknown_vec_u
+
+    #幾何マルチグリッドの階層を作る。格子点配置(node_type=['lattice', n])のメッシュのみ
+    @measure_stage
+    def setup_multigrid(self, mat_A_glo):
+        if(self.lattice_num is None):
+            raise ValueError("Geometric multigrid requires a mesh made with node_type=['lattice', n]")
+        return gmg_setup(mat_A_glo, self.lattice_num, self.node_order)
+
+    #要素ごとの誤差指標(残差型)。要素内の残差 h_T^2*|f|^2*S と、辺での流束の跳び h_E^2*|[du/dn]|^2 を足して平方根を取る
+    #(内部の辺の跳びは両側の要素に半分ずつ、Neumann境界の辺は境界条件の値との差、Dirichlet境界の辺は0)
+    #各要素の勾配は、形状関数の係数b,cから ∇u = Σu_i(b_i,c_i)/2S で求める(2Sは節点の回る向きを含めた符号付きの値)
+    #誤差指標[tri_ele_total]と、全体の誤差の推定値を解の勾配のノルムで割った相対誤差を返す。荷重ケースが複数の場合は全ケースの和
+    @measure_stage
+    def estimate_error(self, mesh, unknown_vec_u, BC_tag, BC_type, BC_value):
+        shape_b, shape_c = mesh.shape_b, mesh.shape_c
+        area_signed = shape_b[:,0]*shape_c[:,1] -shape_b[:,1]*shape_c[:,0]  #[tri_ele_total]、2S
+        vec_u_tri = unknown_vec_u.reshape(len(unknown_vec_u), -1)[mesh.nod_num_tri]  #[tri_ele_total,3,荷重ケース数]
+        grad_u = np.stack((np.einsum('ei,eic->ec', shape_b, vec_u_tri), np.einsum('ei,eic->ec', shape_c, vec_u_tri)),
+                          axis=1) / area_signed[:,np.newaxis,np.newaxis]  #[tri_ele_total,2,荷重ケース数]
+
+        #各要素の辺の外向き法線と、勾配の法線成分(流束)。辺kは節点kから節点k+1へ向かう
+        tri_edge, edge_nod, edge_key = make_edge_list(mesh.nod_num_tri, len(mesh.nod_pos_glo))
+        nod_pos_tri = mesh.nod_pos_tri
+        edge_vec = np.roll(nod_pos_tri, -1, axis=1) -nod_pos_tri  #[tri_ele_total,3,2]
+        leng_edge = np.sqrt(edge_vec[:,:,0]**2.0 +edge_vec[:,:,1]**2.0)  #[tri_ele_total,3]
+        normal_out = np.stack((edge_vec[:,:,1], -edge_vec[:,:,0]), axis=2) * (np.sign(area_signed)[:,np.newaxis]/leng_edge)[:,:,np.newaxis]
+        flux_out = np.einsum('eka,eac->ekc', normal_out, grad_u)  #[tri_ele_total,3,荷重ケース数]
+
+        #辺ごとに両側の流束を足すと、内部の辺では跳びになる。境界の辺はNeumann境界の値との差、Dirichlet境界は0
+        flux_jump = np.zeros((len(edge_nod), flux_out.shape[2]), np.float64)
+        np.add.at(flux_jump, tri_edge.ravel(), flux_out.reshape(-1, flux_out.shape[2]))
+        seg_edge = np.searchsorted(edge_key, np.min(mesh.nod_num_seg, axis=1).astype(np.int64)*len(mesh.nod_pos_glo) +np.max(mesh.nod_num_seg, axis=1))
+        flux_jump[seg_edge] -= BC_value[BC_tag].reshape(len(BC_tag), -1)
+        flux_jump[seg_edge[BC_type[BC_tag]==BC_DIRICHLET]] = 0.0
+        edge_weight = np.full(len(edge_nod), 0.5)
+        edge_weight[seg_edge] = 1.0
+
+        error_tri = np.max(leng_edge, axis=1)**2.0 *np.sum(np.square(self.func_f)) *mesh.area_tri  #要素内の残差
+        error_tri += np.sum(leng_edge**2.0 *(edge_weight*np.sum(flux_jump**2.0, axis=1))[tri_edge], axis=1)  #辺の跳び
+        error_tri = np.sqrt(error_tri)
+        error_relative = np.sqrt(np.sum(error_tri**2.0) / np.sum(mesh.area_tri[:,np.newaxis]*np.sum(grad_u**2.0, axis=1)))
+        log_array(LOG_DEBUG, 'error_tri =', error_tri)
+        return error_tri, error_relative
+
+    #印を付けた要素を最長辺の2等分で細分化したメッシュを作る
+    @measure_stage
+    def refine_mesh(self, mesh, tri_marked):
+        refined_mesh, tri_kept, seg_parent = refine_longest_edge(mesh, tri_marked)
+        log_print(LOG_SUMMARY, 'Refine mesh: marked {} of {} elements -> nod_total = {}, tri_ele_total = {}'.format(
+                  len(tri_marked), len(mesh.nod_num_tri), len(refined_mesh.nod_pos_glo), len(refined_mesh.nod_num_tri)))
+        return refined_mesh, tri_kept, seg_parent
+
+    #メッシュを表示
+    def visualize_mesh(self, nod_pos_glo, show_text, out_type):
+        import matplotlib.pyplot as plt  #グラフ作成
+        #plt.rcParams['font.family'] = 'Times New Roman' #全体のフォントを設定
+        fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
+
+        #plt.title("2D mesh for FEM") #グラフタイトル
+        plt.xlabel('$x$') #x軸の名前
+        plt.ylabel('$y$') #y軸の名前
+
+        #メッシュをプロット
+        plt.triplot(nod_pos_glo[:,0],nod_pos_glo[:,1], self.mesh.nod_num_tri, color='#0000ff')  #三角形要素
+        plt.scatter(nod_pos_glo[:,0],nod_pos_glo[:,1], color='#0000ff')  #節点
+
+        if(show_text==True):
+            nod_pos_tri, nod_pos_seg = self.mesh.nod_pos_tri, self.mesh.nod_pos_seg  #Local節点座標
+            for n in range(len(nod_pos_glo)):  #節点番号
+                plt.text(nod_pos_glo[n,0], nod_pos_glo[n,1], n, ha='right')
+            for e in range(len(nod_pos_tri)):  #三角形要素番号
+                meanX = (nod_pos_tri[e,0,0] +nod_pos_tri[e,1,0] +nod_pos_tri[e,2,0])/3.0
+                meanY = (nod_pos_tri[e,0,1] +nod_pos_tri[e,1,1] +nod_pos_tri[e,2,1])/3.0
+                plt.text(meanX, meanY, '#%d' %e, ha='center')
+            for e in range(len(nod_pos_seg)):  #線分要素番号
+                meanX = (nod_pos_seg[e,0,0] +nod_pos_seg[e,1,0])/2.0
+                meanY = (nod_pos_seg[e,0,1] +nod_pos_seg[e,1,1])/2.0
+                plt.text(meanX, meanY, '*%d' %e, ha='center')
+
+        #グラフを表示
+        if(out_type=='show'):
+            plt.show()
+        elif(out_type=='save'):
+            plt.savefig("fem2d_mesh.png")
+        plt.close()  #作成した図のウィンドウを消す
+
+    #計算結果を表示
+    def visualize_result(self, nod_pos_glo, unknown_vec_u, show_text, out_type):
+        import matplotlib.pyplot as plt  #グラフ作成
+        from mpl_toolkits.mplot3d import Axes3D  #3Dグラフ
+        from matplotlib import cm  #カラーマップ
+        #plt.rcParams['font.family'] = 'Times New Roman'  #全体のフォントを設定
+        fig = plt.figure(figsize=(8, 6), dpi=100, facecolor='#ffffff')  #図の設定
+        ax = fig.gca(projection='3d', azim=-120, elev=20)  #3Dグラフを設定
+
+        #plt.title("FEA of 2D Poisson's equation")  #グラフタイトル
+        ax.set_xlabel('$x$')  #x軸の名前
+        ax.set_ylabel('$y$')  #y軸の名前
+        ax.set_zlabel('$u(x,y)$')  #z軸の名前
+
+        #数値解をプロット
+        surf = ax.plot_trisurf(nod_pos_glo[:,0],nod_pos_glo[:,1],unknown_vec_u, cmap=cm.jet, linewidth=0)
+        plt.colorbar(surf, shrink=0.8, aspect=10)  #カラーバー
+
+        #更に体裁を整える
+        plt.legend(loc='best')  #凡例(グラフラベル)を表示
+
+        if(show_text==True):
+            nod_pos_tri = self.mesh.nod_pos_tri  #Local節点座標
+            for n in range(len(nod_pos_glo)):  #節点番号
+                ax.text(nod_pos_glo[n,0],nod_pos_glo[n,1],unknown_vec_u[n], 'n%d' %n, ha='center',va='bottom', color='#000000')
+            for e in range(len(nod_pos_tri)):  #三角形要素番号
+                meanX = (nod_pos_tri[e,0,0] +nod_pos_tri[e,1,0] +nod_pos_tri[e,2,0])/3.0
+                meanY = (nod_pos_tri[e,0,1] +nod_pos_tri[e,1,1] +nod_pos_tri[e,2,1])/3.0
+                meanU = (unknown_vec_u[self.mesh.nod_num_tri[e,0]] +unknown_vec_u[self.mesh.nod_num_tri[e,1]] +unknown_vec_u[self.mesh.nod_num_tri[e,2]])/3.0
+                ax.text(meanX, meanY, meanU, 'e%d' %e, ha='center', color='#000000')
+
+        #グラフを表示
+        if(out_type=='show'):
+            plt.show()
+        elif(out_type=='save'):
+            plt.savefig("fem2d_poisson.png")
+        plt.close()  #作成した図のウィンドウを消す
 
 
 #メイン実行部
@@ -329,6 +1354,7 @@ if __name__ == '__main__':
     y_min = -1.0  #計算領域のYの最小値
     y_max = 1.0  #計算領域のYの最大値
     func_f = 1.0  #定数関数f
+    #func_f = np.array([1.0, 2.0, -1.0])  #複数の荷重ケースをまとめて解く場合は配列で指定(境界の値も配列にできる)
 
     #左部(x=x_min)、右部(x=x_max)、下部(y=y_min)、上部(y=y_max)の、境界の種類と値
     #境界の種類はDirichlet,Neumann
@@ -337,44 +1363,96 @@ if __name__ == '__main__':
     BC_bottom = ['Neumann', 0.0]
     BC_top = ['Neumann', 0.0]
 
-    #節点の生成方法。lattice,random
+    #節点の生成方法。lattice,random,store
     node_type = ['lattice', 10]  #数字は格子分割におけるx・y方向の節点数
     #node_type = ['random', 50]  #数字はランダム分割における節点数
+    #node_type = ['store', 'mesh_store']  #文字列はsave_storeで保存したディレクトリ(同じメッシュを読み込む)
     matrix_type = 'sparse'  #全体行列の形式。basic,sparse
-
-    #節点データ生成。Global節点座標、三角形要素の節点番号、境界線分要素の節点番号
-    nod_pos_glo, nod_num_tri, nod_num_seg = generate_nodes(node_type)
-
-    #Local節点座標を作成。三角形要素のLocal節点座標、境界線分要素のLocal節点座標
-    nod_pos_tri, nod_pos_seg = make_mesh_data()
+    log_level = LOG_SUMMARY  #診断出力のレベル。LOG_SILENT,LOG_SUMMARY,LOG_DEBUG
+    telemetry_enabled = False  #処理段階ごとの計測(時間、メモリ、統計量)の有無
+    telemetry_file = 'telemetry.json'  #計測結果の出力先(JSON)
+    store_dir = None  #メッシュと計算結果の保存先のディレクトリ。Noneなら保存しない
+    reorder_type = None  #節点の並べ替え。None,rcm(逆Cuthill-McKee法),hilbert(ヒルベルト曲線)
+    assembly_workers = 1  #要素行列の計算と全体行列の組み立てに使うスレッド数。結果はスレッド数によらず同じ
+    probe_points = None  #解を補間して求める点の座標[点の数,2]。Noneなら求めない
+    #probe_points = np.array([[0.0, 0.0], [0.5, 0.25], [2.0, 0.0]])  #メッシュの外の点はNaNになる
+    adaptive_type = None  #誤差指標による適応的な細分化。Noneなら行わない
+    #adaptive_type = [0.05, 20000]  #相対誤差の推定値の許容値と、節点数の上限
+
+    #sparseの場合の連立方程式の解法。direct,cg
+    solver_type = ['direct']  #直接法
+    #solver_type = ['cg', 'amg', 1.0e-10]  #CG法。前処理(none,jacobi,ic,amg,gmg)と、収束判定の相対残差
+    #solver_type = ['mg', 'fmg', 1.0e-10]  #幾何マルチグリッド法(格子点配置のみ)。サイクル(v,fmg)と、収束判定の相対残差
+
+    #問題を作成。計算条件は属性として保持する
+    problem = Poisson2D(x_min, x_max, y_min, y_max, func_f, BC_left, BC_right, BC_bottom, BC_top, matrix_type, solver_type, reorder_type, assembly_workers)
+
+    #節点データ生成。Global節点座標、三角形要素の節点番号、境界線分要素の節点番号を持つメッシュ
+    mesh = problem.generate_nodes(node_type)
+
+    #節点の並べ替え。帯幅を小さくし、近くの節点を近い番号にする。並べ替えた場合は、以降は新しい節点番号のメッシュで計算する
+    if(reorder_type is not None):
+        mesh = problem.reorder_nodes(mesh, reorder_type)
+    nod_pos_glo = mesh.nod_pos_glo
+
+    #境界線分要素の長さを求めて、メッシュに保持する(面積と形状関数の係数は要素行列の構築時に求めて保持する)
+    problem.make_mesh_data(mesh)
+
+    #全体行列の組み立て計画。メッシュが保持し、同じメッシュで何度も組み立てる場合は使い回す
+    assembly_plan = mesh.assembly_plan
 
     #メッシュを表示(ポストプロセス)。番号などの有無(True,False)、グラフの表示方法(show,save)
-    visualize_mesh(nod_pos_glo, show_text=True, out_type='show')
+    problem.visualize_mesh(nod_pos_glo, show_text=True, out_type='show')
 
 
     ##### メインプロセス #####
     #計算の開始時刻を記録
-    print ("Calculation start: ", time.ctime())  #計算開始時刻を表示
+    log_print(LOG_SUMMARY, "Calculation start: ", time.ctime())  #計算開始時刻を表示
     compute_time = time.time()  #計算の開始時刻
 
     #要素行列の構築
-    mat_A_ele, vec_b_ele, area_tri = assemble_element_matrix(nod_num_tri, nod_pos_tri)
+    mat_A_ele, vec_b_ele, area_tri = problem.assemble_element_matrix(mesh)
 
     #全体行列の構築
-    mat_A_glo, vec_b_glo = assemble_global_matrix(matrix_type)
+    mat_A_glo, vec_b_glo = problem.assemble_global_matrix(matrix_type, assembly_plan)
 
     #境界要素の情報を設定
-    BC_type, BC_value, leng_seg = make_boundary_info(nod_pos_seg)
+    BC_tag, BC_type, BC_value, leng_seg = problem.make_boundary_info(mesh)
 
     #境界条件を実装
-    mat_A_glo, vec_b_glo = set_boundary_condition(mat_A_glo, vec_b_glo, BC_type, BC_value, leng_seg)
+    mat_A_glo, vec_b_glo = problem.set_boundary_condition(mat_A_glo, vec_b_glo, BC_tag, BC_type, BC_value, leng_seg)
 
     #連立方程式を解く
-    unknown_vec_u = solve_simultaneous_equations(mat_A_glo, vec_b_glo)
+    unknown_vec_u = problem.solve_simultaneous_equations(mat_A_glo, vec_b_glo)
+
+    #誤差の大きい要素を細分化しながら解き直す。以降は細分化したメッシュの解を使う(保存する行列も細分化したメッシュで作り直す)
+    if(adaptive_type is not None):
+        unknown_vec_u, adaptive_history = problem.solve_adaptive(None, adaptive_type[0], adaptive_type[1])
+        mesh = problem.mesh
+        nod_pos_glo = mesh.nod_pos_glo
+        if(store_dir is not None):
+            BC_tag, BC_type, BC_value, leng_seg = problem.make_boundary_info(mesh)
+            mat_A_glo, vec_b_glo = problem.assemble_global_matrix(matrix_type)
+            mat_A_glo, vec_b_glo = problem.set_boundary_condition(mat_A_glo, vec_b_glo, BC_tag, BC_type, BC_value, leng_seg)
 
     #計算時間の表示
     compute_time = time.time() -compute_time
-    print ("Calculation time: {:0.5f}[sec]".format(compute_time))
+    log_print(LOG_SUMMARY, "Calculation time: {:0.5f}[sec]".format(compute_time))
+
+    #任意の点での解と勾配(プローブ)
+    if(probe_points is not None):
+        probe_u, probe_grad = probe_solution(mesh, unknown_vec_u, probe_points, gradient=True)
+        log_array(LOG_SUMMARY, 'Probe U =', probe_u)
+        log_array(LOG_SUMMARY, 'Probe grad U =', probe_grad)
+
+    #メッシュと計算結果を保存する。次回はnode_type = ['store', store_dir]で同じメッシュを使える
+    if(store_dir is not None):
+        save_store(store_dir, mesh, BC_tag=BC_tag, BC_type=BC_type, BC_value=BC_value, mat_A_glo=mat_A_glo, vec_b_glo=vec_b_glo, unknown_vec_u=unknown_vec_u)
+
+    #処理段階ごとの計測結果をJSONで書き出す
+    if(telemetry_enabled):
+        write_telemetry(telemetry_file, script='fem2d_poisson', node_type=node_type, matrix_type=matrix_type, compute_time=compute_time)
 
     #計算結果を表示(ポストプロセス)。番号などの有無(True,False)、グラフの表示方法(show,save)
-    visualize_result(nod_pos_glo, unknown_vec_u, show_text=False, out_type='show')
+    #荷重ケースが複数の場合は、最初のケースを表示する
+    problem.visualize_result(nod_pos_glo, unknown_vec_u.reshape(len(nod_pos_glo),-1)[:,0], show_text=False, out_type='show')